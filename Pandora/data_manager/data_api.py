@@ -1,22 +1,61 @@
 # -*- coding:utf-8 -*-
 import datetime as dt
 from datetime import date
-from typing import Union, Sequence, Tuple, List
+from typing import Union, Sequence, Tuple, List, Iterator
 
+import numpy as np
 import pandas as pd
 from dateutil import parser
 
 from Pandora.constant import DbConn, DbName, Frequency, EdbType, Method, Label, Sample, SYMBOL_MAP, COM_EXCHANGE, \
     FIN_EXCHANGE, Interval, SymbolSuffix, Product
 from Pandora.helper.string import Strs, Symbol
-from Pandora.helper.date import Dates, DateFmt
+from Pandora.helper.date import Dates, DateFmt, TDays
 from Pandora.helper.database import DbManager, WindDbManager, DolphinDbManager
+from Pandora.data_manager.quote_cache import QuoteCache
+from Pandora.data_manager.trade_session import TradeSessionCache
 from Pandora.research import CODES_EQUITY_INDEX, CODES_TREASURY
 
 
 class FutureDataAPI:
-    def __init__(self, real_trade=False):
+    fields_bar = ['open_price', 'high_price', 'low_price', 'close_price', 'volume', 'turnover', 'open_interest']
+    fields_tick = ['last_price', 'volume', 'turnover', 'open_interest', 'bid_price_1', 'ask_price_1', 'bid_volume_1',
+                   'ask_volume_1']
+
+    # FutureInfo_TradeTime 最早记录之前的连续竞价时段: 品种 -> [(生效时间, 时段), ...]
+    legacy_trade_sessions = {
+        **{code: [
+            (pd.Timestamp.min, [(dt.time(9, 15), dt.time(11, 30)), (dt.time(13), dt.time(15, 15))]),
+            (pd.Timestamp(2020, 7, 20), [(dt.time(9, 30), dt.time(11, 30)), (dt.time(13), dt.time(15, 15))]),
+        ] for code in CODES_TREASURY},
+        **{code: [
+            (pd.Timestamp.min, [(dt.time(9, 15), dt.time(11, 30)), (dt.time(13), dt.time(15, 15))]),
+            (pd.Timestamp(2016, 1, 1), [(dt.time(9, 30), dt.time(11, 30)), (dt.time(13), dt.time(15))]),
+        ] for code in CODES_EQUITY_INDEX},
+    }
+
+    # tick 并发查询时单段的最大行数
+    tick_chunk_rows = 2_000_000
+
+    # server_bars 开启时, 在DolphinDB中由 value 频率的bar降采样得到的频率
+    server_bar_intervals = {Interval.MINUTE_15: Interval.MINUTE_1}
+
+    def __init__(self, real_trade=False, cache: Union[bool, QuoteCache] = False, server_bars=False):
+        """
+        :param real_trade: 是否连接实盘库
+        :param cache: 行情本地缓存, 默认关闭. True 使用默认目录, 也可以传入自定义目录的 QuoteCache
+        :param server_bars: 是否由DolphinDB将 1 分钟bar降采样为 server_bar_intervals 中的频率, 默认关闭, 读取库中的bar
+        """
         self.real_trade = real_trade
+        self.server_bars = server_bars
+
+        if isinstance(cache, QuoteCache):
+            self.cache = cache
+
+        else:
+            self.cache = QuoteCache() if cache else None
+
+        self.sessions = TradeSessionCache()
 
         self.mssql_65 = self.mssql_165 = DbManager(DbConn.MSSQL_165)
         # self.mssql_165 = DbManager(DbConn.MSSQL_165)
@@ -559,8 +598,6 @@ class FutureDataAPI:
     ) -> pd.DataFrame:
         tab_name = self.dolphindb.get_table_name('bar', product)
 
-        cond_str = FutureDataAPI.pair_equals("symbol", codes)
-
         if isinstance(begin_date, str):
             begin_date = parser.parse(timestr=begin_date, fuzzy=True)
 
@@ -586,17 +623,45 @@ class FutureDataAPI:
             fields = [Strs.camel_to_snake(i) for i in fields]
 
         else:
-            fields = ['open_price', 'high_price', 'low_price', 'close_price', 'volume', 'turnover', 'open_interest']
+            fields = self.fields_bar
+
+        # 缓存中保存全部默认字段, 取子集时直接从缓存中截取
+        if self.cache is not None and codes and set(fields) <= set(self.fields_bar):
+            def fetch(symbols, start, end):
+                return self.query_bar(tab_name, symbols, interval, start, end, self.fields_bar)
+
+            df_quote = self.cache.load(tab_name, interval.value, codes, begin_date, end_date, fetch)
 
-        fields = "datetime,symbol," + ','.join(fields)
+            return df_quote.reindex(columns=['datetime', 'symbol'] + fields)
+
+        return self.query_bar(tab_name, codes, interval, begin_date, end_date, fields)
+
+    def query_bar(self, tab_name: str, codes, interval: Interval, begin_date, end_date, fields: List[str]):
+        """读取bar, 开启 server_bars 时 server_bar_intervals 中的频率在DolphinDB中由更高频的bar降采样"""
+        if isinstance(codes, str):
+            codes = codes.split(",")
+
+        source = self.server_bar_intervals.get(interval) if self.server_bars else None
+        if source is not None:
+            df_quote = self.dolphindb.query_bar(
+                tab_name,
+                fields=fields,
+                interval=f"{Interval.to_window(interval)}m",
+                source_interval=source,
+                symbols=codes,
+                start=begin_date,
+                end=end_date
+            )
+
+            return df_quote.reindex(columns=['datetime', 'symbol'] + list(fields))
 
         df_quote = self.dolphindb.query(
             tab_name,
-            fields=fields,
+            fields=["datetime", "symbol"] + list(fields),
             interval=interval,
             start=begin_date,
             end=end_date,
-            where=cond_str
+            symbol=codes
         )
 
         return df_quote
@@ -708,13 +773,9 @@ class FutureDataAPI:
             fields = [Strs.camel_to_snake(i) for i in fields]
 
         else:
-            fields = ['last_price', 'volume', 'turnover', 'open_interest', 'bid_price_1', 'ask_price_1', 'bid_volume_1', 'ask_volume_1']
-
-        n_fields = len(fields) + 2
-        fields = "datetime,symbol," + ','.join(fields)
+            fields = self.fields_tick
 
         tab_name = self.dolphindb.get_table_name('tick', product)
-        cond_str = FutureDataAPI.pair_equals("symbol", codes)
 
         if isinstance(begin_date, str):
             begin_date = parser.parse(timestr=begin_date, fuzzy=True)
@@ -722,33 +783,15 @@ class FutureDataAPI:
         if isinstance(end_date, str):
             end_date = parser.parse(timestr=end_date, fuzzy=True)
 
-        if isinstance(codes, str):
-            code_count = 1
-
-        else:
-            code_count = len(codes)
-
-        ret = []
-
-        oom_thres = 365 * 5 * (4 + 2)
-        start_date = begin_date
-        while start_date <= end_date:
-            end_date_tmp = min(
-                start_date + dt.timedelta(days=oom_thres // code_count // n_fields),
-                end_date
-            )
+        if self.cache is not None and codes and set(fields) <= set(self.fields_tick):
+            def fetch(symbols, start, end):
+                return self.query_tick(tab_name, symbols, start, end, self.fields_tick)
 
-            ret.append(self.dolphindb.query(
-                tab_name,
-                fields=fields,
-                start=start_date,
-                end=end_date_tmp,
-                where=cond_str
-            ))
+            ret = self.cache.load(tab_name, Interval.TICK.value, codes, begin_date, end_date, fetch)
+            ret = ret.reindex(columns=['datetime', 'symbol'] + fields)
 
-            start_date = end_date_tmp + dt.timedelta(milliseconds=1)
-
-        ret = pd.concat(ret).reset_index(drop=True)
+        else:
+            ret = self.query_tick(tab_name, codes, begin_date, end_date, fields)
 
         if filter_time:
             ret = self.filtering_time(ret)
@@ -756,106 +799,142 @@ class FutureDataAPI:
         if clean:
             df_quote = []
 
+            # 所有品种的交易时段只查询一次
+            product_ids = {Symbol.get_contract(symbol, upper=True) for symbol in ret['symbol'].unique()}
+            self.prefetch_trade_sessions(product_ids, begin_date, end_date)
+
             for symbol, group in ret.groupby('symbol'):
+                df_quote.extend(self.clean_symbol_tick(symbol, group, begin_date, end_date, filter_out_auction))
 
-                product_id = Symbol.get_contract(symbol, upper=True)
-                if product_id in CODES_EQUITY_INDEX:
-                    cleaned = self.clean_equity_index_tick(group, filter_out_auction)
-                    df_quote.extend(cleaned)
+            ret = pd.concat(df_quote) if df_quote else ret.iloc[:0]
 
-                elif product_id in CODES_TREASURY:
-                    cleaned = self.clean_treasury_tick(group, filter_out_auction)
-                    df_quote.extend(cleaned)
+        return ret
 
-                else:
-                    trade_sessions, _ = self.get_trade_sessions(product_id, begin_date, end_date)
-                    cleaned = self.clean_tick(
-                        group,
-                        trade_sessions,
-                        filter_out_auction=filter_out_auction
-                    )
-                    df_quote.append(cleaned)
+    def iter_ticks(
+            self,
+            codes: Union[str, Sequence[str]],
+            begin_date: Union[str, date],
+            end_date: Union[str, date],
+            product: Product = Product.FUTURES,
+            filter_time=True,
+            fields: Union[str, Sequence[str]] = None,
+            clean=True,
+            filter_out_auction=False,
+            batch_days=20,
+    ) -> Iterator[pd.DataFrame]:
+        """
+            逐symbol, 逐交易日返回tick, 每次只在内存中保留单个symbol batch_days 个交易日的数据.
+            交易日划分与 TDays.wrap_tdays 一致: 16点之后的夜盘归属下一交易日
+
+        :param codes: 合约代码, 以逗号分割的字符串或集合
+        :param begin_date: 开始交易日
+        :param end_date: 结束交易日
+        :param batch_days: 单次查询的交易日数
+        :return: 与 get_tick 相同列的 DataFrame, 每个只包含一个symbol的一个交易日
+        """
+        if isinstance(codes, str):
+            codes = codes.split(",")
+
+        tdays = [pd.Timestamp(d) for d in TDays.period(begin_date, end_date, fmt=None)]
+        if not tdays:
+            return
+
+        # 交易日 d 的数据范围为 (上一交易日16点, d日16点]
+        cutoff = pd.Timedelta(hours=16)
+        bounds = [pd.Timestamp(TDays.add(tdays[0], -1, fmt=None)) + cutoff] + [d + cutoff for d in tdays]
+
+        for symbol in codes:
+            for i in range(0, len(tdays), batch_days):
+                batch_bounds = bounds[i: i + batch_days + 1]
+
+                data = self.get_tick(
+                    symbol,
+                    (batch_bounds[0] + pd.Timedelta(milliseconds=1)).to_pydatetime(),
+                    batch_bounds[-1].to_pydatetime(),
+                    product=product,
+                    filter_time=filter_time,
+                    fields=fields,
+                    clean=clean,
+                    filter_out_auction=filter_out_auction
+                )
 
-            ret = pd.concat(df_quote)
+                if data.empty:
+                    continue
 
-        return ret
+                data = data.sort_values('datetime', kind='stable')
+                pos = np.searchsorted(data['datetime'].to_numpy(), np.asarray(batch_bounds, dtype='datetime64[ns]'), side='right')
 
-    def get_trade_sessions(self, product_id: str, min_date, end_date):
-        info = self.get_future_tradetime(product_id, min_date, end_date)
-        loc = info['TradeDate'] == info['TradeDate'].max()
-        info = info[loc]
+                for start, end in zip(pos[:-1], pos[1:]):
+                    if end > start:
+                        yield data.iloc[start: end]
 
-        loc = info['Type'].str.contains("连续竞价")
-        trade_session = info[loc]
-        trade_session = list(zip(trade_session['StartTime'], trade_session['EndTime']))
+    def query_tick(self, tab_name: str, codes, begin_date: dt.datetime, end_date: dt.datetime, fields: List[str]):
+        """从DolphinDB读取tick, 按实测行数分段并发查询"""
+        if isinstance(codes, str):
+            codes = codes.split(",")
 
-        loc = info['Type'].str.contains("集合竞价")
-        auction_session = info[loc]
-        auction_session = list(zip(auction_session['StartTime'], auction_session['EndTime']))
+        return self.dolphindb.query_parallel(
+            tab_name,
+            fields=["datetime", "symbol"] + list(fields),
+            symbols=codes,
+            start=begin_date,
+            end=end_date,
+            chunk_rows=self.tick_chunk_rows
+        )
 
-        return trade_session, auction_session
+    def clean_symbol_tick(self, symbol, group, begin_date, end_date, filter_out_auction) -> List[pd.DataFrame]:
+        """
+            按交易时段版本切分后清洗, 时段变更前后的tick分别使用当时的交易时段.
+            早于 FutureInfo_TradeTime 最早记录的tick使用 legacy_trade_sessions, 没有时段时抛出 ValueError
+        """
+        product_id = Symbol.get_contract(symbol, upper=True)
+        self.prefetch_trade_sessions([product_id], begin_date, end_date)
 
-    def clean_treasury_tick(self, group, filter_out_auction):
         df_quote = []
-        loc = group['datetime'] < dt.datetime(2020, 7, 20)
-        if loc.any():
-            tmp = group[loc]
-            cleaned = self.clean_tick(
-                tmp,
-                [
-                    (dt.time(9, 15), dt.time(11, 30)),
-                    (dt.time(13), dt.time(15, 15)),
-                ],
-                filter_out_auction=filter_out_auction
-            )
+        for pos, version in self.sessions.split(product_id, group['datetime']):
+            if version is not None:
+                parts = [(group.iloc[pos], list(version.trade_sessions))]
 
-            df_quote.append(cleaned)
-
-        if (~loc).any():
-            tmp = group[~loc]
-            cleaned = self.clean_tick(
-                tmp,
-                [
-                    (dt.time(9, 30), dt.time(11, 30)),
-                    (dt.time(13), dt.time(15, 15)),
-                ],
-                filter_out_auction=filter_out_auction
-            )
+            else:
+                parts = self.split_legacy_sessions(product_id, group.iloc[pos])
 
-            df_quote.append(cleaned)
+            for data, trade_sessions in parts:
+                cleaned = self.clean_tick(
+                    data,
+                    trade_sessions,
+                    filter_out_auction=filter_out_auction
+                )
+                df_quote.append(cleaned)
 
         return df_quote
 
-    def clean_equity_index_tick(self, group, filter_out_auction):
-        df_quote = []
-        loc = group['datetime'] < dt.datetime(2016, 1, 1)
-        if loc.any():
-            tmp = group[loc]
-            cleaned = self.clean_tick(
-                tmp,
-                [
-                    (dt.time(9, 15), dt.time(11, 30)),
-                    (dt.time(13), dt.time(15, 15)),
-                ],
-                filter_out_auction=filter_out_auction
-            )
+    def split_legacy_sessions(self, product_id: str, data: pd.DataFrame) -> List[Tuple[pd.DataFrame, list]]:
+        """按 legacy_trade_sessions 的生效时间切分没有交易时段记录的tick"""
+        if product_id not in self.legacy_trade_sessions:
+            raise ValueError(f"{product_id} has no trade sessions before {data['datetime'].max()}")
 
-            df_quote.append(cleaned)
-
-        if (~loc).any():
-            tmp = group[~loc]
-            cleaned = self.clean_tick(
-                tmp,
-                [
-                    (dt.time(9, 30), dt.time(11, 30)),
-                    (dt.time(13), dt.time(15)),
-                ],
-                filter_out_auction=filter_out_auction
-            )
+        starts, sessions = zip(*self.legacy_trade_sessions[product_id])
+        idx = np.searchsorted(np.array(starts[1:], dtype='datetime64[ns]'),
+                              data['datetime'].to_numpy(dtype='datetime64[ns]'), side='right')
 
-            df_quote.append(cleaned)
+        return [(data.iloc[np.flatnonzero(idx == i)], sessions[i]) for i in np.unique(idx)]
 
-        return df_quote
+    def prefetch_trade_sessions(self, product_ids: Sequence[str], begin_date, end_date) -> int:
+        """一次性缓存多个品种的交易时段, 夜盘归属下一交易日, 结束日期向后多取一周"""
+        begin_date = pd.Timestamp(begin_date).date()
+        end_date = (pd.Timestamp(end_date) + pd.Timedelta(days=7)).date()
+
+        return self.sessions.prefetch(product_ids, begin_date, end_date, self.get_future_tradetime)
+
+    def get_trade_sessions(self, product_id: str, min_date, end_date):
+        self.prefetch_trade_sessions([product_id], min_date, end_date)
+
+        trade_sessions, auction_sessions = self.sessions.get_sessions(product_id, end_date)
+        if not trade_sessions and product_id in self.legacy_trade_sessions:
+            end_date = pd.Timestamp(end_date)
+            trade_sessions = [sessions for start, sessions in self.legacy_trade_sessions[product_id] if start <= end_date][-1]
+
+        return trade_sessions, auction_sessions
 
     @staticmethod
     def clean_tick(
@@ -863,36 +942,83 @@ class FutureDataAPI:
             trade_sessions,
             filter_out_auction=False,
     ):
+        """
+            按交易时段清洗tick: 集合竞价(开盘前5分钟)的tick移到开盘后1微秒, 删除时段外的数据.
+            时间戳只转换一次为当日内偏移, 再通过一次二分查找归入预先切分好的时段区间
+
+        :param data: tick, 需包含datetime列
+        :param trade_sessions: 连续竞价时段 [(start, end), ...], start > end 表示跨零点的夜盘
+        :param filter_out_auction: True时不保留集合竞价的tick
+        """
         ret = data.copy()
-        ret['date'] = ret['datetime'].dt.normalize()
+
+        ts = ret['datetime'].to_numpy(dtype='datetime64[ns]').view('i8')
+        offset = ts % pd.Timedelta(days=1).value
+        date = ts - offset
+        ret['date'] = date.view('datetime64[ns]')
+
+        if not trade_sessions:
+            return ret.iloc[:0]
+
+        bounds, auction_to, in_session = FutureDataAPI.get_session_segments(trade_sessions)
 
         # 1. modify auction timestamp
         if not filter_out_auction:
-            for start, _ in trade_sessions:
-                start_delta = Dates.time_to_timedelta(start)
+            target = auction_to[np.searchsorted(bounds, offset, side='right') - 1]
+            loc = target >= 0
 
-                auction_start = ret['date'] + pd.Timedelta(start_delta - dt.timedelta(minutes=5))
-                auction_end = ret['date'] + pd.Timedelta(start_delta)
-                time_modified = ret['date'] + pd.Timedelta(start_delta + dt.timedelta(microseconds=1))
-
-                loc = (ret['datetime'] > auction_start) & (ret['datetime'] <= auction_end)
-                ret.loc[loc, 'datetime'] = time_modified[loc]
+            if loc.any():
+                offset = np.where(loc, target, offset)
+                ret['datetime'] = (date + offset).view('datetime64[ns]')
 
         # 2. filter_out unnecessary data
-        loc_in = pd.Series(False, index=ret.index)
+        loc_in = in_session[np.searchsorted(bounds, offset, side='right') - 1]
+
+        return ret[loc_in]
+
+    @staticmethod
+    def get_session_segments(trade_sessions):
+        """
+            将一天切分为若干半开区间 [bounds[i], bounds[i+1]), 每段标记集合竞价修正后的偏移与是否在交易时段内.
+            集合竞价窗口为 (start - 5min, start], 交易时段为 [start, end + 1min], 均为闭区间
+
+        :return: bounds(ns), auction_to(ns, -1表示不修正), in_session(bool)
+        """
+        day = pd.Timedelta(days=1).value
+        auction_len = pd.Timedelta(minutes=5).value
+        auction_shift = pd.Timedelta(microseconds=1).value
+        end_delay = pd.Timedelta(minutes=1).value
+
+        auctions, sessions = [], []
         for start, end in trade_sessions:
-            filter_start = ret['date'] + pd.Timedelta(Dates.time_to_timedelta(start))
-            filter_end = ret['date'] + pd.Timedelta(Dates.time_to_timedelta(end) + dt.timedelta(minutes=1))
+            start = pd.Timedelta(Dates.time_to_timedelta(start)).value
+            end = pd.Timedelta(Dates.time_to_timedelta(end)).value + end_delay
 
-            if start < end:
-                loc_in |= ((ret['datetime'] >= filter_start) & (ret['datetime'] <= filter_end))
+            auctions.append((start - auction_len + 1, start + 1, start + auction_shift))
+            if start < end - end_delay:
+                sessions.append((start, end + 1))
 
             else:
-                loc_in |= ((ret['datetime'] >= filter_start) | (ret['datetime'] <= filter_end))
+                sessions.extend([(start, day), (0, end + 1)])
 
-        ret = ret[loc_in]
+        points = {0}
+        for lo, hi, _ in auctions:
+            points.update((max(lo, 0), hi))
+        for lo, hi in sessions:
+            points.update((lo, hi))
 
-        return ret
+        bounds = np.array(sorted(points), dtype='i8')
+
+        auction_to = np.full(len(bounds), -1, dtype='i8')
+        for lo, hi, to in auctions:
+            # 与逐时段覆盖的顺序一致, 命中多个时段时取最后一个
+            auction_to[(bounds >= lo) & (bounds < hi)] = to
+
+        in_session = np.zeros(len(bounds), dtype=bool)
+        for lo, hi in sessions:
+            in_session[(bounds >= lo) & (bounds < hi)] = True
+
+        return bounds, auction_to, in_session
 
     def get_future_quote_mssql(
             self,
@@ -0,0 +1,324 @@
+# -*- coding:utf-8 -*-
+import datetime as dt
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import pandas as pd
+
+from Pandora.helper.config import Envs
+from Pandora.helper.date import Dates
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+DayRange = Tuple[pd.Timestamp, pd.Timestamp]
+
+
+@dataclass
+class CacheStats:
+    """缓存命中统计, 以 symbol * 自然日 为计数单位"""
+    hits: int = 0
+    misses: int = 0
+    fetches: int = 0
+    rows_fetched: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def reset(self):
+        self.hits = self.misses = self.fetches = self.rows_fetched = 0
+
+
+class QuoteCache:
+    """
+        DolphinDB 行情的本地列式(parquet)缓存, 目录结构:
+            {root}/{table}/{interval}/{symbol}/{partition}.parquet
+            {root}/{table}/{interval}/{symbol}/_coverage.json
+
+        tick 按自然日分区, bar 按月分区(控制文件数量). _coverage.json 记录已经从远端取过的日期区间,
+        区间内没有数据(节假日/未上市)同样视为已缓存, 避免重复查询.
+        当日及以后的数据仍在更新, 只透传不落盘.
+
+        所有写入都先写临时文件再 os.replace, 多个研究进程可以同时读取同一缓存目录.
+        同一 symbol 的分区合并与 _coverage.json 的更新在该 symbol 目录的文件锁(.lock)内进行,
+        多个进程补齐同一 symbol 不同日期的数据时不会互相覆盖.
+    """
+    file_coverage = "_coverage.json"
+    file_lock = ".lock"
+    col_datetime = "datetime"
+    col_symbol = "symbol"
+
+    def __init__(self, root: Union[str, os.PathLike] = None, partition: Dict[str, str] = None):
+        """
+        :param root: 缓存根目录, 默认 ~/.Pandora/Cache
+        :param partition: 表名 -> 分区频率('D' 或 'M'), 未指定的表 tick 类按日, 其余按月
+        """
+        self.root = Path(root) if root else Envs.DIR_CONF_ROOT / "Cache"
+        self.partition = partition or {}
+        self.stats = CacheStats()
+
+    def load(
+            self,
+            table: str,
+            interval: str,
+            symbols: Union[str, Sequence[str]],
+            start: dt.datetime,
+            end: dt.datetime,
+            fetch: Callable[[List[str], dt.datetime, dt.datetime], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+            读取 [start, end] 的行情, 缺失的日期区间通过 fetch 从远端补齐并写入缓存
+
+        :param table: DolphinDB 表名
+        :param interval: 频率标识, 作为目录名
+        :param symbols: 代码, 支持逗号分割字符串或集合
+        :param start: 开始时间
+        :param end: 结束时间
+        :param fetch: fetch(symbols, start, end) -> DataFrame, 必须包含 datetime 与 symbol 列
+        :return: DataFrame, 按 symbol, datetime 排序
+        """
+        symbols = self.split_symbols(symbols)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        first_day, last_day = start.normalize(), end.normalize()
+        today = pd.Timestamp(Dates.now().date())
+
+        cached_last = min(last_day, today - pd.Timedelta(days=1))
+
+        # 1. 按缺失区间分组补数, 缺失区间一致的 symbol 合并成一次查询
+        gaps_by_symbol = {}
+        for symbol in symbols:
+            covered = self.read_coverage(table, interval, symbol)
+            gaps = self.diff_ranges((first_day, cached_last), covered) if first_day <= cached_last else []
+            gaps_by_symbol[symbol] = tuple(gaps)
+
+            n_missing = sum((g[1] - g[0]).days + 1 for g in gaps)
+            n_total = max((cached_last - first_day).days + 1, 0)
+            self.stats.misses += n_missing
+            self.stats.hits += n_total - n_missing
+
+        groups = {}
+        for symbol, gaps in gaps_by_symbol.items():
+            if gaps:
+                groups.setdefault(gaps, []).append(symbol)
+
+        for gaps, group in groups.items():
+            for gap in gaps:
+                data = self._fetch(fetch, group, gap[0], gap[1] + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1))
+                self.write(table, interval, group, gap, data)
+
+        # 2. 读取缓存
+        ret = []
+        if first_day <= cached_last:
+            for symbol in symbols:
+                ret.append(self.read(table, interval, symbol, first_day, cached_last))
+
+        # 3. 当日及以后的数据直接透传
+        if last_day > cached_last:
+            live_start = max(start, cached_last + pd.Timedelta(days=1))
+            ret.append(self._fetch(fetch, symbols, live_start, end))
+
+        ret = [i for i in ret if not i.empty]
+        if not ret:
+            return pd.DataFrame({
+                self.col_datetime: pd.Series(dtype="datetime64[ns]"),
+                self.col_symbol: pd.Series(dtype=object),
+            })
+
+        ret = pd.concat(ret, ignore_index=True)
+        loc = (ret[self.col_datetime] >= start) & (ret[self.col_datetime] <= end)
+
+        return ret[loc].sort_values([self.col_symbol, self.col_datetime], kind="stable").reset_index(drop=True)
+
+    def _fetch(self, fetch, symbols, start, end) -> pd.DataFrame:
+        data = fetch(list(symbols), start.to_pydatetime(), end.to_pydatetime())
+        self.stats.fetches += 1
+        self.stats.rows_fetched += len(data)
+
+        return data
+
+    def write(self, table: str, interval: str, symbols: Sequence[str], day_range: DayRange, data: pd.DataFrame):
+        """将 day_range 内取到的数据写入分区, 并登记为已缓存"""
+        freq = self.get_partition_freq(table)
+        groups = dict(tuple(data.groupby(self.col_symbol))) if not data.empty else {}
+
+        for symbol in symbols:
+            sym_dir = self.root / table / interval / symbol
+            sym_dir.mkdir(parents=True, exist_ok=True)
+
+            with self.lock(sym_dir / self.file_lock):
+                self._write_symbol(sym_dir, freq, day_range, groups.get(symbol))
+                self.add_coverage(table, interval, symbol, day_range)
+
+    def _write_symbol(self, sym_dir: Path, freq: str, day_range: DayRange, group: pd.DataFrame = None):
+        """合并单个 symbol 的分区, 调用方须持有该 symbol 的锁"""
+        first_day, last_day = day_range
+        for period in pd.period_range(first_day, last_day, freq=freq):
+            file = sym_dir / f"{self.format_period(period)}.parquet"
+            p_start, p_end = period.start_time, period.end_time
+
+            new = None
+            if group is not None:
+                loc = (group[self.col_datetime] >= p_start) & (group[self.col_datetime] <= p_end)
+                new = group[loc]
+
+            # 月分区可能只覆盖了部分日期, 合并时替换掉本次补数的日期
+            old = None
+            if file.exists() and freq != "D":
+                old = pd.read_parquet(file)
+                old_day = old[self.col_datetime].dt.normalize()
+                old = old[(old_day < first_day) | (old_day > last_day)]
+
+            parts = [i for i in (old, new) if i is not None and not i.empty]
+            if not parts:
+                continue
+
+            merged = pd.concat(parts, ignore_index=True).sort_values(self.col_datetime, kind="stable")
+            self.atomic_write(file, lambda tmp: merged.to_parquet(tmp, index=False))
+
+    def read(self, table: str, interval: str, symbol: str, first_day: pd.Timestamp, last_day: pd.Timestamp):
+        freq = self.get_partition_freq(table)
+        sym_dir = self.root / table / interval / symbol
+
+        parts = []
+        for period in pd.period_range(first_day, last_day, freq=freq):
+            file = sym_dir / f"{self.format_period(period)}.parquet"
+            if file.exists():
+                parts.append(pd.read_parquet(file))
+
+        if not parts:
+            return pd.DataFrame()
+
+        return pd.concat(parts, ignore_index=True)
+
+    def read_coverage(self, table: str, interval: str, symbol: str) -> List[DayRange]:
+        file = self.root / table / interval / symbol / self.file_coverage
+        if not file.exists():
+            return []
+
+        with open(file, encoding="utf-8") as f:
+            ranges = json.load(f)
+
+        return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in ranges]
+
+    def add_coverage(self, table: str, interval: str, symbol: str, day_range: DayRange):
+        """登记已缓存的日期区间, 调用方须持有该 symbol 的锁"""
+        file = self.root / table / interval / symbol / self.file_coverage
+        ranges = self.merge_ranges(self.read_coverage(table, interval, symbol) + [day_range])
+        content = json.dumps([[s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")] for s, e in ranges])
+
+        def _dump(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+
+        self.atomic_write(file, _dump)
+
+    def clear(self, table: str = None, interval: str = None, symbol: str = None):
+        """删除缓存, 参数为空时删除上一级目录下的全部内容"""
+        path = self.root
+        for part in (table, interval, symbol):
+            if not part:
+                break
+            path = path / part
+
+        if path.exists():
+            shutil.rmtree(path)
+
+    def get_partition_freq(self, table: str) -> str:
+        if table in self.partition:
+            return self.partition[table]
+
+        return "D" if "tick" in table else "M"
+
+    @staticmethod
+    def format_period(period: pd.Period) -> str:
+        return period.strftime("%Y%m%d") if period.freqstr == "D" else period.strftime("%Y%m")
+
+    @staticmethod
+    @contextmanager
+    def lock(file: Path):
+        """跨进程的排他文件锁, 阻塞直到取得锁"""
+        with open(file, "a+b") as f:
+            if os.name == "nt":
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK 重试 10 秒后仍未取得锁
+                        continue
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def atomic_write(file: Path, writer: Callable[[Path], None]):
+        tmp = file.with_name(f".{file.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            writer(tmp)
+            os.replace(tmp, file)
+
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    @staticmethod
+    def split_symbols(symbols: Union[str, Sequence[str]]) -> List[str]:
+        if isinstance(symbols, str):
+            symbols = symbols.split(",")
+
+        return list(dict.fromkeys(s.strip() for s in symbols if s and s.strip()))
+
+    @staticmethod
+    def merge_ranges(ranges: List[DayRange]) -> List[DayRange]:
+        """合并重叠或相邻的日期区间"""
+        merged = []
+        for s, e in sorted(ranges):
+            if merged and s <= merged[-1][1] + pd.Timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+
+            else:
+                merged.append((s, e))
+
+        return merged
+
+    @staticmethod
+    def diff_ranges(target: DayRange, covered: List[DayRange]) -> List[DayRange]:
+        """target 中未被 covered 覆盖的日期区间"""
+        gaps = []
+        cursor, last = target
+        for s, e in QuoteCache.merge_ranges(covered):
+            if e < cursor:
+                continue
+
+            if s > last:
+                break
+
+            if s > cursor:
+                gaps.append((cursor, s - pd.Timedelta(days=1)))
+
+            cursor = max(cursor, e + pd.Timedelta(days=1))
+
+        if cursor <= last:
+            gaps.append((cursor, last))
+
+        return gaps
@@ -0,0 +1,251 @@
+# -*- coding:utf-8 -*-
+import datetime as dt
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from Pandora.helper.config import Envs
+from Pandora.helper.date import Dates
+from Pandora.data_manager.quote_cache import QuoteCache
+
+Session = Tuple[dt.time, dt.time]
+
+
+@dataclass
+class SessionVersion:
+    """品种在 [start, end] 交易日区间内不变的交易时段"""
+    start: pd.Timestamp
+    end: pd.Timestamp
+    trade_sessions: Tuple[Session, ...]
+    auction_sessions: Tuple[Session, ...]
+
+
+class TradeSessionCache:
+    """
+        交易时段(FutureInfo_TradeTime)的进程内 + 本地缓存, 按品种保存时段发生变化的版本:
+            {root}/trade_sessions.parquet   品种, 生效区间, 时段; type 为 coverage 的行为已经查询过的交易日区间
+            {root}/.trade_sessions.lock     跨进程写锁
+
+        时段随时间的变化(如国债 2020-07-20 开盘时间调整, 股指 2016 年收盘时间调整)都由数据给出.
+        同一目录的缓存在进程内共享, 写入时在文件锁内重新读取本地缓存后合并, 版本与查询区间写入同一个文件.
+    """
+    file_sessions = "trade_sessions.parquet"
+    file_lock = ".trade_sessions.lock"
+
+    # 16点之后的tick归属下一交易日, 与 TDays.wrap_tdays 一致
+    tday_cutoff = pd.Timedelta(hours=16)
+
+    _memory: Dict[Path, dict] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, root: Union[str, os.PathLike] = None):
+        """
+        :param root: 缓存目录, 默认 ~/.Pandora/Cache
+        """
+        self.root = Path(root) if root else Envs.DIR_CONF_ROOT / "Cache"
+
+        with self._lock:
+            if self.root not in self._memory:
+                self._memory[self.root] = self.read()
+
+        self.state = self._memory[self.root]
+
+    @property
+    def versions(self) -> Dict[str, List[SessionVersion]]:
+        return self.state["versions"]
+
+    @property
+    def coverage(self) -> Dict[str, List[Tuple[pd.Timestamp, pd.Timestamp]]]:
+        return self.state["coverage"]
+
+    def prefetch(
+            self,
+            products: Sequence[str],
+            start: dt.date,
+            end: dt.date,
+            fetch: Callable[[List[str], str, str], pd.DataFrame],
+    ) -> int:
+        """
+            补齐 products 在 [start, end] 内缺失的交易时段, 所有缺失合并为一次查询
+
+        :param products: 品种代码
+        :param start: 开始日期
+        :param end: 结束日期, 晚于当日时只缓存到当日
+        :param fetch: fetch(products, begin_date, end_date) -> FutureInfo_TradeTime 的查询结果
+        :return: 查询次数(0或1)
+        """
+        start = pd.Timestamp(start).normalize()
+        end = min(pd.Timestamp(end).normalize(), pd.Timestamp(Dates.now().date()))
+        if start > end:
+            return 0
+
+        missing, gaps = [], []
+        for product in dict.fromkeys(products):
+            gap = QuoteCache.diff_ranges((start, end), self.coverage.get(product, []))
+            if gap:
+                missing.append(product)
+                gaps.extend(gap)
+
+        if not missing:
+            return 0
+
+        first, last = min(g[0] for g in gaps), max(g[1] for g in gaps)
+        data = fetch(missing, first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d"))
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        with self._lock, QuoteCache.lock(self.root / self.file_lock):
+            # 其他进程可能已经写入了其他品种或区间, 以本地缓存为基础合并
+            state = self.read()
+            for product in set(self.versions) | set(self.coverage):
+                state["versions"][product] = self.merge_versions(
+                    state["versions"].get(product, []) + self.versions.get(product, []))
+                state["coverage"][product] = QuoteCache.merge_ranges(
+                    state["coverage"].get(product, []) + self.coverage.get(product, []))
+
+            for product in missing:
+                group = data[data['Contract'] == product] if not data.empty else data
+                state["versions"][product] = self.merge_versions(state["versions"].get(product, []) + self.compress(group))
+                state["coverage"][product] = QuoteCache.merge_ranges(state["coverage"].get(product, []) + [(first, last)])
+
+            self.write(state)
+            self.state.update(state)
+
+        return 1
+
+    def get_versions(self, product: str) -> List[SessionVersion]:
+        return self.versions.get(product, [])
+
+    def get_sessions(self, product: str, trade_date: dt.date = None) -> Tuple[List[Session], List[Session]]:
+        """交易日 trade_date 的 (连续竞价时段, 集合竞价时段), 为空时取最新版本. 早于第一个版本的交易日返回空"""
+        versions = self.get_versions(product)
+        if not versions:
+            return [], []
+
+        version = versions[-1]
+        if trade_date is not None:
+            trade_date = pd.Timestamp(trade_date).normalize()
+            if trade_date < versions[0].start:
+                return [], []
+
+            starts = [v.start for v in versions]
+            version = versions[np.searchsorted(starts, trade_date, side='right') - 1]
+
+        return list(version.trade_sessions), list(version.auction_sessions)
+
+    def split(self, product: str, datetimes: pd.Series) -> List[Tuple[np.ndarray, SessionVersion]]:
+        """
+            按时段版本切分tick, 版本的生效边界为上一版本最后一个交易日的16点.
+            第一个版本之前(前一工作日16点之前)的tick没有对应的时段, 版本为 None
+
+        :return: [(行位置, 版本), ...]
+        """
+        versions = self.get_versions(product)
+        if not versions:
+            return [(np.arange(len(datetimes)), None)] if len(datetimes) else []
+
+        first = versions[0].start - pd.offsets.BDay(1) + self.tday_cutoff
+        bounds = np.array([first] + [v.end + self.tday_cutoff for v in versions[:-1]], dtype='datetime64[ns]')
+        idx = np.searchsorted(bounds, datetimes.to_numpy(dtype='datetime64[ns]'), side='left')
+
+        return [(np.flatnonzero(idx == i), versions[i - 1] if i else None) for i in np.unique(idx)]
+
+    @staticmethod
+    def compress(data: pd.DataFrame) -> List[SessionVersion]:
+        """将逐日的交易时段压缩为时段不变的区间"""
+        if data.empty:
+            return []
+
+        data = data.assign(
+            TradeDate=pd.to_datetime(data['TradeDate']),
+            StartTime=data['StartTime'].map(TradeSessionCache.to_time),
+            EndTime=data['EndTime'].map(TradeSessionCache.to_time),
+        )
+
+        versions = []
+        for trade_date, group in data.groupby('TradeDate', sort=True):
+            group = group.sort_values('StartTime')
+            trade = group[group['Type'].str.contains("连续竞价")]
+            auction = group[group['Type'].str.contains("集合竞价")]
+
+            version = SessionVersion(
+                trade_date,
+                trade_date,
+                tuple(zip(trade['StartTime'], trade['EndTime'])),
+                tuple(zip(auction['StartTime'], auction['EndTime'])),
+            )
+
+            versions.append(version)
+
+        return TradeSessionCache.merge_versions(versions)
+
+    @staticmethod
+    def merge_versions(versions: List[SessionVersion]) -> List[SessionVersion]:
+        """合并时段相同的相邻版本"""
+        merged = []
+        for v in sorted(versions, key=lambda x: x.start):
+            last = merged[-1] if merged else None
+            if last and (last.trade_sessions, last.auction_sessions) == (v.trade_sessions, v.auction_sessions):
+                merged[-1] = SessionVersion(last.start, max(last.end, v.end), last.trade_sessions, last.auction_sessions)
+
+            else:
+                merged.append(v)
+
+        return merged
+
+    @staticmethod
+    def to_time(val) -> dt.time:
+        if isinstance(val, dt.time):
+            return val
+
+        if isinstance(val, (dt.timedelta, pd.Timedelta)):
+            return (dt.datetime.min + val).time()
+
+        return pd.Timestamp(str(val)).time()
+
+    def read(self) -> dict:
+        state = {"versions": {}, "coverage": {}}
+
+        file = self.root / self.file_sessions
+        if not file.exists():
+            return state
+
+        df = pd.read_parquet(file)
+
+        loc = df['type'] == "coverage"
+        for product, start, end in df.loc[loc, ['product', 'start', 'end']].itertuples(index=False):
+            state["coverage"].setdefault(product, []).append((start, end))
+
+        for (product, start, end), group in df[~loc].groupby(['product', 'start', 'end'], sort=True):
+            sessions = {}
+            for kind in ("trade", "auction"):
+                rows = group[group['type'] == kind]
+                sessions[kind] = tuple(zip(rows['session_start'].map(self.to_time), rows['session_end'].map(self.to_time)))
+
+            version = SessionVersion(start, end, sessions["trade"], sessions["auction"])
+            state["versions"].setdefault(product, []).append(version)
+
+        return state
+
+    def write(self, state: dict):
+        """版本与查询区间写入同一个文件, 读取时两者总是一致"""
+        rows = []
+        for product, versions in state["versions"].items():
+            for v in versions:
+                for kind, sessions in (("trade", v.trade_sessions), ("auction", v.auction_sessions)):
+                    for s, e in sessions:
+                        rows.append((product, v.start, v.end, kind, s.strftime("%H:%M:%S"), e.strftime("%H:%M:%S")))
+
+        for product, ranges in state["coverage"].items():
+            for s, e in ranges:
+                rows.append((product, s, e, "coverage", None, None))
+
+        df = pd.DataFrame(rows, columns=['product', 'start', 'end', 'type', 'session_start', 'session_end'])
+        df[['start', 'end']] = df[['start', 'end']].astype('datetime64[ns]')
+
+        QuoteCache.atomic_write(self.root / self.file_sessions, lambda tmp: df.to_parquet(tmp, index=False))
@@ -1,16 +1,24 @@
+import io
 import random
+import threading
+import time
+import uuid
 import warnings
+from concurrent.futures import as_completed
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, date
 from enum import Enum
-from typing import Union, List, Sequence, Dict
+from typing import Union, List, Sequence, Dict, Tuple
 from urllib import parse
 
 import cx_Oracle
+import numpy as np
 import pandas as pd
 import dolphindb as ddb
 
-from sqlalchemy import text, create_engine
+from sqlalchemy import text, create_engine, event, inspect
+from sqlalchemy import table as sa_table, column as sa_column, insert as sa_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import ResourceClosedError
 
 from Pandora.constant import Exchange, Interval, Product, DateFmt
@@ -29,8 +37,39 @@ class DbConfig:
     database: str
 
 
+@dataclass
+class PoolStats:
+    """连接池统计, 用于评估批处理任务下的连接池大小"""
+    checkouts: int = 0
+    checkins: int = 0
+    connects: int = 0
+    # 获取连接的累计/最大耗时(秒), 包含等待连接池与新建连接
+    wait_time: float = 0.
+    max_wait: float = 0.
+    # 同时借出的最大连接数与最大溢出数
+    peak_checkedout: int = 0
+    peak_overflow: int = 0
+
+
 class DbManager:
-    """数据库连接管理工具"""
+    """
+        数据库连接管理工具. engine 按 (conn, database) 在进程内共享, 连接池参数默认取 pool_options,
+        也可以在配置文件对应的section中通过 pool_size/max_overflow/pool_recycle/pool_pre_ping 单独指定
+    """
+    pool_options = {
+        "pool_size": 2,
+        "max_overflow": 1,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    }
+
+    # 超过该行数时upsert/insert使用批量写入, COPY 每批的行数
+    bulk_threshold = 1000
+    bulk_batch_size = 50_000
+
+    engines: Dict[Tuple[str, str], Engine] = {}
+    pool_stats: Dict[Tuple[str, str], PoolStats] = {}
+    _lock = threading.Lock()
 
     def __init__(self, conn: str, database: str = ""):
         """
@@ -41,18 +80,102 @@ class DbManager:
         if conn not in Settings:
             raise ValueError(f"database connection [{conn}] not in config file!")
 
-        self.db_engine = DbManager.step_db(conn, database)
+        self.key = (conn, database or "")
+        self.db_engine = DbManager.get_engine(conn, database)
+
+    @classmethod
+    def get_engine(cls, conn: str, database: str = "") -> Engine:
+        """获取进程内共享的engine, 不存在时创建"""
+        key = (conn, database or "")
+        engine = cls.engines.get(key)
+        if engine is None:
+            with cls._lock:
+                engine = cls.engines.get(key)
+                if engine is None:
+                    engine = cls.step_db(conn, database)
+                    cls.pool_stats[key] = cls.watch_pool(engine)
+                    cls.engines[key] = engine
+
+        return engine
+
+    @classmethod
+    def configure_pool(cls, **options):
+        """修改默认连接池参数, 只对之后新建的engine生效(可先调用dispose)"""
+        cls.pool_options = {**cls.pool_options, **options}
+
+    @classmethod
+    def dispose(cls, conn: str = None, database: str = ""):
+        """关闭并移除共享的engine, conn为空时移除全部"""
+        with cls._lock:
+            keys = [k for k in cls.engines if conn is None or k == (conn, database or "")]
+            for key in keys:
+                cls.engines.pop(key).dispose()
+                cls.pool_stats.pop(key, None)
+
+    @classmethod
+    def get_pool_stats(cls) -> pd.DataFrame:
+        """各engine连接池的统计与当前状态"""
+        rows = []
+        for key, engine in list(cls.engines.items()):
+            stats = cls.pool_stats.get(key, PoolStats())
+            pool = engine.pool
+            rows.append({
+                "conn": key[0],
+                "database": key[1],
+                **stats.__dict__,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checkedout": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            })
+
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def watch_pool(engine: Engine) -> PoolStats:
+        stats = PoolStats()
+        pool = engine.pool
+
+        def on_connect(dbapi_conn, record):
+            stats.connects += 1
+
+        def on_checkout(dbapi_conn, record, proxy):
+            stats.checkouts += 1
+            if hasattr(pool, "checkedout"):
+                stats.peak_checkedout = max(stats.peak_checkedout, pool.checkedout())
+                stats.peak_overflow = max(stats.peak_overflow, pool.overflow())
+
+        def on_checkin(dbapi_conn, record):
+            stats.checkins += 1
+
+        event.listen(engine, "connect", on_connect)
+        event.listen(engine, "checkout", on_checkout)
+        event.listen(engine, "checkin", on_checkin)
+
+        return stats
+
+    def connect(self):
+        """从连接池获取连接, 记录等待耗时"""
+        start = time.perf_counter()
+        conn = self.db_engine.connect()
+        cost = time.perf_counter() - start
+
+        stats = DbManager.pool_stats.get(self.key)
+        if stats is not None:
+            stats.wait_time += cost
+            stats.max_wait = max(stats.max_wait, cost)
+
+        return conn
 
     def query(self, sql: str) -> pd.DataFrame:
         assert sql, "query sql can't be empty!"
 
-        with self.db_engine.connect() as conn:
+        with self.connect() as conn:
             return pd.read_sql_query(text(sql), conn)
 
     def execute(self, sql: str):
         """支持单条SQL语句的执行"""
         assert sql, "execute sql can't be empty!"
-        with self.db_engine.connect() as conn:
+        with self.connect() as conn:
             with conn.begin():
                 res = conn.execute(text(sql))
                 try:
@@ -76,7 +199,7 @@ class DbManager:
         assert sql is not None, "The SQL to be executed cannot be empty!"
         params = params or ()
         sql = text(sql) if isinstance(sql, (bytes, str)) else sql
-        with self.db_engine.connect() as conn:
+        with self.connect() as conn:
             with conn.begin():
                 res = conn.execute(sql, params)
                 try:
@@ -103,7 +226,7 @@ class DbManager:
         :param columns: 指定需要保存的列名. (默认使用dataframe中的所有列)
         :param audit_columns: 审计时间字段.   目前支持: {"update":"update_time", "create":"create_time"}
                               create操作时两字段都会写入值,  update时只有update_time会被更新值
-        :return: None
+        :return: identity_columns 不为空时返回自增值, 数据量达到 bulk_threshold 时返回影响的行数, 其余为 None
         """
         if data.empty:
             warnings.warn("dataframe is emtpy, No other operations!")
@@ -137,6 +260,10 @@ class DbManager:
             else:
                 raise ValueError("[columns] Must be a column already included in the data columns!")
 
+        # 数据量较大时使用临时表批量写入, identity需要逐行返回自增值, 仍走逐行语句
+        if len(data) >= self.bulk_threshold and not identity_columns:
+            return self.bulk_upsert(table, data, on, list(columns), audit_columns)
+
         if db_type == "mssql":
             exec_sql = self.join_upsert_sql_with_mssql(table, on, columns, audit_columns, identity_columns)
         else:
@@ -146,6 +273,119 @@ class DbManager:
         data_params = data.to_dict(orient="records")
         return self.execute_many(exec_sql, *data_params)
 
+    def bulk_upsert(
+            self,
+            table: str,
+            data: pd.DataFrame,
+            on: List[str],
+            columns: List[str],
+            audit_columns: Dict[str, str] = None
+    ):
+        """
+            集合方式upsert: 数据分批写入临时表后执行一次 MERGE(mssql) 或 INSERT ... ON CONFLICT(postgres).
+            同一主键出现多次时保留最后一条, 与逐行upsert的结果一致
+
+        :return: MERGE / INSERT 影响的行数
+        """
+        data = data.drop_duplicates(subset=on, keep="last")
+        stage = f"stage_{uuid.uuid4().hex[:16]}"
+
+        with self.connect() as conn:
+            with conn.begin():
+                if self.db_engine.name == "mssql":
+                    stage = f"#{stage}"
+                    col_types = self.get_column_types(conn, table, columns)
+                    conn.execute(text(self.join_stage_sql_with_mssql(table, stage, col_types)))
+                    self.insert_values(conn, stage, data, columns)
+
+                    exec_sql = self.join_upsert_sql_with_mssql(table, on, columns, audit_columns, None, source=stage)
+
+                else:
+                    col_str = ", ".join(columns)
+                    conn.execute(text(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+                                      f"SELECT {col_str} FROM {table} WITH NO DATA"))
+                    self.copy_from(conn, stage, data, columns)
+
+                    exec_sql = self.join_upsert_sql_with_tsdb(table, on, columns, audit_columns, source=stage)
+
+                return conn.execute(text(exec_sql)).rowcount
+
+    @staticmethod
+    def get_column_types(conn, table: str, columns: List[str]) -> Dict[str, str]:
+        """目标表中各列的类型, eg: {"pnl": "DECIMAL(18, 4)"}"""
+        target = DbManager.to_table(table, columns)
+        types = {c["name"].lower(): c["type"] for c in inspect(conn).get_columns(target.name, schema=target.schema)}
+
+        col_types = {}
+        for col in columns:
+            col_type = types.get(col.strip("[]").lower())
+            if col_type is None:
+                raise ValueError(f"column [{col}] not in table [{table}]!")
+
+            col_types[col] = col_type.compile(dialect=conn.dialect)
+
+        return col_types
+
+    @staticmethod
+    def join_stage_sql_with_mssql(table: str, stage: str, col_types: Dict[str, str]) -> str:
+        """
+            按目标表的列类型创建空的临时表. 列为 CAST 表达式, 不会继承目标表的 IDENTITY 属性, 可以写入显式的主键
+        """
+        col_str = ", ".join([f"CAST({col} AS {col_type}) AS {col}" for col, col_type in col_types.items()])
+
+        return f"SELECT TOP 0 {col_str} INTO {stage} FROM {table}"
+
+    def bulk_insert(self, table: str, data: pd.DataFrame, columns: List[str]):
+        """批量insert: postgres 使用 COPY, 其余数据库分批使用多行 VALUES"""
+        with self.connect() as conn:
+            with conn.begin():
+                if self.db_engine.name == "postgresql":
+                    self.copy_from(conn, table, data, columns)
+
+                else:
+                    self.insert_values(conn, table, data, columns)
+
+    def insert_values(self, conn, table: str, data: pd.DataFrame, columns: List[str]):
+        """多行 VALUES 分批插入, 单条语句的参数个数不超过mssql的2100上限"""
+        target = self.to_table(table, columns)
+
+        rows_per_stmt = max(1, min(1000, 2000 // len(columns)))
+        records = self.to_records(data, columns)
+        for i in range(0, len(records), rows_per_stmt):
+            conn.execute(sa_insert(target).values(records[i: i + rows_per_stmt]))
+
+    @staticmethod
+    def to_table(table: str, columns: List[str]):
+        """
+            表名转为 sqlalchemy 的 table, 去掉各段的 [] 后由方言重新加引号, eg: [dbo].[Trades] -> schema=dbo, name=Trades
+        """
+        parts = [p.strip("[]") for p in table.split(".")]
+
+        return sa_table(parts[-1], *[sa_column(c) for c in columns], schema=".".join(parts[:-1]) or None)
+
+    def copy_from(self, conn, table: str, data: pd.DataFrame, columns: List[str]):
+        """postgres COPY FROM STDIN, 按bulk_batch_size分批"""
+        cursor = conn.connection.cursor()
+        col_str = ", ".join(columns)
+        copy_sql = f"COPY {table} ({col_str}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+
+        try:
+            for i in range(0, len(data), self.bulk_batch_size):
+                buffer = io.StringIO()
+                data[columns].iloc[i: i + self.bulk_batch_size].to_csv(buffer, index=False, header=False, na_rep="\\N")
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def to_records(data: pd.DataFrame, columns: List[str]) -> List[dict]:
+        """NaN/NaT 转换为 None"""
+        data = data[columns].astype(object)
+
+        return data.where(data.notna(), None).to_dict(orient="records")
+
     def insert(
             self,
             table: str,
@@ -162,7 +402,7 @@ class DbManager:
         :param columns: 指定需要保存的列名. (默认使用dataframe中的所有列)
         :param audit_columns: 审计时间字段.   目前支持: {"update":"update_time", "create":"create_time"}
                               create操作时两字段都会写入值,  update时只有update_time会被更新值
-        :return: None
+        :return: identity_columns 不为空时返回自增值, 数据量达到 bulk_threshold 时返回影响的行数, 其余为 None
         """
         if data.empty:
             warnings.warn("dataframe is emtpy, No other operations!")
@@ -179,6 +419,9 @@ class DbManager:
             else:
                 raise ValueError("[columns] Must be a column already included in the data columns!")
 
+        if len(data) >= self.bulk_threshold:
+            return self.bulk_insert(table, data, list(columns))
+
         insert_cols = ", ".join([col for col in columns])
         insert_vals = ", ".join([f":{col}" for col in columns])
 
@@ -208,11 +451,20 @@ class DbManager:
         # 构建连接串
         dsn = f"{cfg['dbtype']}+{cfg['driver']}://{cfg['user']}:{plus_pwd}@{cfg['host']}:{cfg['port']}/{dbname}"
 
-        return create_engine(dsn, pool_size=2, pool_pre_ping=True, pool_use_lifo=True, max_overflow=1, echo_pool=True)
+        # 连接池参数, 配置文件中的设置优先
+        options = dict(DbManager.pool_options)
+        for key in ("pool_size", "max_overflow", "pool_recycle"):
+            if cfg.get(key):
+                options[key] = int(cfg[key])
+
+        if cfg.get("pool_pre_ping"):
+            options["pool_pre_ping"] = cfg["pool_pre_ping"].strip().lower() in ("1", "true", "yes")
+
+        return create_engine(dsn, pool_use_lifo=True, echo_pool=True, **options)
 
     @staticmethod
-    def join_upsert_sql_with_mssql(table, on, columns, audits, identity) -> str:
-        """拼接mssql的upsert语句"""
+    def join_upsert_sql_with_mssql(table, on, columns, audits, identity, source: str = None) -> str:
+        """拼接mssql的upsert语句, source不为空时以该表(如临时表)为数据源做集合MERGE"""
         query_cols = ", ".join([f":{col} {col}" for col in columns])
         on_cols = " AND ".join([f"T.{col} = S.{col}" for col in on])
         insert_cols = ", ".join([col for col in columns])
@@ -252,18 +504,19 @@ class DbManager:
                         f"SET @{id_cols} = scope_identity(); "
                         f"SELECT @{id_cols} AS {id_cols};")
         else:
-            exec_sql = (f"MERGE INTO {table} T USING (SELECT {query_cols}) S ON {on_cols} "
+            using = source or f"(SELECT {query_cols})"
+            exec_sql = (f"MERGE INTO {table} T USING {using} S ON {on_cols} "
                         f"WHEN MATCHED THEN  UPDATE SET {update_cols} "
                         f"WHEN NOT MATCHED THEN INSERT ({insert_cols}) VALUES ({insert_vals});")
 
         return exec_sql
 
     @staticmethod
-    def join_upsert_sql_with_tsdb(table, on, columns, audits) -> str:
-        """ 拼接postgres的upsert语句 """
+    def join_upsert_sql_with_tsdb(table, on, columns, audits, source: str = None) -> str:
+        """ 拼接postgres的upsert语句, source不为空时从该表(如临时表)批量写入 """
         on_cols = ", ".join(on)
         insert_cols = ", ".join([col for col in columns])
-        insert_vals = ", ".join([f":{col}" for col in columns])
+        insert_vals = ", ".join([col if source else f":{col}" for col in columns])
 
         update_cols = ", ".join([f"{col} = EXCLUDED.{col}" for col in (set(columns) - set(on))])
         if not update_cols:
@@ -285,13 +538,171 @@ class DbManager:
                 insert_cols += f", {col_create}"
                 insert_vals += ", NOW()"
 
-        exec_sql = (f"INSERT INTO {table} ({insert_cols}) VALUES ({insert_vals}) "
+        values = f"SELECT {insert_vals} FROM {source}" if source else f"VALUES ({insert_vals})"
+        exec_sql = (f"INSERT INTO {table} ({insert_cols}) {values} "
                     f" ON CONFLICT ({on_cols}) DO UPDATE SET {update_cols};")
         return exec_sql
 
 
+class DolphinQuery:
+    """
+        DolphinDB SQL 构建器. 参数通过 literal 统一转换为DolphinDB字面量, 不再手工拼接字符串. eg:
+
+        sql = (DolphinQuery('loadTable("dfs://db", "bar_futures")')
+               .select("symbol", "datetime", "close_price")
+               .where_in("symbol", ["RB2305", "HC2305"])
+               .where_between("datetime", start, end)
+               .to_sql())
+
+        where_in/where_between 作用于分区列时生成可被分区剪枝的条件(不包裹函数, 不使用or), 并排在其余条件之前.
+    """
+
+    def __init__(self, source: str):
+        """
+        :param source: from子句, 可以是 loadTable(...) 或 session 中已加载的表变量名
+        """
+        self.source = source
+        self.fields: List[str] = []
+        self.prune_conds: List[str] = []
+        self.conds: List[str] = []
+        self.group_cols: List[str] = []
+        self.order_cols: List[str] = []
+        self.hints: List[str] = []
+        self.limit_rows: int = None
+
+    def select(self, *fields: str) -> "DolphinQuery":
+        for field in fields:
+            # 兼容 "datetime,symbol,..." 形式, 含函数调用的表达式不拆分
+            if "(" in field:
+                self.fields.append(field)
+
+            else:
+                self.fields.extend(f.strip() for f in field.split(",") if f.strip())
+
+        return self
+
+    def where(self, cond: str, **params) -> "DolphinQuery":
+        """追加原始条件, 条件中的 {name} 以 params 中对应值的字面量替换"""
+        if cond:
+            self.conds.append(cond.format(**{k: self.literal(v) for k, v in params.items()}))
+
+        return self
+
+    def where_eq(self, col: str, value) -> "DolphinQuery":
+        if isinstance(value, (list, tuple, set)):
+            return self.where_in(col, value)
+
+        self.conds.append(f"{col}={self.literal(value)}")
+
+        return self
+
+    def where_in(self, col: str, values) -> "DolphinQuery":
+        values = list(values)
+        cond = f"{col}={self.literal(values[0])}" if len(values) == 1 else f"{col} in {self.literal(values)}"
+        self.prune_conds.append(cond)
+
+        return self
+
+    def where_between(self, col: str, start=None, end=None) -> "DolphinQuery":
+        if start is not None and end is not None:
+            self.prune_conds.append(f"{col} between {self.literal(start)}:{self.literal(end)}")
+
+        elif start is not None:
+            self.prune_conds.append(f"{col}>={self.literal(start)}")
+
+        elif end is not None:
+            self.prune_conds.append(f"{col}<={self.literal(end)}")
+
+        return self
+
+    def group_by(self, *cols: str) -> "DolphinQuery":
+        self.group_cols.extend(cols)
+
+        return self
+
+    def bar(self, col: str, interval: str, alias: str = None, label_shift: str = None) -> "DolphinQuery":
+        """
+            按时间降采样, interval 为DolphinDB的duration, 如 15m. bar() 向下取整, 结果以区间起点标记
+
+        :param label_shift: 源数据以区间结束时间标记时为源数据的周期(如1分钟bar为 1m),
+            先减去该周期再取整, 结果同样以区间结束时间标记
+        """
+        expr = f"bar({col}, {interval})" if not label_shift else f"bar({col} - {label_shift}, {interval}) + {interval}"
+
+        return self.group_by(f"{expr} as {alias or col}")
+
+    def order_by(self, *cols: str) -> "DolphinQuery":
+        self.order_cols.extend(cols)
+
+        return self
+
+    def hint(self, *hints: str) -> "DolphinQuery":
+        """如 HINT_KEEPORDER, HINT_EXPLAIN"""
+        self.hints.extend(hints)
+
+        return self
+
+    def limit(self, rows: int) -> "DolphinQuery":
+        self.limit_rows = rows
+
+        return self
+
+    def to_sql(self) -> str:
+        hint = f"[{', '.join(self.hints)}] " if self.hints else ""
+        limit = f"top {self.limit_rows} " if self.limit_rows else ""
+        sql = f"select {hint}{limit}{', '.join(self.fields) or '*'} from {self.source}"
+
+        conds = self.prune_conds + self.conds
+        if conds:
+            sql += f" where {', '.join(conds)}"
+
+        if self.group_cols:
+            sql += f" group by {', '.join(self.group_cols)}"
+
+        if self.order_cols:
+            sql += f" order by {', '.join(self.order_cols)}"
+
+        return sql
+
+    @staticmethod
+    def literal(value) -> str:
+        """python值转换为DolphinDB字面量"""
+        if isinstance(value, Enum):
+            value = value.value
+
+        if isinstance(value, bool):
+            return "true" if value else "false"
+
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return repr(value.item() if isinstance(value, np.generic) else value)
+
+        if isinstance(value, datetime):
+            return value.strftime(DateFmt.dolphin_datetime.value)
+
+        if isinstance(value, date):
+            return value.strftime("%Y.%m.%d")
+
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+            return "[" + ",".join(DolphinQuery.literal(v) for v in value) + "]"
+
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+        return f'"{value}"'
+
+
 class DolphinDbManager(object):
-    def __init__(self, conn='db_dolphindb'):
+    # 服务端降采样时各字段的聚合函数
+    bar_agg = {
+        "open_price": "first",
+        "high_price": "max",
+        "low_price": "min",
+        "close_price": "last",
+        "volume": "sum",
+        "turnover": "sum",
+        "open_interest": "last",
+    }
+
+    def __init__(self, conn='db_dolphindb', pool_size=5):
         if all([not conn, conn not in Settings]):
             raise ValueError(f"database connection name [{conn}] can't find in config file!")
         else:
@@ -333,7 +744,11 @@ class DolphinDbManager(object):
         self.session: ddb.session = ddb.session(keepAliveTime=600)
         self.session.connect(self.host, self.port, self.user, self.password)
 
-        # 创建连接池（用于数据写入）
+        # 已加载的表
+        self.tables: Dict[str, ddb.Table] = {}
+
+        # 连接池（用于数据写入与并行查询）, 首次使用时创建
+        self.pool_size = pool_size
         self.pool: ddb.DBConnectionPool = None
 
     def __del__(self) -> None:
@@ -361,51 +776,223 @@ class DolphinDbManager(object):
         else:
             return self.table_name[kind]
 
-    def query(self, table, **kwargs):
-        table: ddb.Table = self.session.loadTable(tableName=table, dbPath=self.db_path)
+    def get_table(self, table) -> ddb.Table:
+        """session中已加载的表, 只加载一次"""
+        if table not in self.tables:
+            self.tables[table] = self.session.loadTable(tableName=table, dbPath=self.db_path)
+
+        return self.tables[table]
+
+    def build_query(self, table, remote=False) -> DolphinQuery:
+        """
+        :param remote: True时以 loadTable(...) 作为数据源, 用于连接池中的其他会话
+        """
+        if remote:
+            return DolphinQuery(f'loadTable("{self.db_path}", "{table}")')
+
+        return DolphinQuery(self.get_table(table).tableName())
 
+    def run_query(self, query: DolphinQuery) -> pd.DataFrame:
+        return self.session.run(query.to_sql())
+
+    def query(self, table, **kwargs):
+        query = self.build_query(table)
         fields = kwargs.pop("fields", "*")
+        query.select(*([fields] if isinstance(fields, str) else fields))
+        start, end = [pd.Timestamp(v).to_pydatetime() if isinstance(v, str) else v
+                      for v in (kwargs.pop("start", None), kwargs.pop("end", None))]
+        query.where_between("datetime", start or None, end or None)
 
-        query = table.select(fields)
         for k, v in kwargs.items():
             if not v:
                 continue
 
-            if k == "start":
-                start = v.strftime(DateFmt.dolphin_datetime.value)
-                query = query.where(f'datetime>={start}')
+            if k == "where":
+                query.where(v)
 
-            elif k == "end":
-                end = v.strftime(DateFmt.dolphin_datetime.value)
-                query = query.where(f'datetime<={end}')
+            elif isinstance(v, (list, tuple, set)):
+                query.where_in(k, v)
 
-            elif k == "where":
-                query = query.where(v)
+            else:
+                query.where_eq(k, v)
 
-            elif isinstance(v, Enum):
-                query = query.where(f'{k}="{v.value}"')
+        return self.run_query(query)
 
-            elif isinstance(v, list) or isinstance(v, tuple) or isinstance(v, set):
-                if len(v) == 1:
-                    query = query.where(f'{k}="{list(v)[0]}"')
+    def query_bar(
+            self,
+            table,
+            fields: Sequence[str],
+            interval: str,
+            source_interval: Interval = Interval.MINUTE_1,
+            symbols: Sequence[str] = None,
+            start: datetime = None,
+            end: datetime = None,
+    ) -> pd.DataFrame:
+        """
+            服务端由 source_interval 的bar降采样为 interval, 只传输降采样后的结果.
+            库中的bar以结束时间标记, 降采样后同样以区间结束时间标记(如 [9:00, 9:15) 内的1分钟bar 9:01 ~ 9:15 合并为 9:15).
+            国内期货各交易时段的起止均在整15分钟, 区间不会跨越午休、10:15 ~ 10:30 小节休息与夜盘收盘
 
-                else:
-                    query = query.where(f'{k} in {tuple(v)}')
+        :param fields: bar字段, 聚合方式见 bar_agg
+        :param interval: DolphinDB duration, 如 15m
+        :return: columns=(symbol, datetime, *fields)
+        """
+        query = self.build_query(table)
+        query.select(*[f"{self.bar_agg.get(f, 'last')}({f}) as {f}" for f in fields])
 
-            else:
-                query = query.where(f'{k}="{v}"')
+        if symbols:
+            query.where_in("symbol", symbols)
 
-        df: pd.DataFrame = query.toDF()
+        query.where_between("datetime", start, end)
+        query.where_eq("interval", source_interval)
+        query.group_by("symbol").bar("datetime", interval, label_shift=Interval(source_interval).value)
+        query.order_by("symbol", "datetime")
 
-        return df
+        return self.run_query(query)
 
-    def upsert(self, table, data, on):
+    def get_pool(self) -> ddb.DBConnectionPool:
         if self.pool is None:
-            self.pool = ddb.DBConnectionPool(self.host, self.port, 5, self.user, self.password)
+            self.pool = ddb.DBConnectionPool(self.host, self.port, self.pool_size, self.user, self.password)
+
+        return self.pool
 
-        appender: ddb.PartitionedTableAppender = ddb.PartitionedTableAppender(self.db_path, table, on, self.pool)
+    def upsert(self, table, data, on):
+        appender: ddb.PartitionedTableAppender = ddb.PartitionedTableAppender(self.db_path, table, on, self.get_pool())
         appender.append(data)
 
+    def count_daily_rows(self, table, symbols: Sequence[str] = None, start: datetime = None, end: datetime = None):
+        """服务端统计每个symbol每天的行数, 用于规划分段查询"""
+        query = self.build_query(table).select("count(*) as rows")
+        if symbols:
+            query.where_in("symbol", symbols)
+
+        query.where_between("datetime", start, end).group_by("symbol", "date(datetime) as date")
+
+        return self.run_query(query)
+
+    @staticmethod
+    def plan_chunks(counts: pd.DataFrame, chunk_rows: int) -> List[tuple]:
+        """
+            按实测的 symbol*日 行数切分查询, 每段不超过chunk_rows行(单个symbol单日超出时除外)
+
+        :param counts: count_daily_rows 的结果, columns=(symbol, date, rows)
+        :param chunk_rows: 单段最大行数
+        :return: [(symbols, first_day, last_day, rows), ...] 按日期排序
+        """
+        chunks = []
+        pending_days, pending_symbols, pending_rows = [], set(), 0
+
+        def flush():
+            if pending_days:
+                chunks.append((sorted(pending_symbols), pending_days[0], pending_days[-1], pending_rows))
+
+        for day, group in counts.groupby('date', sort=True):
+            day_rows = int(group['rows'].sum())
+
+            if day_rows > chunk_rows:
+                flush()
+                pending_days, pending_symbols, pending_rows = [], set(), 0
+
+                # 单日数据过多, 按symbol拆分
+                symbols, rows = [], 0
+                for symbol, n in zip(group['symbol'], group['rows']):
+                    if symbols and rows + n > chunk_rows:
+                        chunks.append((symbols, day, day, rows))
+                        symbols, rows = [], 0
+
+                    symbols.append(symbol)
+                    rows += int(n)
+
+                chunks.append((symbols, day, day, rows))
+                continue
+
+            if pending_rows + day_rows > chunk_rows:
+                flush()
+                pending_days, pending_symbols, pending_rows = [], set(), 0
+
+            pending_days.append(day)
+            pending_symbols |= set(group['symbol'])
+            pending_rows += day_rows
+
+        flush()
+
+        return chunks
+
+    def query_parallel(
+            self,
+            table,
+            fields: Sequence[str],
+            symbols: Sequence[str] = None,
+            start: datetime = None,
+            end: datetime = None,
+            chunk_rows: int = 2_000_000
+    ) -> pd.DataFrame:
+        """
+            按行数规划分段, 通过连接池并发查询, 结果直接写入预分配的数组, 避免大规模concat
+
+        :param table: 表名
+        :param fields: 查询字段
+        :param symbols: 代码, 为空时查询全部
+        :param start: 开始时间
+        :param end: 结束时间
+        :param chunk_rows: 单段最大行数
+        :return: DataFrame
+        """
+        counts = self.count_daily_rows(table, symbols, start, end)
+        if counts.empty:
+            return pd.DataFrame(columns=list(fields))
+
+        chunks = self.plan_chunks(counts, chunk_rows)
+
+        offsets = np.cumsum([0] + [c[3] for c in chunks])
+        total = int(offsets[-1])
+
+        pool = self.get_pool()
+        futures = {}
+        for i, (chunk_symbols, first_day, last_day, _) in enumerate(chunks):
+            chunk_start = pd.Timestamp(first_day).normalize().to_pydatetime()
+            chunk_end = (pd.Timestamp(last_day).normalize() + pd.Timedelta(days=1, milliseconds=-1)).to_pydatetime()
+            if start:
+                chunk_start = max(chunk_start, start)
+            if end:
+                chunk_end = min(chunk_end, end)
+
+            query = self.build_query(table, remote=True).select(*fields)
+            query.where_in("symbol", chunk_symbols).where_between("datetime", chunk_start, chunk_end)
+            futures[pool.runTaskAsync(query.to_sql())] = i
+
+        columns = None
+        mismatched = {}
+        for future in as_completed(futures):
+            i = futures[future]
+            df: pd.DataFrame = future.result()
+
+            if columns is None:
+                columns = {col: np.empty(total, dtype=df[col].to_numpy().dtype) for col in df.columns}
+
+            # 查询期间数据有更新时, 行数与规划不一致, 单独保留
+            if len(df) != offsets[i + 1] - offsets[i]:
+                mismatched[i] = df
+                continue
+
+            for col, arr in columns.items():
+                values = df[col].to_numpy()
+
+                # 各分段的类型可能不同(如整数列在部分分段中含空值为float), 按所有分段的公共类型提升
+                dtype = np.result_type(arr.dtype, values.dtype)
+                if dtype != arr.dtype:
+                    arr = columns[col] = arr.astype(dtype)
+
+                arr[offsets[i]: offsets[i + 1]] = values
+
+        ret = pd.DataFrame(columns, copy=False)
+        if mismatched:
+            parts = [mismatched[i] if i in mismatched else ret.iloc[offsets[i]: offsets[i + 1]]
+                     for i in range(len(chunks))]
+            ret = pd.concat(parts, ignore_index=True)
+
+        return ret
+
     def save_bar_data(self, df: pd.DataFrame, product=None):
         table_name = self.get_table_name("bar", product)
 
@@ -444,7 +1031,7 @@ class DolphinDbManager(object):
     ):
         table_name = self.get_table_name("bar", product)
 
-        table: ddb.Table = self.session.loadTable(tableName=table_name, dbPath=self.db_path)
+        table: ddb.Table = self.get_table(table_name)
 
         query = table.delete()
         if symbol:
@@ -523,7 +1110,7 @@ class DolphinDbManager(object):
     ) -> pd.DataFrame:
         table_name = self.get_table_name("contract", product)
 
-        table: ddb.Table = self.session.loadTable(tableName=table_name, dbPath=self.db_path)
+        table: ddb.Table = self.get_table(table_name)
 
         query = table.select('*')
         if symbol:
@@ -581,7 +1168,7 @@ class DolphinDbManager(object):
         else:
             raise NotImplementedError
 
-        table: ddb.Table = self.session.loadTable(tableName=table_name, dbPath=self.db_path)
+        table: ddb.Table = self.get_table(table_name)
         query = table.delete()
         if symbol:
             if isinstance(symbol, str):
@@ -1,9 +1,12 @@
 import datetime
 import datetime as dt
+import threading
+import time
 import warnings
 from enum import Enum
-from typing import Union, List
+from typing import Union, List, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 from dateutil import parser
 
@@ -64,59 +67,157 @@ class Dates:
         return dt.datetime.combine(dt.date.min, time) - dt.datetime.min
 
 
-class TDays:
-    """交易日相关处理, 数据来源wind"""
+class TradingCalendar:
+    """
+        交易日历的进程内缓存, 每个交易所只查询一次, 保存为有序的 datetime64[D] 数组.
+        ttl 为自动刷新的秒数, 默认不刷新; 也可以调用 refresh 手动刷新
+    """
+    ttl: float = None
+
+    _cache: Dict[str, Tuple[np.ndarray, float]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, exchange='SHFE') -> np.ndarray:
+        cached = cls._cache.get(exchange)
+        if cached is None or (cls.ttl is not None and time.monotonic() - cached[1] > cls.ttl):
+            with cls._lock:
+                cached = cls._cache.get(exchange)
+                if cached is None or (cls.ttl is not None and time.monotonic() - cached[1] > cls.ttl):
+                    cached = (cls.load(exchange), time.monotonic())
+                    cls._cache[exchange] = cached
+
+        return cached[0]
+
+    @classmethod
+    def refresh(cls, exchange: str = None):
+        """清除缓存, exchange为空时清除全部交易所"""
+        with cls._lock:
+            if exchange:
+                cls._cache.pop(exchange, None)
+
+            else:
+                cls._cache.clear()
 
     @staticmethod
-    def get_trading_calendar(exchange='SHFE'):
+    def load(exchange='SHFE') -> np.ndarray:
         sql = f"SELECT DISTINCT Date FROM Calendar WHERE {exchange}=1 ORDER BY Date"
         dbm = DbManager(DbConn.MSSQL_165)
         calendar = dbm.query(sql)
 
-        return calendar
+        return np.unique(pd.to_datetime(calendar.iloc[:, 0]).to_numpy(dtype='datetime64[D]'))
+
+
+class TDays:
+    """交易日相关处理, 数据来源wind. 日历缓存在 TradingCalendar 中, 日期参数均支持传入数组"""
+
+    @staticmethod
+    def get_trading_calendar(exchange='SHFE'):
+        calendar = TradingCalendar.get(exchange)
+
+        return pd.DataFrame({'Date': calendar.astype('datetime64[ns]')})
+
+    @staticmethod
+    def to_days(t_date) -> Tuple[np.ndarray, bool]:
+        """将日期或日期数组转换为 datetime64[D] 数组, 并返回输入是否为标量"""
+        if isinstance(t_date, (str, dt.date)):
+            if isinstance(t_date, str):
+                t_date = parser.parse(timestr=t_date, fuzzy=True)
+
+            return np.array([np.datetime64(t_date.strftime(DateFmt.Y_M_D.value), 'D')]), True
+
+        days = pd.to_datetime(np.asarray(t_date).ravel())
+
+        return days.to_numpy(dtype='datetime64[D]'), False
+
+    @staticmethod
+    def format_days(days: np.ndarray, fmt, is_scalar: bool):
+        if is_scalar:
+            day = pd.Timestamp(days[0])
+            return day.strftime(fmt.value) if fmt else day
+
+        if fmt:
+            return pd.DatetimeIndex(days).strftime(fmt.value).to_numpy()
+
+        return days
 
     @staticmethod
     def wrap_tdays(df: pd.DataFrame, col_dt='DateTime', col_tdate='TradeDate'):
-        col_daten = "__DateN"
-        col_date = "__Date"
-        col_next = "__NextDate"
+        """
+            为df增加交易日列, 16点(含)之前归属当日或之后的第一个交易日, 16点之后归属下一交易日.
+            返回按col_dt排序的新DataFrame, 输入已有序时不再排序
 
-        calendar = TDays.get_trading_calendar(exchange='SHFE')
-        calendar.loc[:, col_date] = calendar.loc[:, 'Date']
-        calendar.loc[:, col_next] = calendar.loc[:, col_date].shift(-1)
-        calendar = calendar.loc[:, [col_date, col_next]]
+        :param df: 需要包含col_dt列
+        :param col_dt: 时间列
+        :param col_tdate: 交易日列名
+        """
+        if not df[col_dt].is_monotonic_increasing:
+            df = df.sort_values(col_dt)
 
-        df[col_daten] = pd.to_datetime(df.loc[:, col_dt].dt.date)
-        df = pd.merge_asof(df.sort_values(col_dt), calendar, left_on=col_daten, right_on=col_date, direction='forward')
+        df = df.reset_index(drop=True)
+        df[col_tdate] = TDays.assign_tdays(df[col_dt].to_numpy(dtype='datetime64[ns]'))
 
-        loc = (df.loc[:, col_dt].dt.time <= dt.time(16))
-        df.loc[loc, col_tdate] = df.loc[loc, col_date]
-        df.loc[~loc, col_tdate] = df.loc[~loc, col_next]
+        return df
 
-        return df.drop(columns=[col_daten, col_date, col_next], errors="ignore")
+    @staticmethod
+    def assign_tdays(datetimes: np.ndarray, end_hour=16, exchange='SHFE') -> np.ndarray:
+        """
+            按纳秒时间戳计算交易日, 规则同 wrap_tdays. 超出日历范围时为NaT
+
+        :param datetimes: datetime64[ns] 或 int64 纳秒时间戳, 有序时二分查找更快
+        :param end_hour: 交易日切换的小时点
+        :param exchange: 交易所标识
+        :return: datetime64[ns] 数组
+        """
+        day_ns = 24 * 3600 * 10 ** 9
+        calendar = TradingCalendar.get(exchange).astype('datetime64[ns]').view('i8')
+
+        datetimes = np.asarray(datetimes)
+        if datetimes.dtype.kind == 'M':
+            ns = datetimes.astype('datetime64[ns]').view('i8')
+            valid = ~np.isnat(datetimes)
+
+        else:
+            ns = datetimes.astype('i8')
+            valid = np.ones(len(ns), dtype=bool)
+
+        day = ns - ns % day_ns
+
+        # 当日或之后的第一个交易日, 超过end_hour顺延一个交易日
+        idx = np.searchsorted(calendar, day, side='left')
+        idx += (ns - day) > end_hour * 3600 * 10 ** 9
+
+        valid &= idx < len(calendar)
+
+        ret = np.full(len(ns), np.datetime64('NaT'), dtype='datetime64[ns]')
+        ret[valid] = calendar[idx[valid]].view('datetime64[ns]')
+
+        return ret
 
     @staticmethod
     def is_tday(t_date: TP.TDate, exchange='SHFE') -> bool:
         """ 判断是否为工作日
 
-        :param t_date: 需要判断的日期
+        :param t_date: 需要判断的日期, 支持数组
         :param exchange: 交易所标识
-        :return: bool
+        :return: bool, 传入数组时返回 bool 数组
         """
-        assert t_date, "date cannot be empty!"
-        t_date = Dates.convert(t_date, DateFmt.YMD)
+        assert t_date is not None and (not isinstance(t_date, str) or t_date), "date cannot be empty!"
 
-        sql = f"SELECT COUNT(*) FROM Calendar WHERE {exchange}=1 and Date='{t_date}'"
-        dbm = DbManager(DbConn.MSSQL_165)
-        result = dbm.query(sql)
-        return result.iat[0, 0] != 0
+        calendar = TradingCalendar.get(exchange)
+        days, is_scalar = TDays.to_days(t_date)
+
+        idx = np.minimum(np.searchsorted(calendar, days, side='left'), len(calendar) - 1)
+        result = calendar[idx] == days
+
+        return bool(result[0]) if is_scalar else result
 
     @staticmethod
     def get_tday(t_datetime: TP.TDate = None, end_hour=21, fmt=DateFmt.Y_M_D, exchange='SHFE') -> str:
         """ 依据end_hour与当前时间的小时数进行对比, 如果超过end_hour切换到下一工作日.
             如果t_date非交易日, 将t_date等于下一个交易日
 
-        :param t_datetime: 需要计算的工作日,可以带时间戳, 默认当天
+        :param t_datetime: 需要计算的工作日,可以带时间戳, 默认当天. 传入数组时按每个元素自身的小时数判断
         :param end_hour: T日结束的小时点,默认T日21点. 如果需要按自然日切换, 传入0即可.
         :param fmt: 需要输出的日期格式
         :param exchange: 交易所标识
@@ -126,6 +227,12 @@ class TDays:
         if end_hour not in hours:
             raise ValueError("end_hour value error! Must be equal to 0 or in the interval [15,23]")
 
+        if t_datetime is not None and not isinstance(t_datetime, (str, dt.date)):
+            t_hour = pd.to_datetime(np.asarray(t_datetime).ravel()).hour.to_numpy()
+            days = (t_hour >= end_hour).astype(int) if end_hour != 0 else 0
+
+            return TDays.add(t_datetime, days, fmt, exchange)
+
         t_datetime = t_datetime or Dates.now_std_day()
         t_time = pd.to_datetime(t_datetime).time()
         # 如果时间不为 00:00:00 则分解出时间的小时数与end_hour进行比对
@@ -142,35 +249,24 @@ class TDays:
     def add(t_date: TP.TDate, days, fmt=DateFmt.Y_M_D, exchange='SHFE') -> str:
         """ 以t_date做为T日, 往前或后推算交易日
 
-        :param t_date: 日期/实例日期
-        :param days: ±N 个交易日
+        :param t_date: 日期/实例日期, 支持数组
+        :param days: ±N 个交易日, 支持与t_date等长的数组
         :param fmt: 需要输出的日期格式
         :param exchange: 交易所标识
         :return: 计算后的交易日 yyyymmdd
         """
-        if not t_date:
+        if t_date is None or (isinstance(t_date, str) and not t_date):
             raise ValueError("trading date can't be empty!")
 
-        t_date = Dates.convert(t_date, DateFmt.YMD)
-        compare_symbol, order_symbol = (">=", "ASC") if days >= 0 else ("<", "DESC")
-        # row_number()是从1开始的序列. days=0 默认当前工作日
-        days = 1 if days == 0 else abs(days) if days < 0 else days + 1
+        calendar = TradingCalendar.get(exchange)
+        t_days, is_scalar = TDays.to_days(t_date)
 
-        sql = (f"SELECT Date FROM " 
-              f"(" 
-              f"    SELECT row_number() over (order by Date {order_symbol}) rn, Date " 
-              f"    FROM Calendar WHERE {exchange}=1 and Date {compare_symbol} '{t_date}'" 
-              f") AS a " 
-              f"WHERE a.rn = {days}")
+        # days=0 取t_date当日或之后的第一个交易日, days<0 从t_date之前的交易日开始计数
+        idx = np.searchsorted(calendar, t_days, side='left') + np.asarray(days)
+        if (idx < 0).any() or (idx >= len(calendar)).any():
+            raise IndexError(f"trading date out of calendar range [{calendar[0]}, {calendar[-1]}]")
 
-        dbm = DbManager(DbConn.MSSQL_165)
-        result = dbm.query(sql)
-
-        if fmt:
-            return Dates.convert(str(result.iat[0, 0]), fmt)
-
-        else:
-            return result.iat[0, 0]
+        return TDays.format_days(calendar[idx], fmt, is_scalar)
 
     @staticmethod
     def period(begin_date: TP.TDate, end_date: TP.TDate = None, fmt=DateFmt.Y_M_D, exchange='SHFE') -> List:
@@ -190,23 +286,17 @@ class TDays:
         if begin_date > end_date:
             raise ValueError("BeginDate must be less than EndDate")
 
-        sql = (f"SELECT Date FROM Calendar "
-               f"WHERE {exchange}=1 AND Date between '{begin_date}' and '{end_date}' "
-               f"ORDER BY Date ")
+        calendar = TradingCalendar.get(exchange)
+        start = np.searchsorted(calendar, TDays.to_days(begin_date)[0][0], side='left')
+        end = np.searchsorted(calendar, TDays.to_days(end_date)[0][0], side='right')
 
-        dbm = DbManager(DbConn.MSSQL_165)
-        result = dbm.query(sql)
-        if result.empty:
+        if start >= end:
             warnings.warn(f"trading days not exists between [{begin_date}] and [{end_date}]")
             return []
 
-        dates = result.iloc[:, 0].to_list()
+        dates = TDays.format_days(calendar[start:end], fmt, False)
 
-        if fmt:
-            return list(map(lambda d: Dates.convert(d, fmt), dates))
-
-        else:
-            return dates
+        return list(dates) if fmt else list(pd.to_datetime(dates))
 
     @staticmethod
     def interval(t_date: TP.TDate = None, days=1, end_hour=21, fmt=DateFmt.Y_M_D, exchange='SHFE') -> List[str]:
@@ -1,2 +1,3 @@
 from .backtest import *
 from .factor.pivot_func import *
+from .sweep import BacktestSweep
@@ -0,0 +1,186 @@
+# -*- coding:utf-8 -*-
+"""
+    日收益矩阵的绩效指标, (日期, 策略) 二维数组按列一次算完, 口径与 backtest.calc_sharpe / calc_calmar / calc_maxdd 一致:
+        净值为累计收益 + 1(单利), 回撤为净值与历史最高净值之差, nan 收益在净值中按 0 处理
+"""
+from typing import Dict, Union
+
+import numba as nb
+import numpy as np
+import pandas as pd
+
+PERIODS = 252
+
+
+def _to_2d(daily) -> np.ndarray:
+    arr = np.asarray(daily, dtype=np.float64)
+    return arr.reshape(len(arr), -1)
+
+
+def _nav(daily: np.ndarray) -> np.ndarray:
+    return np.cumsum(np.nan_to_num(daily), axis=0) + 1
+
+
+def annual_return(daily, periods=PERIODS) -> np.ndarray:
+    return np.nanmean(_to_2d(daily), axis=0) * periods
+
+
+def sharpe(daily, periods=PERIODS) -> np.ndarray:
+    arr = _to_2d(daily)
+    return np.sqrt(periods) * np.nanmean(arr, axis=0) / np.nanstd(arr, axis=0, ddof=1)
+
+
+def max_drawdown(daily) -> np.ndarray:
+    nav = _nav(_to_2d(daily))
+    return np.max(np.maximum.accumulate(nav, axis=0) - nav, axis=0)
+
+
+def drawdown_duration(daily) -> np.ndarray:
+    """最长的回撤持续天数: 净值低于此前最高净值的最长连续天数"""
+    nav = _nav(_to_2d(daily))
+    underwater = nav < np.maximum.accumulate(nav, axis=0)
+
+    # 每一天距离最近一次创新高的天数
+    days = np.arange(len(nav))[:, None]
+    last_peak = np.maximum.accumulate(np.where(underwater, 0, days), axis=0)
+
+    return np.max(days - last_peak, axis=0)
+
+
+def calmar(daily, periods=PERIODS) -> np.ndarray:
+    return annual_return(daily, periods) / (max_drawdown(daily) + 1e-8)
+
+
+def hit_rate(daily) -> np.ndarray:
+    """收益为正的天数占有收益(非 0 非 nan)天数的比例"""
+    arr = _to_2d(daily)
+    with np.errstate(invalid='ignore'):
+        return (arr > 0).sum(axis=0) / ((arr != 0) & ~np.isnan(arr)).sum(axis=0)
+
+
+def summarize(
+        daily: Union[pd.Series, pd.DataFrame],
+        turnover: Union[pd.Series, pd.DataFrame] = None,
+        long: Union[pd.Series, pd.DataFrame] = None,
+        short: Union[pd.Series, pd.DataFrame] = None,
+        periods=PERIODS,
+) -> pd.DataFrame:
+    """
+        所有策略的绩效指标
+
+    :param daily: 日收益, index 为日期, columns 为策略(Series 视为一个策略)
+    :param turnover: 每日换手, 与 daily 同形状
+    :param long: 多头部分的日收益, 与 daily 同形状, 见 split_long_short
+    :param short: 空头部分的日收益
+    :return: index 为策略, columns 为 annual_return, sharpe, calmar, max_dd, max_dd_duration, hit_rate,
+             以及 turnover 和 long_ / short_ 前缀的 annual_return, sharpe, max_dd, hit_rate
+    """
+    daily = daily.to_frame() if isinstance(daily, pd.Series) else daily
+
+    summary = {
+        'annual_return': annual_return(daily, periods),
+        'sharpe': sharpe(daily, periods),
+        'calmar': calmar(daily, periods),
+        'max_dd': max_drawdown(daily),
+        'max_dd_duration': drawdown_duration(daily),
+        'hit_rate': hit_rate(daily),
+    }
+
+    if turnover is not None:
+        summary['turnover'] = np.nanmean(_to_2d(turnover), axis=0)
+
+    for prefix, part in (('long_', long), ('short_', short)):
+        if part is not None:
+            summary[f'{prefix}annual_return'] = annual_return(part, periods)
+            summary[f'{prefix}sharpe'] = sharpe(part, periods)
+            summary[f'{prefix}max_dd'] = max_drawdown(part)
+            summary[f'{prefix}hit_rate'] = hit_rate(part)
+
+    return pd.DataFrame(summary, index=daily.columns)
+
+
+def split_long_short(returns: pd.DataFrame, signal) -> pd.DataFrame:
+    """
+        bar 收益按持仓方向拆分并按日汇总
+
+    :param returns: 持仓收益(ret * signal), index 为 datetime, columns 为品种
+    :param signal: 持仓, 与 returns 同形状
+    :return: index 为日期, columns 为 long, short
+    """
+    values = np.nan_to_num(returns.to_numpy(dtype=np.float64))
+    signal = np.asarray(signal, dtype=np.float64)
+
+    bar = pd.DataFrame({
+        'long': np.where(signal > 0, values, 0).sum(axis=1),
+        'short': np.where(signal < 0, values, 0).sum(axis=1),
+    }, index=returns.index)
+
+    return bar.groupby(bar.index.date).sum()
+
+
+@nb.njit(parallel=True, cache=True)
+def rolling_max_drawdown_kernel(nav, window, min_periods):
+    n, n_col = nav.shape
+    out = np.full((n, n_col), np.nan)
+
+    for j in nb.prange(n_col):
+        for i in range(min_periods - 1, n):
+            peak = -np.inf
+            dd = 0.
+            for k in range(max(i - window + 1, 0), i + 1):
+                v = nav[k, j]
+                peak = peak if peak >= v else v
+                dd = dd if dd >= peak - v else peak - v
+            out[i, j] = dd
+
+    return out
+
+
+def rolling_summarize(
+        daily: Union[pd.Series, pd.DataFrame],
+        window: int,
+        min_periods: int = None,
+        periods=PERIODS,
+) -> Dict[str, pd.DataFrame]:
+    """
+        滚动窗口的 annual_return, sharpe, max_dd, calmar, hit_rate
+
+    :param daily: 日收益, index 为日期, columns 为策略
+    :param window: 窗口天数
+    :param min_periods: 最少天数, 默认为 window
+    :return: {指标: 日期 * 策略}
+    """
+    daily = daily.to_frame() if isinstance(daily, pd.Series) else daily
+    min_periods = window if min_periods is None else min_periods
+    rolling = daily.rolling(window, min_periods=min_periods)
+
+    result = {
+        'annual_return': rolling.mean() * periods,
+        'sharpe': np.sqrt(periods) * rolling.mean() / rolling.std(),
+    }
+
+    nav = np.ascontiguousarray(_nav(daily.to_numpy(dtype=np.float64)))
+    result['max_dd'] = pd.DataFrame(
+        rolling_max_drawdown_kernel(nav, window, max(min_periods, 1)), index=daily.index, columns=daily.columns
+    )
+    result['calmar'] = result['annual_return'] / (result['max_dd'] + 1e-8)
+
+    won = (daily > 0).astype(float).rolling(window, min_periods=min_periods).sum()
+    active = ((daily != 0) & daily.notna()).astype(float).rolling(window, min_periods=min_periods).sum()
+    result['hit_rate'] = won / active
+
+    return result
+
+
+def to_performance_table(summary: pd.DataFrame, evaluator: str) -> pd.DataFrame:
+    """
+        summarize 的结果转为 StrategyPerformance 表(save_analyzer_performance)的格式, nan 不保存
+
+    :param summary: index 为 BackTestID
+    :param evaluator: 评估器名称
+    :return: BackTestID, Evaluator, Type, Value
+    """
+    table = summary.rename_axis(index='BackTestID', columns='Type').stack().rename('Value').reset_index()
+    table.insert(1, 'Evaluator', evaluator)
+
+    return table[np.isfinite(table['Value'].astype(float))].reset_index(drop=True)
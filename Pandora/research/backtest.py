@@ -5,6 +5,12 @@ import numpy as np
 import pandas as pd
 
 from Pandora.helper import TDays
+from Pandora.research.kernels import (
+    exit_atr_barrier_kernel, exit_loss_barrier_kernel, exit_trace_kernel,
+    one_shot_kernel, pack_valid_kernel, rolling_mean_abs_corr_kernel, unpack_valid_kernel
+)
+from Pandora.research.rolling import rolling_quantile, rolling_rank
+from Pandora.research.trade_log import extract_trades
 
 COMMISSION = 2e-4
 
@@ -99,6 +105,35 @@ def get_quote(codes, start=dt.datetime(2015, 1, 1), end=dt.datetime.now(), **kwa
     return quote_bt, ret
 
 
+def publish_quote(quote_bt: pd.DataFrame, ret: pd.DataFrame = None, atr_param=None, store=None):
+    """
+        将 get_quote 的结果发布到共享存储, 并行回测时只传 store, worker 中 store.attach(name) 零拷贝读取:
+            quote: quote_bt, ret: bar 收益, close: 收盘价矩阵, atr: talib.ATR(atr_param) 矩阵(atr_param 非空时)
+
+    :param store: SharedFrameStore, 为空时新建临时存储, 用完调用 store.close()
+    """
+    from Pandora.research.shared import SharedFrameStore
+    from Pandora.research.factor.pivot_func import get_atr_factor
+
+    store = store or SharedFrameStore()
+    store.publish('quote', quote_bt)
+    store.publish('ret', get_bar_ret(quote_bt) if ret is None else ret)
+    store.publish('close', quote_bt.pivot(columns='symbol', values='close_price'))
+
+    if atr_param:
+        store.publish('atr', get_atr_factor(quote_bt, atr_param))
+
+    return store
+
+
+# 不计入回测的 bar 收益: (品种, 开始, 结束, 替换值), 按 bar 的 datetime, 含两端, 开始为空表示不限
+BAR_RET_OVERRIDES = (
+    ('fu00', None, dt.datetime(2018, 8, 1), np.nan),
+    ('ni00', dt.datetime(2022, 3, 7), dt.datetime(2022, 3, 31), 0),
+    ('bu00', None, dt.datetime(2015, 10, 1), np.nan),
+)
+
+
 def get_bar_ret(quote_bt: pd.DataFrame):
     ret = {}
     for code, group in quote_bt.groupby('symbol'):
@@ -107,14 +142,28 @@ def get_bar_ret(quote_bt: pd.DataFrame):
 
     ret = pd.DataFrame(ret)
 
-    if 'fu00' in ret.columns:
-        ret.loc[:dt.datetime(2018, 8, 1), 'fu00'] = np.nan
+    for code, start, end, value in BAR_RET_OVERRIDES:
+        if code in ret.columns:
+            ret.loc[start: end, code] = value
+
+    return ret
+
 
-    if 'ni00' in ret.columns:
-        ret.loc[dt.datetime(2022, 3, 7): dt.datetime(2022, 3, 31), 'ni00'] = 0
+def override_bar_ret(ret, symbol, datetime) -> np.ndarray:
+    """
+        逐 bar 的收益按 BAR_RET_OVERRIDES 替换, 与 get_bar_ret 一致
 
-    if 'bu00' in ret.columns:
-        ret.loc[:dt.datetime(2015, 10, 1), 'bu00'] = np.nan
+    :param ret: bar 收益, 与 symbol, datetime 等长
+    """
+    ret = np.array(ret, dtype=np.float64)
+    symbol = np.asarray(symbol)
+    datetime = pd.DatetimeIndex(datetime)
+
+    for code, start, end, value in BAR_RET_OVERRIDES:
+        loc = (symbol == code) & (datetime <= end)
+        if start is not None:
+            loc &= datetime >= start
+        ret[loc] = value
 
     return ret
 
@@ -126,115 +175,65 @@ def trade_by_quantile_imba(feature, window, quantile_upper_long, quantile_lower_
     quantile_upper_short = quantile_upper_short or 1 - quantile_lower_long
     window_short = window_short or window
 
-    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
-    for col in range(feature.shape[1]):
-        ft = feature.iloc[:, col].dropna()
-        upper_long = ft.rolling(window=window, min_periods=min(window, 100)).quantile(quantile_upper_long)
-        lower_long = ft.rolling(window=window, min_periods=min(window, 100)).quantile(quantile_lower_long)
-
-        # buggy when upper_short > lower_long
-        upper_short = ft.rolling(window=window_short, min_periods=min(window_short, 100)).quantile(quantile_upper_short)
-        lower_short = ft.rolling(window=window_short, min_periods=min(window_short, 100)).quantile(quantile_lower_short)
-
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = (ft >= upper_long)
-        # loc = (ft >= upper_long) & (ft.diff() > 0)
-        # loc = (ft >= upper_long) & (ft.shift() < upper_long)
-        # loc = (ft >= upper_long) & (upper_long - lower_short > 0.25)
-        sig.loc[loc] = 1
-        # sig.loc[loc] = 0
-
-        loc = (ft <= lower_long) & (ft.shift() > lower_long.shift())
-        sig.loc[loc] = 0
-        # sig.loc[loc] = 0
-
-        loc = (ft >= upper_short) & (ft.shift() < upper_short.shift())
-        sig.loc[loc] = 0
-
-        loc = (ft <= lower_short)
-        # loc = (ft <= lower_short) & (ft.diff() < 0)
-        # loc = (ft <= lower_short) & (ft.shift() > lower_short)
-        # loc = (ft <= lower_short) & (upper_long - lower_short > 0.25)
-        sig.loc[loc] = -1
-
-        # open_signal_df[open_signal_df.columns[col]] = sig
-
-        sig_ = np.sign(sig.ffill().diff().fillna(0))
-        sig_.loc[sig_ == 0] = np.nan
-        sig_.loc[sig == 0] = 0
-        open_signal_df[open_signal_df.columns[col]] = sig_
-
-    open_signal = open_signal_df.values
-    return open_signal
+    ft, index = _pack_valid(feature)
+    if window_short == window:
+        upper_long, lower_long, upper_short, lower_short = rolling_quantile(
+            ft, window, [quantile_upper_long, quantile_lower_long, quantile_upper_short, quantile_lower_short],
+            min_periods=min(window, 100)
+        )
 
+    else:
+        upper_long, lower_long = rolling_quantile(
+            ft, window, [quantile_upper_long, quantile_lower_long], min_periods=min(window, 100)
+        )
 
-def trade_by_quantile(feature, window, quantile_upper_long, one_shot=True):
-    quantile_lower_short = 1 - quantile_upper_long
+        # buggy when upper_short > lower_long
+        upper_short, lower_short = rolling_quantile(
+            ft, window_short, [quantile_upper_short, quantile_lower_short], min_periods=min(window_short, 100)
+        )
 
-    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
-    for col in range(feature.shape[1]):
-        ft = feature.iloc[:, col].dropna()
+    ft_shift = _shift(ft)
 
-        rank = (bn.move_rank(ft, window, min_count=min(100, window), axis=0) + 1) / 2
+    sig = np.full_like(ft, np.nan)
+    sig[ft >= upper_long] = 1
+    sig[(ft <= lower_long) & (ft_shift > _shift(lower_long))] = 0
+    sig[(ft >= upper_short) & (ft_shift < _shift(upper_short))] = 0
+    sig[ft <= lower_short] = -1
 
-        rank_shift = np.roll(rank, 1)
-        rank_shift[0] = np.nan
+    return _unpack_valid(_to_one_shot(sig), index)
 
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = (rank >= quantile_upper_long)
-        sig.loc[loc] = 1
 
-        loc = (rank <= 0.5) & (rank_shift > 0.5)
-        sig.loc[loc] = 0
+def trade_by_quantile(feature, window, quantile_upper_long, one_shot=True):
+    quantile_lower_short = 1 - quantile_upper_long
 
-        loc = (rank >= 0.5) & (rank_shift < 0.5)
-        sig.loc[loc] = 0
+    ft, index = _pack_valid(feature)
 
-        loc = (rank <= quantile_lower_short)
-        sig.loc[loc] = -1
+    rank = (rolling_rank(ft, window, min(100, window), norm='signed') + 1) / 2
+    rank_shift = _shift(rank)
 
-        if one_shot:
-            sig_ = np.sign(sig.ffill().diff().fillna(0))
-            sig_.loc[sig_ == 0] = np.nan
-            sig_.loc[sig == 0] = 0
-            open_signal_df[open_signal_df.columns[col]] = sig_
+    sig = np.full_like(ft, np.nan)
+    sig[rank >= quantile_upper_long] = 1
+    sig[(rank <= 0.5) & (rank_shift > 0.5)] = 0
+    sig[(rank >= 0.5) & (rank_shift < 0.5)] = 0
+    sig[rank <= quantile_lower_short] = -1
 
-        else:
-            open_signal_df[open_signal_df.columns[col]] = sig
+    if one_shot:
+        sig = _to_one_shot(sig)
 
-    open_signal = open_signal_df.values
-    return open_signal
+    return _unpack_valid(sig, index)
 
 
 def trade_by_thres_imba(feature, thres_open_long, thres_open_short, thres_close_long, thres_close_short):
-    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
-    for col in range(feature.shape[1]):
-        ft = feature.iloc[:, col].dropna()
-
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = (ft >= thres_open_long)
-        sig.loc[loc] = 1
-        # sig.loc[loc] = 0
-
-        loc = (ft <= thres_close_long) & (ft.shift() > thres_close_long)
-        sig.loc[loc] = 0
-        # sig.loc[loc] = 0
-
-        loc = (ft >= thres_close_short) & (ft.shift() < thres_close_short)
-        sig.loc[loc] = 0
+    ft, index = _pack_valid(feature)
+    ft_shift = _shift(ft)
 
-        loc = (ft <= thres_open_short)
-        sig.loc[loc] = -1
+    sig = np.full_like(ft, np.nan)
+    sig[ft >= thres_open_long] = 1
+    sig[(ft <= thres_close_long) & (ft_shift > thres_close_long)] = 0
+    sig[(ft >= thres_close_short) & (ft_shift < thres_close_short)] = 0
+    sig[ft <= thres_open_short] = -1
 
-        # open_signal_df[open_signal_df.columns[col]] = sig
-
-        sig_ = np.sign(sig.ffill().diff().fillna(0))
-        sig_.loc[sig_ == 0] = np.nan
-        sig_.loc[sig == 0] = 0
-        open_signal_df[open_signal_df.columns[col]] = sig_
-
-    open_signal = open_signal_df.values
-    return open_signal
+    return _unpack_valid(_to_one_shot(sig), index)
 
 
 def trade_by_cross(feature):
@@ -252,67 +251,40 @@ def trade_by_cross(feature):
 
 
 def trade_by_cross_ma(feat, window):
-    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
-    for col in range(feat.shape[1]):
-        ft = feat.iloc[:, col].dropna()
-        MA = bn.move_mean(ft.values, window, 1, axis=0)
+    ft, index = _pack_valid(feat)
+    MA = bn.move_mean(ft, window, 1, axis=0)
 
-        cross = ft - MA
+    cross = ft - MA
+    cross_shift = _shift(cross)
 
-        sig = pd.Series(np.nan, index=cross.index)
-        loc = (cross > 0) & (cross.shift() <= 0)
-        sig.loc[loc] = 1
+    sig = np.full_like(ft, np.nan)
+    sig[(cross > 0) & (cross_shift <= 0)] = 1
+    sig[(cross < 0) & (cross_shift >= 0)] = -1
 
-        loc = (cross < 0) & (cross.shift() >= 0)
-        sig.loc[loc] = -1
-
-        open_signal_df[open_signal_df.columns[col]] = sig
-
-    open_signal = open_signal_df.values
-    return open_signal
+    return _unpack_valid(sig, index)
 
 
 def trade_by_norm(feat, std_multiplier=1):
-    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
-    for col in range(feat.shape[1]):
-        ft = feat.iloc[:, col].dropna()
-
-        mean = 0
-        # std = ft.rolling(window=window).std()
-        std = 1
+    ft, index = _pack_valid(feat)
+    ft_shift = _shift(ft)
 
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = ft > (mean + std_multiplier * std)
-        sig.loc[loc] = 1
-        # sig.loc[loc] = 0
+    mean = 0
+    std = 1
 
-        loc = (ft < mean) & (ft.shift() > mean)
-        sig.loc[loc] = 0
+    sig = np.full_like(ft, np.nan)
+    sig[ft > (mean + std_multiplier * std)] = 1
+    sig[(ft < mean) & (ft_shift > mean)] = 0
+    sig[ft < (mean - std_multiplier * std)] = -1
+    sig[(ft > mean) & (ft_shift < mean)] = 0
 
-        loc = ft < (mean - std_multiplier * std)
-        sig.loc[loc] = -1
-        # sig.loc[loc] = 0
-
-        loc = (ft > mean) & (ft.shift() < mean)
-        sig.loc[loc] = 0
-
-        sig_ = np.sign(sig.ffill().diff().fillna(0))
-        sig_.loc[sig_ == 0] = np.nan
-        sig_.loc[sig == 0] = 0
-
-        open_signal_df[open_signal_df.columns[col]] = sig_
-
-        # open_signal_df[open_signal_df.columns[col]] = sig
-
-    open_signal = open_signal_df.values
-    return open_signal
+    return _unpack_valid(_to_one_shot(sig), index)
 
 
 def trade_by_ts_rank(feat, window, quantile_lower=0.1, quantile_upper=0.9):
     open_signal = np.empty_like(feat)
     open_signal[:] = np.nan
 
-    rank = (bn.move_rank(feat, window, min_count=min(100, window), axis=0) + 1) / 2
+    rank = (rolling_rank(feat, window, min(100, window), norm='signed') + 1) / 2
 
     rank_shift = np.empty_like(rank)
     rank_shift[:] = np.nan
@@ -379,84 +351,108 @@ def trade_by_cs(feature, cs_interval, cs_quantile):
 
 
 def trade_by_std_w_0(feat, window, std_multiplier=1):
-    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
-    for col in range(feat.shape[1]):
-        ft = feat.iloc[:, col].dropna()
+    ft, index = _pack_valid(feat)
+    ft_shift = _shift(ft)
 
-        mean = ft.rolling(window=window).mean()
-        std = ft.rolling(window=window).std()
+    rolling = pd.DataFrame(ft).rolling(window=window)
+    mean = rolling.mean().values
+    std = rolling.std().values
+    mean_shift = _shift(mean)
 
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = ft > (mean + std_multiplier * std)
-        sig.loc[loc] = 1
-        # sig.loc[loc] = 0
+    sig = np.full_like(ft, np.nan)
+    sig[ft > (mean + std_multiplier * std)] = 1
+    sig[(ft < mean) & (ft_shift > mean_shift)] = 0
+    sig[ft < (mean - std_multiplier * std)] = -1
+    sig[(ft > mean) & (ft_shift < mean_shift)] = 0
 
-        loc = (ft < mean) & (ft.shift() > mean.shift())
-        sig.loc[loc] = 0
+    return _unpack_valid(_to_one_shot(sig), index)
 
-        loc = ft < (mean - std_multiplier * std)
-        sig.loc[loc] = -1
-        # sig.loc[loc] = 0
 
-        loc = (ft > mean) & (ft.shift() < mean.shift())
-        sig.loc[loc] = 0
+def trade_by_std(feat, window, std_multiplier=1):
+    ft, index = _pack_valid(feat)
 
-        sig_ = np.sign(sig.ffill().diff().fillna(0))
-        sig_.loc[sig_ == 0] = np.nan
-        sig_.loc[sig == 0] = 0
+    rolling = pd.DataFrame(ft).rolling(window=window)
+    mean = rolling.mean().values
+    std = rolling.std().values
 
-        open_signal_df[open_signal_df.columns[col]] = sig_
+    sig = np.full_like(ft, np.nan)
+    sig[ft > (mean + std_multiplier * std)] = 1
+    sig[ft < (mean - std_multiplier * std)] = -1
 
-    open_signal = open_signal_df.values
-    return open_signal
+    return _unpack_valid(_to_one_shot(sig), index)
 
 
-def trade_by_std(feat, window, std_multiplier=1):
-    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
-    for col in range(feat.shape[1]):
-        ft = feat.iloc[:, col].dropna()
+def _pack_valid(feature):
+    """
+        将每列的非 nan 值依次移到该列顶部, 等价于逐列 dropna, 滚动计算在压缩后的二维数组上按列进行
 
-        mean = ft.rolling(window=window).mean()
-        std = ft.rolling(window=window).std()
+    :return: (压缩后的数组, 原数组), 原数组用于 _unpack_valid 还原, 无 nan 时为 None.
+             均为列优先存储, 按列滚动时内存连续
+    """
+    values = np.asfortranarray(feature, dtype=np.float64)
+    if not np.isnan(values).any():
+        return values.copy(order='F'), None
 
-        sig = pd.Series(np.nan, index=ft.index)
-        loc = ft > (mean + std_multiplier * std)
-        sig.loc[loc] = 1
+    return pack_valid_kernel(values), values
 
-        loc = ft < (mean - std_multiplier * std)
-        sig.loc[loc] = -1
 
-        sig_ = np.sign(sig.ffill().diff().fillna(0))
-        sig_.loc[sig_ == 0] = np.nan
-        sig_.loc[sig == 0] = 0
+def _unpack_valid(packed, values):
+    """_pack_valid 的逆操作, 原 nan 位置为 nan"""
+    if values is None:
+        return packed
 
-        open_signal_df[open_signal_df.columns[col]] = sig_
+    return unpack_valid_kernel(packed, values)
 
-    open_signal = open_signal_df.values
-    return open_signal
+
+def _shift(values):
+    """按行下移一位, 与 DataFrame.shift() 一致"""
+    shifted = np.full_like(values, np.nan)
+    shifted[1:] = values[:-1]
+
+    return shifted
+
+
+def _to_one_shot(sig):
+    """只在持仓方向变化的 bar 上保留信号, 平仓信号(0)保留"""
+    return one_shot_kernel(sig)
+
+
+def _get_std_corr(quote, param, day_count):
+    """
+        get_weight_by_3d / get_weight_by_std_corr 共用的年化波动率与滚动平均绝对相关系数
+
+        波动率按各品种自身的 bar 滚动(在 _pack_valid 压缩后的数组上), 相关系数按所有品种合并后的时间轴滚动,
+        由 rolling_mean_abs_corr_kernel 直接得到每个品种的均值, 不生成 (时间, 品种, 品种) 的相关系数矩阵
+
+    :return: (close, std, corr), 均为 datetime * symbol
+    """
+    if param < 100:
+        raise ValueError(f"min_periods 100 must be <= window {param}")
+
+    close = quote.pivot(columns='symbol', values='close_price').rename_axis(columns=None)
+    packed, values = _pack_valid(close)
+
+    r_mat = np.log(packed / _shift(packed))
+    std = bn.move_std(r_mat, param, min(100, param), axis=0, ddof=1) * np.sqrt(252 * day_count)
+    std = pd.DataFrame(_unpack_valid(std, values), index=close.index, columns=close.columns)
+
+    r_mat = np.ascontiguousarray(_unpack_valid(r_mat, values))
+    corr = pd.DataFrame(rolling_mean_abs_corr_kernel(r_mat, param, 100), index=close.index, columns=close.columns)
+
+    return close, std, corr
 
 
 def get_weight_by_3d(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_max=0.65):
-    std = {}
-    r_mat = {}
+    close, std, corr = _get_std_corr(quote, param, day_count)
+
     stm_mat = {}
     for code, group in quote.groupby('symbol'):
-        f = np.log(1 + group['close_price'].pct_change()).rolling(param, min_periods=min(100, param)).std()
-        std[code] = f * np.sqrt(252 * day_count)
-        r_mat[code] = np.log(1 + group['close_price'].pct_change())
-
         hh = group.loc[:, 'high_price'].rolling(param, min_periods=1).max()
         ll = group.loc[:, 'low_price'].rolling(param, min_periods=1).min()
         stm_mat[code] = ((group.loc[:, 'close_price'] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
 
-    std = pd.DataFrame(std)
-    r_mat = pd.DataFrame(r_mat)
     stm_mat = pd.DataFrame(stm_mat)
 
-    corr = r_mat.rolling(param, min_periods=100).corr().abs().mean(axis=1).reset_index()
-    corr.columns = ['datetime', 'symbol', 'corr']
-    corr = corr.pivot(index='datetime', columns='symbol', values='corr')
-
     weight = std + corr
     weight = (thres_max - weight) / (thres_max - thres_min)
     weight = weight * 2 / 3 + stm_mat.abs() / 3
@@ -470,7 +466,6 @@ def get_weight_by_3d(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_
         loc = weight < 1 / n
         weight[loc] = 1 / n
 
-    close = quote.pivot(columns='symbol', values='close_price')
     trading_contract = (~pd.isna(close.ffill())).sum(axis=1)
 
     weight = weight.div(trading_contract, axis=0)
@@ -479,19 +474,7 @@ def get_weight_by_3d(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_
 
 
 def get_weight_by_std_corr(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_max=0.65):
-    std = {}
-    r_mat = {}
-    for code, group in quote.groupby('symbol'):
-        f = np.log(1 + group['close_price'].pct_change()).rolling(param, min_periods=min(100, param)).std()
-        std[code] = f * np.sqrt(252 * day_count)
-        r_mat[code] = np.log(1 + group['close_price'].pct_change())
-
-    std = pd.DataFrame(std)
-
-    r_mat = pd.DataFrame(r_mat)
-    corr = r_mat.rolling(param, min_periods=100).corr().abs().mean(axis=1).reset_index()
-    corr.columns = ['datetime', 'symbol', 'corr']
-    corr = corr.pivot(index='datetime', columns='symbol', values='corr')
+    close, std, corr = _get_std_corr(quote, param, day_count)
 
     weight = std + corr
     weight = ((thres_max - weight) / (thres_max - thres_min) * (n - 1) + 1) / n
@@ -502,7 +485,6 @@ def get_weight_by_std_corr(quote, param=500, day_count=23, n=3, thres_min=0.25,
     loc = weight < 1 / n
     weight[loc] = 1 / n
 
-    close = quote.pivot(columns='symbol', values='close_price')
     trading_contract = (~pd.isna(close.ffill())).sum(axis=1)
 
     weight = weight.div(trading_contract, axis=0)
@@ -641,44 +623,8 @@ def get_shoot_info(open_signal, day_count=23):
 
 
 def get_trade_info(returns, signal, day_count=23, comm=3e-4):
-    sig = pd.DataFrame(signal, index=returns.index, columns=returns.columns)
-    trade = sig.diff().fillna(0).abs().cumsum() * np.sign(sig)
-    trade[sig == 0] = 0
-
-    trade_detail = []
-    trade_info_col = {}
-    for col in trade.columns:
-        trade_col = trade[col]
-        returns_col = returns[col] / sig[col].abs()
-
-        trade_ret = returns_col.groupby(trade_col).sum() - comm * 2
-        trade_weight = sig[col].groupby(trade_col).mean()
-
-        trade_hp = trade_col.value_counts()
-        trade_hp = trade_hp[trade_hp.index != 0] / day_count
-
-        trade_ = trade_col.reset_index()
-        trade_detail_col = pd.DataFrame(columns=['symbol', 'HP', 'PnL'])
-        trade_detail_col['EnterTime'] = trade_.groupby(col)['datetime'].first()
-        trade_detail_col['ExitTime'] = trade_.groupby(col)['datetime'].last()
-
-        trade_detail_col['Weight'] = trade_weight
-        trade_detail_col['PnL'] = trade_ret
-        trade_detail_col['HP'] = trade_hp
-        trade_detail_col = trade_detail_col.reset_index().rename(columns={col: 'TradeID'})
-        trade_detail_col['Direction'] = np.sign(trade_detail_col['TradeID'])
-        trade_detail_col['symbol'] = col
-
-        loc = trade_detail_col['TradeID'] != 0
-        trade_detail_col = trade_detail_col[loc]
-
-        trade_detail.append(trade_detail_col)
-
-        trade_describe = describe_trade(trade_detail_col)
-        trade_info_col[col] = trade_describe
-
-    trade_info_col = pd.DataFrame(trade_info_col)
-    trade_detail = pd.concat(trade_detail).reset_index(drop=True)
+    trade_detail = extract_trades(returns, signal, day_count=day_count, comm=comm).to_frame()
+    trade_info_col = describe_trade_by_symbol(trade_detail, returns.columns)
 
     trade_describe = describe_trade(trade_detail)
     cols_n = len([i for i in trade_describe.index if (not i.startswith('long') and not i.startswith('short'))])
@@ -690,37 +636,45 @@ def get_trade_info(returns, signal, day_count=23, comm=3e-4):
         }
     )
 
-    return trade_info.T, trade_info_col.T, trade_detail
+    return trade_info.T, trade_info_col, trade_detail
 
 
 def describe_trade(trade_detail):
-    desc = pd.Series(dtype=float)
-    desc.loc['trade_count'] = len(trade_detail)
-    desc.loc['trade_win_rate'] = (trade_detail['PnL'] > 0).mean()
-    desc.loc['avg_pnl'] = trade_detail['PnL'].mean()
-    desc.loc['mid_pnl'] = trade_detail['PnL'].median()
-    desc.loc['avg_hp'] = trade_detail['HP'].mean()
-    desc.loc['mid_hp'] = trade_detail['HP'].median()
-
-    loc = trade_detail['Direction'] == 1
-    tmp = trade_detail[loc]
-    desc.loc['long_trade_count'] = len(tmp)
-    desc.loc['long_trade_win_rate'] = (tmp['PnL'] > 0).mean()
-    desc.loc['long_avg_pnl'] = tmp['PnL'].mean()
-    desc.loc['long_mid_pnl'] = tmp['PnL'].median()
-    desc.loc['long_avg_hp'] = tmp['HP'].mean()
-    desc.loc['long_mid_hp'] = tmp['HP'].median()
-
-    loc = trade_detail['Direction'] == -1
-    tmp = trade_detail[loc]
-    desc.loc['short_trade_count'] = len(tmp)
-    desc.loc['short_trade_win_rate'] = (tmp['PnL'] > 0).mean()
-    desc.loc['short_avg_pnl'] = tmp['PnL'].mean()
-    desc.loc['short_mid_pnl'] = tmp['PnL'].median()
-    desc.loc['short_avg_hp'] = tmp['HP'].mean()
-    desc.loc['short_mid_hp'] = tmp['HP'].median()
-
-    return desc
+    desc = {}
+    for prefix, loc in (('', slice(None)), ('long_', trade_detail['Direction'] == 1), ('short_', trade_detail['Direction'] == -1)):
+        pnl = trade_detail.loc[loc, 'PnL']
+        hp = trade_detail.loc[loc, 'HP']
+
+        desc[f'{prefix}trade_count'] = len(pnl)
+        desc[f'{prefix}trade_win_rate'] = (pnl > 0).mean()
+        desc[f'{prefix}avg_pnl'] = pnl.mean()
+        desc[f'{prefix}mid_pnl'] = pnl.median()
+        desc[f'{prefix}avg_hp'] = hp.mean()
+        desc[f'{prefix}mid_hp'] = hp.median()
+
+    return pd.Series(desc, dtype=float)
+
+
+def describe_trade_by_symbol(trade_detail, symbols=None):
+    """按品种一次性计算 describe_trade, index 为品种, 没有交易的品种 trade_count 为 0, 其余为 nan"""
+    detail = trade_detail.assign(win=trade_detail['PnL'] > 0)
+    symbols = pd.unique(detail['symbol']) if symbols is None else symbols
+
+    desc = []
+    for prefix, loc in (('', slice(None)), ('long_', detail['Direction'] == 1), ('short_', detail['Direction'] == -1)):
+        tmp = detail.loc[loc].groupby('symbol').agg(
+            trade_count=('PnL', 'size'),
+            trade_win_rate=('win', 'mean'),
+            avg_pnl=('PnL', 'mean'),
+            mid_pnl=('PnL', 'median'),
+            avg_hp=('HP', 'mean'),
+            mid_hp=('HP', 'median'),
+        ).reindex(symbols)
+
+        tmp['trade_count'] = tmp['trade_count'].fillna(0)
+        desc.append(tmp.astype(float).add_prefix(prefix))
+
+    return pd.concat(desc, axis=1)
 
 
 def signal_to_opensignal(signal_):
@@ -795,153 +749,31 @@ def infer_day_count(quote):
 def exit_w_trace_exit(open_signal, close, stoploss, max_hp):
     # Exit with fix holding period ONLY
     # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+    # 止损幅度为 (1 - k / max_hp) * stoploss * 开仓价, k 为持仓 bar 数
 
-    os_np = open_signal.values
-    os_exit_np = np.empty_like(os_np)
-    os_exit_np[:] = np.nan
-
-    close_np = close.values
-
-    sequence = 1 - np.arange(len(os_np)) * (1 / max_hp)
+    close_np = _to_kernel_array(close)
+    sequence = 1 - np.arange(len(open_signal)) * (1 / max_hp)
     sequence[sequence < 0] = 0
 
-    for j in range(os_exit_np.shape[1]):
-        signal_ = os_np[:, j]
-        close_ = close_np[:, j]
+    os_exit_np = exit_trace_kernel(_to_kernel_array(open_signal), close_np, close_np, stoploss, sequence, True)
 
-        indices = np.where(~np.isnan(signal_))
-        next_idx = 0
-        for i in indices[0]:
-            current_signal = signal_[i]
-
-            # if current_signal == 0:
-            #     # close by signal
-            #     open_signal_exit.iat[i, j] = 0
-            #     next_idx = i + 1
-            #     continue
-
-            # if current_signal * last_signal >= 0 and i < next_idx:
-            #     continue
-
-            # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
-            if i < next_idx:
-                continue
-
-            if current_signal > 0:
-                c = bn.push(close_[i:])
-                move_max_ = np.maximum.accumulate(c)
-
-                loc = np.isnan(close_[i:])
-                move_max_[loc] = np.nan
-
-                # move_max_ = pd.Series(close_[i:]).expanding().max()
-
-                close_idx = np.argmax((move_max_ - close_[i:]) > sequence[:len(move_max_)] * stoploss * close_[i])
-
-                # last_signal = current_signal
-                os_exit_np[i, j] = current_signal
-
-            elif current_signal < 0:
-                c = bn.push(close_[i:])
-                move_min_ = np.minimum.accumulate(c)
-
-                loc = np.isnan(close_[i:])
-                move_min_[loc] = np.nan
-                # move_min_pd = pd.Series(close_[i:]).expanding().min()
-
-                close_idx = np.argmax((close_[i:] - move_min_) > sequence[:len(move_min_)] * stoploss * close_[i])
-
-                # last_signal = current_signal
-                os_exit_np[i, j] = current_signal
-
-            else:
-                # nan sig
-                close_idx = 0
-
-            if close_idx:
-                os_exit_np[i + close_idx, j] = 0
-                next_idx = i + close_idx + 1
-
-    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
-
-    return open_signal_exit
+    return _to_exit_frame(os_exit_np, open_signal)
 
 
 def exit_w_trace_atr_exit(open_signal, close, atr, atr_multiplier, max_hp):
     # Exit with fix holding period ONLY
     # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+    # 止损幅度为 (1 - k / max_hp) * atr_multiplier * 当前 atr, k 为持仓 bar 数
 
-    os_np = open_signal.values
-    os_exit_np = np.empty_like(os_np)
-    os_exit_np[:] = np.nan
-
-    close_np = close.values
-    atr_np = atr.values
-
-    sequence = 1 - np.arange(len(os_np)) * (1 / max_hp)
+    close_np = _to_kernel_array(close)
+    sequence = 1 - np.arange(len(open_signal)) * (1 / max_hp)
     sequence[sequence < 0] = 0
 
-    for j in range(os_exit_np.shape[1]):
-        signal_ = os_np[:, j]
-        close_ = close_np[:, j]
-        atr_ = atr_np[:, j]
-
-        indices = np.where(~np.isnan(signal_))
-        next_idx = 0
-        for i in indices[0]:
-            current_signal = signal_[i]
-
-            # if current_signal == 0:
-            #     # close by signal
-            #     open_signal_exit.iat[i, j] = 0
-            #     next_idx = i + 1
-            #     continue
-
-            # if current_signal * last_signal >= 0 and i < next_idx:
-            #     continue
-
-            # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
-            if i < next_idx:
-                continue
-
-            if current_signal > 0:
-                c = bn.push(close_[i:])
-                move_max_ = np.maximum.accumulate(c)
-
-                loc = np.isnan(close_[i:])
-                move_max_[loc] = np.nan
-
-                # move_max_ = pd.Series(close_[i:]).expanding().max()
-
-                close_idx = np.argmax((move_max_ - close_[i:]) > sequence[:len(move_max_)] * atr_multiplier * atr_[i:])
-
-                # last_signal = current_signal
-                os_exit_np[i, j] = current_signal
-
-            elif current_signal < 0:
-                c = bn.push(close_[i:])
-                move_min_ = np.minimum.accumulate(c)
-
-                loc = np.isnan(close_[i:])
-                move_min_[loc] = np.nan
-                # move_min_pd = pd.Series(close_[i:]).expanding().min()
-
-                close_idx = np.argmax((close_[i:] - move_min_) > sequence[:len(move_min_)] * atr_multiplier * atr_[i:])
-
-                # last_signal = current_signal
-                os_exit_np[i, j] = current_signal
-
-            else:
-                # nan sig
-                close_idx = 0
-
-            if close_idx:
-                os_exit_np[i + close_idx, j] = 0
-                next_idx = i + close_idx + 1
-
-    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
+    os_exit_np = exit_trace_kernel(
+        _to_kernel_array(open_signal), close_np, _to_kernel_array(atr), atr_multiplier, sequence, False
+    )
 
-    return open_signal_exit
+    return _to_exit_frame(os_exit_np, open_signal)
 
 
 def exit_w_atr_exit(open_signal, close, atr, atr_multiplier, max_hp=None):
@@ -957,106 +789,20 @@ def exit_w_atr_barrier(
         max_hp=None
 ):
     # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+    # max_hp 按非 nan 的 bar 计数, 剩余 bar 不足 max_hp 时该列之后的信号全部忽略
+
+    os_exit_np = exit_atr_barrier_kernel(
+        _to_kernel_array(open_signal),
+        _to_kernel_array(close),
+        _to_kernel_array(atr),
+        np.nan if takeprofit_multiplier is None else takeprofit_multiplier,
+        np.nan if stoploss_multiplier is None else stoploss_multiplier,
+        takeprofit_multiplier is not None,
+        stoploss_multiplier is not None,
+        int(max_hp) if max_hp else 0,
+    )
 
-    os_np = open_signal.values
-    os_exit_np = np.empty_like(os_np)
-    os_exit_np[:] = np.nan
-
-    close_np = close.values
-    atr_np = atr.values
-
-    for j in range(os_exit_np.shape[1]):
-        signal_ = os_np[:, j]
-        close_ = close_np[:, j]
-        atr_ = atr_np[:, j]
-
-        indices = np.where(~np.isnan(signal_))
-        next_idx = 0
-        try:
-            for i in indices[0]:
-                current_signal = signal_[i]
-
-                # if current_signal == 0:
-                #     # close by signal
-                #     open_signal_exit.iat[i, j] = 0
-                #     next_idx = i + 1
-                #     continue
-
-                # if current_signal * last_signal >= 0 and i < next_idx:
-                #     continue
-
-                # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
-                if i < next_idx:
-                    continue
-
-                if current_signal > 0:
-                    os_exit_np[i, j] = current_signal
-
-                    c = bn.push(close_[i:])
-                    move_max_ = np.maximum.accumulate(c)
-
-                    loc = np.isnan(close_[i:])
-                    move_max_[loc] = np.nan
-
-                    # move_max_ = pd.Series(close_[i:]).expanding().max()
-                    loc = np.full_like(move_max_, False, dtype=bool)
-                    if takeprofit_multiplier is not None:
-                        loc |= (close_[i:] - c[0]) > takeprofit_multiplier * atr_[i:]
-
-                    if stoploss_multiplier is not None:
-                        loc |= (move_max_ - close_[i:]) > stoploss_multiplier * atr_[i:]
-
-                    if max_hp:
-                        non_nan_indices = np.where(~np.isnan(close_[i:]))[0]
-                        idx_max_hp = non_nan_indices[max_hp]
-
-                        loc[idx_max_hp] = True  # max hp in bar
-
-                        # loc[max_hp] = True  # max hp in day
-
-                    close_idx = np.argmax(loc)
-
-                elif current_signal < 0:
-                    os_exit_np[i, j] = current_signal
-
-                    c = bn.push(close_[i:])
-                    move_min_ = np.minimum.accumulate(c)
-
-                    loc = np.isnan(close_[i:])
-                    move_min_[loc] = np.nan
-                    # move_min_pd = pd.Series(close_[i:]).expanding().min()
-
-                    loc = np.full_like(move_min_, False, dtype=bool)
-                    if takeprofit_multiplier is not None:
-                        loc |= (c[0] - close_[i:]) > takeprofit_multiplier * atr_[i:]
-
-                    if stoploss_multiplier is not None:
-                        loc |= (close_[i:] - move_min_) > stoploss_multiplier * atr_[i:]
-
-                    if max_hp:
-                        non_nan_indices = np.where(~np.isnan(close_[i:]))[0]
-                        idx_max_hp = non_nan_indices[max_hp]
-
-                        loc[idx_max_hp] = True  # max hp in bar
-
-                        # loc[max_hp] = True  # max hp in day
-
-                    close_idx = np.argmax(loc)
-
-                else:
-                    # nan sig
-                    close_idx = 0
-
-                if close_idx:
-                    os_exit_np[i + close_idx, j] = 0
-                    next_idx = i + close_idx + 1
-
-        except IndexError:
-            continue
-
-    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
-
-    return open_signal_exit
+    return _to_exit_frame(os_exit_np, open_signal)
 
 
 def exit_w_loss_barrier(
@@ -1067,94 +813,19 @@ def exit_w_loss_barrier(
         max_hp=None
 ):
     # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+    # max_hp 按 bar 计数, 剩余 bar 不足 max_hp 时该列之后的信号全部忽略
+
+    os_exit_np = exit_loss_barrier_kernel(
+        _to_kernel_array(open_signal),
+        _to_kernel_array(close),
+        np.nan if takeprofit is None else takeprofit,
+        np.nan if stoploss is None else stoploss,
+        takeprofit is not None,
+        stoploss is not None,
+        int(max_hp) if max_hp else 0,
+    )
 
-    os_np = open_signal.values
-    os_exit_np = np.empty_like(os_np)
-    os_exit_np[:] = np.nan
-
-    close_np = close.values
-
-    for j in range(os_exit_np.shape[1]):
-        signal_ = os_np[:, j]
-        close_ = close_np[:, j]
-
-        indices = np.where(~np.isnan(signal_))
-        next_idx = 0
-        try:
-            for i in indices[0]:
-                current_signal = signal_[i]
-
-                # if current_signal == 0:
-                #     # close by signal
-                #     open_signal_exit.iat[i, j] = 0
-                #     next_idx = i + 1
-                #     continue
-
-                # if current_signal * last_signal >= 0 and i < next_idx:
-                #     continue
-
-                # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
-                if i < next_idx:
-                    continue
-
-                if current_signal > 0:
-                    os_exit_np[i, j] = current_signal
-
-                    c = bn.push(close_[i:])
-                    move_max_ = np.maximum.accumulate(c)
-
-                    loc = np.isnan(close_[i:])
-                    move_max_[loc] = np.nan
-
-                    # move_max_ = pd.Series(close_[i:]).expanding().max()
-                    loc = np.full_like(move_max_, False, dtype=bool)
-                    if takeprofit is not None:
-                        loc |= (close_[i:] / c[0] - 1) > takeprofit
-
-                    if stoploss is not None:
-                        loc |= (close_[i:] / move_max_ - 1) < -stoploss
-
-                    if max_hp:
-                        loc[max_hp] = True
-
-                    close_idx = np.argmax(loc)
-
-                elif current_signal < 0:
-                    os_exit_np[i, j] = current_signal
-
-                    c = bn.push(close_[i:])
-                    move_min_ = np.minimum.accumulate(c)
-
-                    loc = np.isnan(close_[i:])
-                    move_min_[loc] = np.nan
-                    # move_min_pd = pd.Series(close_[i:]).expanding().min()
-
-                    loc = np.full_like(move_min_, False, dtype=bool)
-                    if takeprofit is not None:
-                        loc |= (close_[i:] / c[0] - 1) < -takeprofit
-
-                    if stoploss is not None:
-                        loc |= (close_[i:] / move_min_ - 1) > stoploss
-
-                    if max_hp:
-                        loc[max_hp] = True
-
-                    close_idx = np.argmax(loc)
-
-                else:
-                    # nan sig
-                    close_idx = 0
-
-                if close_idx:
-                    os_exit_np[i + close_idx, j] = 0
-                    next_idx = i + close_idx + 1
-
-        except IndexError:
-            continue
-
-    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
-
-    return open_signal_exit
+    return _to_exit_frame(os_exit_np, open_signal)
 
 
 def exit_w_loss_exit(
@@ -1166,6 +837,17 @@ def exit_w_loss_exit(
     return exit_w_loss_barrier(open_signal, close, None, stoploss, max_hp)
 
 
+def _to_kernel_array(df) -> np.ndarray:
+    # 按列存储, 核函数逐列扫描时内存连续
+    return np.asfortranarray(np.asarray(df, dtype=np.float64))
+
+
+def _to_exit_frame(os_exit_np: np.ndarray, open_signal: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        os_exit_np.astype(open_signal.values.dtype, copy=False), index=open_signal.index, columns=open_signal.columns
+    )
+
+
 def exit_w_max_hp(open_signal, max_hp):
     open_signal_exit = open_signal.copy()
 
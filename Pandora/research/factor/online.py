@@ -0,0 +1,259 @@
+"""
+    因子的流式计算: 每个品种保存 O(window) 的状态(滚动和, EWM 状态, 单调队列的最高/最低价), 逐根 bar 更新,
+    每根新 bar 的耗时与历史长度无关. 各算子的口径与 pandas / talib 的批量计算一致, 见 FeatureTemplate.partial_transform
+"""
+import math
+from collections import deque
+from typing import Tuple
+
+import numpy as np
+
+
+class OnlineState:
+    """
+        单个品种的流式因子状态
+
+        columns 为 update 依次需要的行情列名(与 BarData 的属性名一致), update 返回新 bar 上的因子值
+    """
+    columns: Tuple[str, ...] = ()
+
+    def update(self, *values: float) -> float:
+        raise NotImplementedError()
+
+
+def divide(a: float, b: float) -> float:
+    """同 numpy 的除法, 除数为 0 时为 inf / nan"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / b)
+
+
+def log_ret(price: float, prev: float) -> float:
+    """同 Panel.log_ret: np.log(1 + (price / prev - 1))"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.log(1 + (np.float64(price) / prev - 1)))
+
+
+class RollingExtremum:
+    """同 rolling(window).max() / min(), 单调队列, 窗口内非 nan 的个数不足 window 时为 nan"""
+
+    def __init__(self, window: int, is_max: bool = True):
+        self.window = window
+        self.is_max = is_max
+        self.queue = deque()
+        self.valid = deque()
+        self.i = 0
+
+    def update(self, value: float) -> float:
+        i = self.i
+        self.i += 1
+
+        if self.valid and self.valid[0] <= i - self.window:
+            self.valid.popleft()
+        while self.queue and self.queue[0][0] <= i - self.window:
+            self.queue.popleft()
+
+        if value == value:
+            self.valid.append(i)
+            queue = self.queue
+            if self.is_max:
+                while queue and queue[-1][1] <= value:
+                    queue.pop()
+            else:
+                while queue and queue[-1][1] >= value:
+                    queue.pop()
+            queue.append((i, value))
+
+        return self.queue[0][1] if len(self.valid) >= self.window else math.nan
+
+
+class EWMMean:
+    """同 ewm(span, adjust=True, ignore_na=False).mean(), 按 pandas 的递推顺序计算"""
+
+    def __init__(self, span: float):
+        self.old_wt_factor = 1. - 2. / (span + 1.)
+        self.weighted = math.nan
+        self.old_wt = 1.
+
+    def update(self, value: float) -> float:
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if value == value:
+                if self.weighted != value:
+                    self.weighted = (self.old_wt * self.weighted + value) / (self.old_wt + 1.)
+                self.old_wt += 1.
+
+        elif value == value:
+            self.weighted = value
+
+        return self.weighted
+
+
+class RollingMoments:
+    """
+        窗口内非 nan 值的 1~3 阶原点矩之和, 用于 rolling var / std / skew / corr,
+        var 另按 pandas 的 Welford 递推(先删后加)计算, 与 rolling().var() 逐位一致;
+        并记录窗口末尾连续相同值的个数(窗口内全部相同时 pandas 的 var 为 0, skew 为 0)
+    """
+
+    def __init__(self, window: int, order: int = 2, min_periods: int = None):
+        self.window = window
+        self.order = order
+        self.min_periods = window if min_periods is None else min_periods
+        self.values = deque()
+        self.nobs = 0
+        self.sums = [0.] * (order + 1)
+        self.mean = self.ssqdm = self.compensation = 0.
+        self.prev = math.nan
+        self.same = 0
+
+    def update(self, value: float):
+        values = self.values
+        if len(values) == self.window:
+            self._add(values.popleft(), -1)
+
+        values.append(value)
+        self._add(value, 1)
+
+        if value == value:
+            self.same = self.same + 1 if value == self.prev else 1
+            self.prev = value
+
+    def _add(self, value: float, sign: int):
+        if value != value:
+            return
+
+        self.nobs += sign
+        power = 1.
+        for k in range(1, self.order + 1):
+            power *= value
+            self.sums[k] += sign * power
+
+        if not self.nobs:
+            self.sums = [0.] * (self.order + 1)
+            self.mean = self.ssqdm = 0.
+            return
+
+        prev_mean = self.mean - self.compensation
+        y = value - self.compensation
+        t = y - self.mean
+        self.compensation = t + self.mean - y
+        self.mean += sign * t / self.nobs
+        self.ssqdm += sign * (value - prev_mean) * (value - self.mean)
+
+    def var(self, ddof: int = 1) -> float:
+        n = self.nobs
+        if n < self.min_periods or n <= ddof:
+            return math.nan
+        if n == 1 or self.same >= n:
+            return 0.
+
+        return max(self.ssqdm / (n - ddof), 0.)
+
+    def std(self, ddof: int = 1) -> float:
+        return math.sqrt(self.var(ddof))
+
+    def skew(self) -> float:
+        n = self.nobs
+        if n < self.min_periods or n < 3:
+            return math.nan
+        if self.same >= n:
+            return 0.
+
+        a = self.sums[1] / n
+        b = self.sums[2] / n - a * a
+        c = self.sums[3] / n - a * a * a - 3 * a * b
+        if b <= 1e-14:
+            return math.nan
+
+        r = math.sqrt(b)
+        return math.sqrt(n * (n - 1.)) * c / ((n - 2) * r * r * r)
+
+
+class RollingCorr:
+    """同 x.rolling(window).corr(y), 只计入 x, y 都不为 nan 的 bar"""
+
+    def __init__(self, window: int):
+        self.x = RollingMoments(window, min_periods=0)
+        self.y = RollingMoments(window, min_periods=0)
+        self.xy = RollingMoments(window, order=1)
+
+    def update(self, x: float, y: float) -> float:
+        if x != x or y != y:
+            x = y = math.nan
+
+        self.x.update(x)
+        self.y.update(y)
+        self.xy.update(x * y)
+
+        n = self.xy.nobs
+        if n < self.xy.min_periods:
+            return math.nan
+
+        cov = (self.xy.sums[1] / n - self.x.sums[1] / n * self.y.sums[1] / n) * (n / (n - 1.))
+        denom = math.sqrt(self.x.var() * self.y.var())
+
+        return divide(cov, denom)
+
+
+class EMA:
+    """同 talib.EMA: 先以前 period 个值的均值为初值, 之后按 k = 2 / (period + 1) 递推"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.k = 2. / (period + 1)
+        self.seed = []
+        self.value = math.nan
+
+    def update(self, value: float) -> float:
+        if self.seed is not None:
+            self.seed.append(value)
+            if len(self.seed) < self.period:
+                return math.nan
+
+            total = 0.
+            for v in self.seed:
+                total += v
+            self.value = total / self.period
+            self.seed = None
+
+            return self.value
+
+        self.value = (value - self.value) * self.k + self.value
+
+        return self.value
+
+
+class MACDHist:
+    """
+        同 talib.MACD(close, fast, slow, signal)[2]:
+            快慢线都从第 slow 根 bar 开始计算, 快线以第 slow - fast + 1 ~ slow 根 bar 的均值为初值
+    """
+
+    def __init__(self, fast: int, slow: int, signal: int):
+        if slow < fast:
+            fast, slow = slow, fast
+
+        self.fast_period = fast
+        self.slow_period = slow
+        self.prices = deque(maxlen=slow)
+        self.fast = self.slow = None
+        self.signal = EMA(signal)
+
+    def update(self, value: float) -> float:
+        if self.slow is None:
+            self.prices.append(value)
+            if len(self.prices) < self.slow_period:
+                return math.nan
+
+            self.fast, self.slow = EMA(self.fast_period), EMA(self.slow_period)
+            prices = list(self.prices)
+            for v in prices[:-self.fast_period]:
+                self.slow.update(v)
+            for v in prices[-self.fast_period:]:
+                fast, slow = self.fast.update(v), self.slow.update(v)
+            self.prices.clear()
+        else:
+            fast, slow = self.fast.update(value), self.slow.update(value)
+
+        macd = fast - slow
+        return macd - self.signal.update(macd)
@@ -0,0 +1,227 @@
+import logging
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class IntermediateStore:
+    """
+        中间结果的 LRU 缓存, 总字节数超过 max_bytes 时淘汰最久未使用的结果, 记录命中率
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        :param max_bytes: 缓存上限, None 为不限
+        """
+        self.max_bytes = max_bytes
+        self.data = OrderedDict()
+        self.nbytes = 0
+        self.peak_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, func: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+
+        self.misses += 1
+        value = func()
+        size = int(value.memory_usage(index=False).sum())
+
+        if self.max_bytes is not None:
+            while self.data and self.nbytes + size > self.max_bytes:
+                _, old = self.data.popitem(last=False)
+                self.nbytes -= int(old.memory_usage(index=False).sum())
+                self.evictions += 1
+
+            if size > self.max_bytes:
+                return value
+
+        self.data[key] = value
+        self.nbytes += size
+        self.peak_bytes = max(self.peak_bytes, self.nbytes)
+
+        return value
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else np.nan
+
+    def clear(self):
+        self.data.clear()
+        self.nbytes = 0
+
+
+_active_cache: ContextVar[Optional["FactorCache"]] = ContextVar("factor_cache", default=None)
+
+
+class FactorCache:
+    """
+        多个因子共用的中间结果缓存, 作用域为 with 块, eg:
+            with FactorCache(max_bytes=2 * 1024 ** 3):
+                union.transform(X)
+
+        块内对同一个 X 的 PanelFeatureTemplate 共用一个 Panel, 收益率, 滚动高低点, STM 等中间结果
+        按 (列, 运算, 窗口) 只计算一次. 退出时记录命中率并释放.
+        FeatureUnion(n_jobs>1) 时各进程的缓存互不共享.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = 1 << 30):
+        """
+        :param max_bytes: 中间结果的内存上限(字节), 不含 Panel 的索引
+        """
+        self.store = IntermediateStore(max_bytes)
+        self.panels = {}
+        self._token = None
+
+    def __enter__(self):
+        self._token = _active_cache.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _active_cache.reset(self._token)
+        store = self.store
+        logger.info(
+            "factor cache: %d hits, %d misses, hit rate %.1f%%, %d evictions, peak %.1f MB",
+            store.hits, store.misses, store.hit_rate * 100, store.evictions, store.peak_bytes / 1024 ** 2
+        )
+        self.panels.clear()
+        store.clear()
+
+    @staticmethod
+    def active() -> Optional["FactorCache"]:
+        return _active_cache.get()
+
+    def panel(self, X: pd.DataFrame, col_datetime: str, col_symbol: str) -> "Panel":
+        key = (id(X), col_datetime, col_symbol)
+        panel = self.panels.get(key)
+        if panel is None or panel.X is not X:
+            panel = Panel(X, col_datetime, col_symbol, store=self.store)
+            self.panels[key] = panel
+
+        return panel
+
+
+class Panel:
+    """
+        (datetime, symbol) 索引的行情按品种展开为 (bar, 品种) 的二维数组, 只做一次:
+            第 j 列依次存放第 j 个品种的 bar(按 X 中的先后顺序), 末尾以 nan 补齐,
+            因此按列的 rolling / shift / ewm 与逐品种 groupby 后的计算结果完全一致.
+
+        scatter 把同形状的结果一次写回 X 的行顺序; 需要按日期对齐的截面计算用 to_wide / from_wide.
+        列面板与 log_ret / rolling / cached 得到的中间结果都存放在 store 中, 是共用的对象, 不要原地修改.
+    """
+
+    def __init__(
+            self,
+            X: pd.DataFrame,
+            col_datetime: str = "datetime",
+            col_symbol: str = "symbol",
+            store: IntermediateStore = None,
+    ):
+        """
+        :param X: 以 (datetime, symbol) 为索引的行情
+        :param store: 中间结果缓存, 为空时新建(只在本 Panel 内共用)
+        """
+        self.X = X
+        self.index = X.index
+
+        codes, self.symbols = pd.factorize(X.index.get_level_values(col_symbol), sort=True)
+        dt_codes, self.datetimes = pd.factorize(X.index.get_level_values(col_datetime), sort=True)
+
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(self.symbols))
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+
+        if np.any((np.diff(dt_codes[order]) <= 0) & (np.diff(codes[order]) == 0)):
+            raise ValueError("datetime must be increasing within each symbol")
+
+        self.col = codes
+        self.row = np.empty(len(X), np.int64)
+        self.row[order] = np.arange(len(X)) - starts[codes[order]]
+        self.dt_code = dt_codes
+        self.lengths = counts
+        self.shape = (int(counts.max(initial=0)), len(self.symbols))
+
+        self.store = IntermediateStore() if store is None else store
+
+    @classmethod
+    def of(cls, X: pd.DataFrame, col_datetime: str = "datetime", col_symbol: str = "symbol") -> "Panel":
+        """在 FactorCache 块内时取共用的 Panel, 否则新建"""
+        cache = FactorCache.active()
+        if cache is None:
+            return cls(X, col_datetime, col_symbol)
+
+        return cache.panel(X, col_datetime, col_symbol)
+
+    def cached(self, key: tuple, func: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+            按 key 缓存中间结果, key 一般为 (列, 运算, 窗口, ...)
+
+        :param func: 无参数, 返回与面板同形状的 DataFrame
+        """
+        return self.store.get((id(self),) + key, func)
+
+    def __getitem__(self, column: str) -> pd.DataFrame:
+        """X 中一列的面板, columns 为品种"""
+        return self.cached((column,), lambda: self.pack(self.X[column].to_numpy(dtype=np.float64)))
+
+    def log_ret(self, column: str, periods=1) -> pd.DataFrame:
+        """同 np.log(1 + Series.pct_change(periods))"""
+        return self.cached((column, 'log_ret', periods), lambda: np.log(1 + self.pct_change(self[column], periods)))
+
+    def rolling(self, column: str, op: str, window: int, min_periods: int = None) -> pd.DataFrame:
+        """列面板的滚动统计, op 为 rolling 对象的方法名, 如 max, min, mean, std, sum"""
+        return self.cached(
+            (column, op, window, min_periods),
+            lambda: getattr(self[column].rolling(window, min_periods=min_periods), op)()
+        )
+
+    def pack(self, values: np.ndarray) -> pd.DataFrame:
+        """X 行顺序的一维数组展开为面板"""
+        out = np.full(self.shape, np.nan)
+        out[self.row, self.col] = values
+
+        return pd.DataFrame(out, columns=self.symbols)
+
+    def scatter(self, panel) -> np.ndarray:
+        """面板写回 X 的行顺序"""
+        return np.asarray(panel, dtype=np.float64)[self.row, self.col]
+
+    def to_wide(self, panel) -> pd.DataFrame:
+        """面板按日期对齐, index 为所有品种的 datetime 的并集"""
+        out = np.full((len(self.datetimes), len(self.symbols)), np.nan)
+        out[self.dt_code, self.col] = self.scatter(panel)
+
+        return pd.DataFrame(out, index=self.datetimes, columns=self.symbols)
+
+    def from_wide(self, wide) -> pd.DataFrame:
+        """to_wide 的逆操作, 取回各品种自身的 bar"""
+        return self.pack(np.asarray(wide, dtype=np.float64)[self.dt_code, self.col])
+
+    def apply(self, func, *panels) -> pd.DataFrame:
+        """
+            逐品种调用只接受一维数组的函数(如 talib), 每次传入各面板中该品种的有效部分
+
+        :param func: (*一维数组) -> 等长的一维数组
+        """
+        out = np.full(self.shape, np.nan)
+        for j, n in enumerate(self.lengths):
+            args = [np.ascontiguousarray(np.asarray(p, dtype=np.float64)[:n, j]) for p in panels]
+            out[:n, j] = func(*args)
+
+        return pd.DataFrame(out, columns=self.symbols)
+
+    @staticmethod
+    def pct_change(panel: pd.DataFrame, periods=1) -> pd.DataFrame:
+        """同 Series.pct_change, 面板末尾的 nan 不做前值填充"""
+        return panel / panel.shift(periods) - 1
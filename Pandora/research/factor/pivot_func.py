@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 import talib
 
+from Pandora.research.factor.price_volume.mks import mks
+
 
 def get_mks_factor(quote, param):
     feat = {}
@@ -20,26 +22,6 @@ def get_mks_factor(quote, param):
     return pd.DataFrame(feat)
 
 
-def mks(A: np.ndarray, n: int, imax: int = 0):
-    df = pd.Series(A)
-
-    f = pd.Series(0, index=df.index)
-    denom = 0
-    for i in range(1, n):
-
-        if imax and i > imax:
-            break
-
-        chg = np.sign(df.pct_change(i))
-        f += chg.fillna(0).rolling(n - i).sum()
-
-        denom += n - i
-
-    f = f / denom
-
-    return f
-
-
 def get_atr_factor(quote, param):
     feat = {}
 
@@ -1,33 +1,45 @@
+from collections import deque
+
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.online import OnlineState, RollingCorr, log_ret
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class ACF(FeatureTemplate):
+class ACF(PanelFeatureTemplate):
     def __init__(self, window: int, lag: int = 1):
         self.window = window
         self.lag = lag
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        r = panel.log_ret(self.col_close)
+
+        f = r.rolling(self.window).corr(r.shift(self.lag))
 
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
+        return f.replace([np.inf, -np.inf], 0)
 
-            assert group.index.is_monotonic_increasing
+    def online_state(self) -> OnlineState:
+        return ACFState(self.window, self.lag, self.col_close)
 
-            r = np.log(1 + group[self.col_close].pct_change())
+    def get_feature_names_out(self, input_features=None):
+        estimator_name = self.__class__.__name__
+        return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
 
-            f = r.rolling(self.window).corr(r.shift(self.lag))
 
-            feat.loc[group.index] = f
+class ACFState(OnlineState):
+    def __init__(self, window: int, lag: int, col_close: str):
+        self.columns = (col_close,)
+        self.prev = np.nan
+        self.rets = deque([np.nan] * lag, maxlen=lag)
+        self.corr = RollingCorr(window)
 
-        feat = feat.replace([np.inf, -np.inf], 0)
+    def update(self, close: float) -> float:
+        r = log_ret(close, self.prev)
+        self.prev = close
 
-        return feat.values
+        f = self.corr.update(r, self.rets[0])
+        self.rets.append(r)
 
-    def get_feature_names_out(self, input_features=None):
-        estimator_name = self.__class__.__name__
-        return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
+        return 0. if np.isinf(f) else f
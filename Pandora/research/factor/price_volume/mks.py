@@ -1,49 +1,74 @@
+from collections import deque
+
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.online import OnlineState
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
+from Pandora.research.rolling import rolling_mks
 
 
-class MKS(FeatureTemplate):
+class MKS(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
-
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
-
-            assert group.index.is_monotonic_increasing
-
-            A = group[self.col_close]
-            f = pd.Series(mks(A, self.window), index=group.index)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        return rolling_mks(panel[self.col_close], self.window)
 
-            feat.loc[group.index] = f
-
-        return feat.values
+    def online_state(self) -> OnlineState:
+        return MKSState(self.window, col_close=self.col_close)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
 
 
-def mks(A: np.ndarray, n: int, imax: int = 0):
+def mks(A: np.ndarray, n: int, imax: int = 0) -> pd.Series:
+    """滚动 Mann-Kendall 得分, 见 rolling_mks"""
     df = pd.Series(A)
 
-    f = pd.Series(0, index=df.index)
-    denom = 0
-    for i in range(1, n):
-
-        if imax and i > imax:
-            break
+    return pd.Series(rolling_mks(df.to_numpy(dtype=np.float64), n, imax), index=df.index)
 
-        chg = np.sign(df.pct_change(i))
-        f += chg.fillna(0).rolling(n - i).sum()
 
-        denom += n - i
+class MKSState(OnlineState):
+    """
+        mks 的流式状态: 窗口内两两价格比较的符号之和(Mann-Kendall S), 新 bar 进入与旧 bar 离开时各 O(window) 更新,
+        nan 按前值填充
+    """
 
-    f = f / denom
-
-    return f
+    def __init__(self, window: int, imax: int = 0, col_close: str = 'close_price'):
+        self.columns = (col_close,)
+        self.window = window
+        self.lag = min(imax, window - 1) if imax else window - 1
+        self.denom = sum(window - i for i in range(1, self.lag + 1))
+        self.prices = deque(maxlen=window)
+        self.s = 0
+        self.count = 0
+
+    @staticmethod
+    def sign(a: float, b: float) -> int:
+        """sign(a / b - 1), nan 为 0"""
+        chg = a / b - 1 if b else np.nan
+        return int(chg > 0) - int(chg < 0)
+
+    def update(self, close: float) -> float:
+        prices = self.prices
+        if len(prices) == self.window:
+            # 最早的 bar 离开窗口
+            oldest = prices[0]
+            for k in range(1, self.lag + 1):
+                self.s -= self.sign(prices[k], oldest)
+
+        if close != close and prices:
+            close = prices[-1]
+        prices.append(float(close))
+        n = len(prices)
+        for j in range(max(n - 1 - self.lag, 0), n - 1):
+            self.s += self.sign(close, prices[j])
+
+        self.count += 1
+        if self.count < self.window - 1:
+            return np.nan
+
+        return self.s / self.denom
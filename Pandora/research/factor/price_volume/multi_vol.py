@@ -1,61 +1,94 @@
+import numba as nb
 import numpy as np
 import pandas as pd
 
-from joblib import Parallel, delayed
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
 
+@nb.njit(cache=True)
+def _r2(log_close, t, q):
+    """log(close[t] / close[t - q]) ** 2, t < q 时为 nan"""
+    if t < q:
+        return np.nan
+    r = log_close[t] - log_close[t - q]
+    return r * r
 
-def _get_factor(group, param, col_close):
-    assert group.index.is_monotonic_increasing
 
-    v_1 = None
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def multi_vol_kernel(close, param):
+    """
+        各间隔 q = 1 ~ param - 1 的抽样方差比之和:
+            v_q = mean(r2_q[t], r2_q[t - q], ..., 共 (param - 1) // q + 1 个) * (param / q - 1), r2_q = log(close / close.shift(q)) ** 2
+            f = sum(v_q) / v_1 / param - 1
+        同一间隔的抽样和按 t mod q 分链递推(加入 r2_q[t], 去掉 r2_q[t - K * q]), 每条链每 K 步重新求和一次以免误差累积,
+        每根 bar O(param). 最近 param 个 r2_q 中有 nan 时 v_q 为 nan(同 rolling(param).apply)
 
-    f = pd.Series(0, index=group.index)
+    :param close: (bar, 列), 价格须为正, 对数收益按 log(close[t]) - log(close[t - q]) 计算
+    :return: (bar, 列)
+    """
+    n, n_col = close.shape
+    out = np.full((n_col, n), np.nan).T
 
+    # 间隔 q 的 q 条链的抽样和存放在 acc[offset[q]: offset[q] + q]
+    offset = np.zeros(param + 1, np.int64)
     for q in range(1, param):
-        r2 = np.square(np.log(group[col_close] / group[col_close].shift(q)))
-
-        idx = range(param - 1, -1, -q)
-        n = param / q - 1
-
-        v_q = r2.rolling(window=param).apply(lambda x: np.mean(x[idx]) * n, raw=True)
-
-        if q == 1:
-            v_1 = v_q
-
-        f += v_q
-
-    f = f / v_1 / param
-
-    f = f - 1
-
-    return f
-
-
-class MultiVol(FeatureTemplate):
+        offset[q + 1] = offset[q] + q
+
+    for j in nb.prange(n_col):
+        c = np.log(close[:, j])
+        acc = np.zeros(offset[param])
+        last_nan = np.arange(param) - 1
+
+        for t in range(n):
+            f = 0.
+            v_1 = np.nan
+            for q in range(1, param):
+                k = (param - 1) // q + 1
+                r2 = _r2(c, t, q)
+                if np.isnan(r2):
+                    last_nan[q] = t
+
+                i = offset[q] + t % q
+                if (t // q) % k == 0:
+                    s = 0.
+                    for m in range(k):
+                        v = _r2(c, t - m * q, q)
+                        if not np.isnan(v):
+                            s += v
+                    acc[i] = s
+                else:
+                    if not np.isnan(r2):
+                        acc[i] += r2
+                    v = _r2(c, t - k * q, q)
+                    if not np.isnan(v):
+                        acc[i] -= v
+
+                v_q = acc[i] / k * (param / q - 1) if t - last_nan[q] >= param else np.nan
+                if q == 1:
+                    v_1 = v_q
+                f += v_q
+
+            out[t, j] = f / v_1 / param - 1
+
+    return out
+
+
+class MultiVol(PanelFeatureTemplate):
     def __init__(self, window: int, n_jobs=-1):
+        """
+        :param n_jobs: 保留以兼容, 品种间由 multi_vol_kernel 并行计算
+        """
         self.window = window
         self.n_jobs = n_jobs
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
-
-        param = self.window
-        feat = pd.Series(index=X.index)
-
-        results = Parallel(n_jobs=self.n_jobs)(  # n_jobs=-1 表示使用所有CPU核心
-            delayed(_get_factor)(group, param, self.col_close)
-            for code, group in X.groupby(self.col_symbol)
-        )
-
-        for f in results:
-            feat.loc[f.index] = f
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        close = np.asfortranarray(panel[self.col_close].to_numpy(dtype=np.float64))
+        f = multi_vol_kernel(close, self.window)
 
-        feat = feat.replace([np.inf, -np.inf], 0)
+        f[np.isinf(f)] = 0
 
-        return feat.values
+        return pd.DataFrame(f, columns=panel.symbols)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
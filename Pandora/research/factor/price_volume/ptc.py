@@ -1,49 +1,59 @@
 import numpy as np
 import pandas as pd
 import talib
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
 
+from Pandora.research.factor.online import MACDHist, OnlineState, RollingMoments, divide
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.price_volume.stm import STMState, get_stm
+from Pandora.research.factor.template import PanelFeatureTemplate
 
-class PTC(FeatureTemplate):
+
+class PTC(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
-
+    def get_periods(self):
         fast = self.window
-        slow = int(fast * 26 / 12)
-        signal = int(fast * 9 / 12)
-
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
+        return fast, int(fast * 26 / 12), int(fast * 9 / 12)
 
-            assert group.index.is_monotonic_increasing
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        fast, slow, signal = self.get_periods()
 
-            hh = group.loc[:, self.col_high].rolling(self.window).max()
-            ll = group.loc[:, self.col_low].rolling(self.window).min()
-            a = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+        a = get_stm(panel, self.window, self.col_high, self.col_low, self.col_close)
 
-            (dif,
-             dea,
-             bar) = talib.MACD(group.loc[:, self.col_close],
-                               fastperiod=fast,
-                               slowperiod=slow,
-                               signalperiod=signal
-                               )
+        bar = panel.apply(
+            lambda close: talib.MACD(close, fastperiod=fast, slowperiod=slow, signalperiod=signal)[2],
+            panel[self.col_close]
+        )
 
-            std = group.loc[:, self.col_close].rolling(window=fast).std()
+        std = panel.rolling(self.col_close, 'std', fast)
 
-            bar = bar / std
+        bar = bar / std
+        bar[std == 0] = 0
 
-            loc = std == 0
-            bar[loc] = 0
+        return a - bar
 
-            feat.loc[group.index] = a - bar
-
-        return feat.values
+    def online_state(self) -> OnlineState:
+        return PTCState(*self.get_periods(), self.col_high, self.col_low, self.col_close)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
+
+
+class PTCState(OnlineState):
+    def __init__(self, fast: int, slow: int, signal: int, col_high: str, col_low: str, col_close: str):
+        self.columns = (col_high, col_low, col_close)
+        self.stm = STMState(fast, col_high, col_low, col_close)
+        self.macd = MACDHist(fast, slow, signal)
+        self.moments = RollingMoments(fast)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        a = self.stm.update(high, low, close)
+        hist = self.macd.update(close)
+
+        self.moments.update(close)
+        std = self.moments.std()
+        bar = 0. if std == 0 else divide(hist, std)
+
+        return a - bar
@@ -1,27 +1,18 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class Ret(FeatureTemplate):
+class Ret(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        r = panel.log_ret(self.col_close)
 
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
-
-            assert group.index.is_monotonic_increasing
-
-            f = np.log(1 + group[self.col_close].pct_change()).rolling(self.window).sum()
-
-            feat.loc[group.index] = f
-
-        return feat.values
+        return r.rolling(self.window).sum()
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
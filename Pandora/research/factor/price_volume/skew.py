@@ -1,30 +1,36 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.online import OnlineState, RollingMoments, log_ret
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class Skew(FeatureTemplate):
+class Skew(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        r = panel.log_ret(self.col_close)
 
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
+        return r.rolling(self.window).skew()
 
-            assert group.index.is_monotonic_increasing
-
-            r = np.log(1 + group[self.col_close].pct_change())
-
-            f = r.rolling(self.window).skew()
-            feat.loc[group.index] = f
-
-        return feat.values
+    def online_state(self) -> OnlineState:
+        return SkewState(self.window, self.col_close)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
 
+
+class SkewState(OnlineState):
+    def __init__(self, window: int, col_close: str):
+        self.columns = (col_close,)
+        self.prev = np.nan
+        self.moments = RollingMoments(window, order=3)
+
+    def update(self, close: float) -> float:
+        self.moments.update(log_ret(close, self.prev))
+        self.prev = close
+
+        return self.moments.skew()
@@ -1,30 +1,48 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.online import EWMMean, OnlineState, RollingExtremum, divide
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class STM(FeatureTemplate):
+class STM(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        return get_stm(panel, self.window, self.col_high, self.col_low, self.col_close)
 
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
+    def online_state(self) -> OnlineState:
+        return STMState(self.window, self.col_high, self.col_low, self.col_close)
 
-            assert group.index.is_monotonic_increasing
+    def get_feature_names_out(self, input_features=None):
+        estimator_name = self.__class__.__name__
+        return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
 
-            hh = group.loc[:, self.col_high].rolling(self.window).max()
-            ll = group.loc[:, self.col_low].rolling(self.window).min()
-            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
 
-            feat.loc[group.index] = f
+def get_stm(panel: Panel, window: int, col_high: str, col_low: str, col_close: str) -> pd.DataFrame:
+    """STM 面板, 在 FactorCache 中按窗口缓存, 供 STMTsSTM / STMCsSTM / PTC 共用"""
+    def _calc():
+        hh = panel.rolling(col_high, 'max', window)
+        ll = panel.rolling(col_low, 'min', window)
+        return ((panel[col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
 
-        return feat.values
+    return panel.cached((col_high, col_low, col_close, 'stm', window), _calc)
 
-    def get_feature_names_out(self, input_features=None):
-        estimator_name = self.__class__.__name__
-        return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
+
+class STMState(OnlineState):
+    """STM 的流式状态: 单调队列的最高/最低价与分子分母的 EWM"""
+
+    def __init__(self, window: int, col_high: str, col_low: str, col_close: str):
+        self.columns = (col_high, col_low, col_close)
+        self.hh = RollingExtremum(window)
+        self.ll = RollingExtremum(window, is_max=False)
+        self.num = EWMMean(5)
+        self.denom = EWMMean(5)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        hh = self.hh.update(high)
+        ll = self.ll.update(low)
+
+        return divide(self.num.update(close * 2 - (hh + ll)), self.denom.update(hh - ll))
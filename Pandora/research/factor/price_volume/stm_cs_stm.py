@@ -1,41 +1,27 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.price_volume.stm import get_stm
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class STMCsSTM(FeatureTemplate):
+class STMCsSTM(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        f = get_stm(panel, self.window, self.col_high, self.col_low, self.col_close)
 
-        ret = pd.Series(index=X.index)
-        feat = {}
-        for code, group in X.groupby(self.col_symbol):
-
-            assert group.index.is_monotonic_increasing
-
-            hh = group.loc[:, self.col_high].rolling(self.window).max()
-            ll = group.loc[:, self.col_low].rolling(self.window).min()
-            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
-
-            feat[code] = f.reset_index(self.col_symbol, drop=True)
-
-        feat = pd.DataFrame(feat)
+        # 截面标准化按日期对齐
+        feat = panel.to_wide(f)
 
         hh = feat.ffill().max(axis=1)
         ll = feat.ffill().min(axis=1)
 
         feat = ((feat * 2).sub(hh + ll, axis=0).div(hh - ll, axis=0) + 1) / 2
 
-        feat_name = self.get_feature_names_out()[0]
-        f = feat.melt(ignore_index=False, var_name=self.col_symbol, value_name=feat_name).set_index(self.col_symbol, append=True)[feat_name]
-        ret.loc[X.index] = f.loc[X.index]
-
-        return ret.values
+        return panel.from_wide(feat)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
@@ -1,34 +1,22 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.price_volume.stm import get_stm
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class STMTsSTM(FeatureTemplate):
+class STMTsSTM(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        f = get_stm(panel, self.window, self.col_high, self.col_low, self.col_close)
 
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
+        hh = f.rolling(self.window).max()
+        ll = f.rolling(self.window).min()
 
-            assert group.index.is_monotonic_increasing
-
-            hh = group.loc[:, self.col_high].rolling(self.window).max()
-            ll = group.loc[:, self.col_low].rolling(self.window).min()
-            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
-
-            hh = f.rolling(self.window).max()
-            ll = f.rolling(self.window).min()
-
-            f = (f * 2 - (hh + ll)) / (hh - ll)
-
-            feat.loc[group.index] = f
-
-        return feat.values
+        return (f * 2 - (hh + ll)) / (hh - ll)
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
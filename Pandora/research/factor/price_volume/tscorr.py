@@ -1,37 +1,35 @@
 import numpy as np
 import pandas as pd
 import talib
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index, rolling_rank
 
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
+from Pandora.research.factor.utils import rolling_rank
 
-class TSCorr(FeatureTemplate):
+
+class TSCorr(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
-
-        feat = pd.Series(index=X.index)
-        for code, data in X.groupby(self.col_symbol):
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        rolling_ret = self.window
+        rolling_vol = rolling_ret * 4
+        rank_window = rolling_ret
 
-            assert data.index.is_monotonic_increasing
+        close = panel[self.col_close]
+        volume = panel[self.col_volume]
+        relative_close = close / panel.rolling(self.col_close, 'mean', rolling_ret, min_periods=1)
+        relative_vol = (volume / panel.rolling(self.col_volume, 'mean', rolling_vol, min_periods=1)).fillna(0)
 
-            rolling_ret = self.window
-            rolling_vol = rolling_ret * 4
-            rank_window = rolling_ret
-            relative_close = data.loc[:, self.col_close] / data.loc[:, self.col_close].rolling(rolling_ret, min_periods=1).mean()
-            relative_vol = (data.loc[:, self.col_volume] / data.loc[:, self.col_volume].rolling(rolling_vol, min_periods=1).mean()).fillna(0)
-        
-            corr = talib.CORREL(relative_close, relative_vol, timeperiod=rank_window)
-        
-            rank = rolling_rank(data.loc[:, self.col_volume], rank_window, pct=True)
-            # rank = data.loc[:, self.col_volume].rolling(rank_window, min_periods=1).apply(lambda x: x.rank(pct=True).iat[-1])
-            f = corr * rank
+        corr = panel.apply(lambda c, v: talib.CORREL(c, v, timeperiod=rank_window), relative_close, relative_vol)
 
-            feat.loc[data.index] = f
+        # rolling_rank 去掉 nan 后计算, 按位置还原
+        rank = panel.apply(
+            lambda v: rolling_rank(pd.Series(v), rank_window, pct=True).reindex(range(len(v))).to_numpy(), volume
+        )
+        # rank = data.loc[:, self.col_volume].rolling(rank_window, min_periods=1).apply(lambda x: x.rank(pct=True).iat[-1])
 
-        return feat.values
+        return corr * rank
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
@@ -1,38 +1,27 @@
 import numpy as np
 import pandas as pd
 
-from Pandora.research.factor.template import FeatureTemplate
-from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.template import PanelFeatureTemplate
 
 
-class WilliamLowerShadowStd(FeatureTemplate):
+class WilliamLowerShadowStd(PanelFeatureTemplate):
     def __init__(self, window: int):
         self.window = window
 
-    def transform(self, X: pd.DataFrame) -> np.ndarray:
-        check_multi_index(X, self.col_datetime, self.col_symbol)
-
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
         param = self.window
-        feat = pd.Series(index=X.index)
-        for code, group in X.groupby(self.col_symbol):
-
-            assert group.index.is_monotonic_increasing
-
-            ll = group[self.col_low].rolling(param).min()
-            f = (ll - group[self.col_close])
 
-            fma = f.rolling(param).std()
+        ll = panel.rolling(self.col_low, 'min', param)
+        f = (ll - panel[self.col_close])
 
-            f = f / fma
+        fma = f.rolling(param).std()
 
-            loc = fma == 0
-            f[loc] = 0
+        f = f / fma
+        f[fma == 0] = 0
 
-            feat.loc[group.index] = f * -1
-
-        return feat.values
+        return f * -1
 
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}'])
-
@@ -1,8 +1,15 @@
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
 import pandas as pd
 
 from sklearn.base import BaseEstimator
 from sklearn.base import TransformerMixin
 
+from Pandora.research.factor.online import OnlineState
+from Pandora.research.factor.panel import Panel
+from Pandora.research.factor.utils import check_multi_index
+
 
 class FeatureTemplate(BaseEstimator, TransformerMixin):
     col_datetime = "datetime"
@@ -30,6 +37,73 @@ class FeatureTemplate(BaseEstimator, TransformerMixin):
         """
         raise NotImplementedError()
 
+    def online_state(self) -> OnlineState:
+        """单个品种的流式状态, 支持流式计算的因子需要实现"""
+        raise NotImplementedError(f"{self.__class__.__name__} does not support partial_transform")
+
+    def partial_transform(self, X: pd.DataFrame) -> np.ndarray:
+        """
+            流式计算: 只输入新 bar, 每个品种保存 O(window) 的状态, 结果与对全部历史调用 transform 一致. eg:
+                for bars in new_bars:
+                    feat = factor.partial_transform(bars)
+
+        :param X: 以(datetime, symbol)为索引的新 bar, 同一品种的 datetime 须晚于之前输入的 bar
+        :return: 与 X 的行对齐的因子值
+        """
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        if not hasattr(self, 'online_states_'):
+            self.online_states_ = {}
+            self.online_last_ = {}
+
+        datetimes = X.index.get_level_values(self.col_datetime)
+        symbols = X.index.get_level_values(self.col_symbol)
+        columns = {}
+
+        feat = np.full(len(X), np.nan)
+        for i, (dt, symbol) in enumerate(zip(datetimes, symbols)):
+            state = self.online_states_.get(symbol)
+            if state is None:
+                state = self.online_states_[symbol] = self.online_state()
+
+            last = self.online_last_.get(symbol)
+            if last is not None and dt <= last:
+                raise ValueError(f"{symbol} bar at {dt} is not after {last}")
+            self.online_last_[symbol] = dt
+
+            values = []
+            for col in state.columns:
+                if col not in columns:
+                    columns[col] = X[col].to_numpy(dtype=np.float64)
+                values.append(columns[col][i])
+
+            feat[i] = state.update(*values)
+
+        return feat
+
+    def reset_online(self):
+        """清空 partial_transform 的状态"""
+        self.__dict__.pop('online_states_', None)
+        self.__dict__.pop('online_last_', None)
+
+
+class PanelFeatureTemplate(FeatureTemplate):
+    """
+        按面板计算的因子: X 一次展开为 (bar, 品种) 的 Panel, 子类在 transform_panel 中对整个面板按列计算,
+        返回同形状的结果, 由 transform 一次写回 X 的行顺序, 不再逐品种 groupby 与按索引赋值.
+        在 FactorCache 块内时同一个 X 上的因子共用 Panel 及其中间结果
+    """
+
+    def transform(self, X: pd.DataFrame):
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        panel = Panel.of(X, self.col_datetime, self.col_symbol)
+
+        return panel.scatter(self.transform_panel(panel))
+
+    def transform_panel(self, panel: Panel) -> pd.DataFrame:
+        raise NotImplementedError()
+
 
 class TickFeatureTemplate(FeatureTemplate):
     col_close = 'last_price'
@@ -42,3 +116,45 @@ class TickFeatureTemplate(FeatureTemplate):
 
     window_multiplier = 23 * 3 * 5 * 60 * 2
 
+    def warmup_ticks(self) -> int:
+        """增量计算时每个symbol需要保留的历史tick数, 默认只依赖上一笔(shift)"""
+        return 1
+
+    def warmup_tail(self, data: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """增量计算时每个symbol保留的历史tick, 默认为最后 warmup_ticks 笔, 依赖的bar数固定时可按时间戳选取"""
+        n_warmup = self.warmup_ticks()
+        return data.iloc[-n_warmup:] if n_warmup > 0 else None
+
+    def transform_iter(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+            逐块计算因子, 结果与对全量数据调用 transform 一致, 内存只与单块大小及 warmup_tail 相关.
+            每块只包含一个symbol, 同一symbol的块按时间先后给出, 块的边界落在交易日之间. eg:
+                chunks = (df.set_index(['datetime', 'symbol']) for df in api.iter_ticks(...))
+                feat = pd.concat(factor.transform_iter(chunks))
+
+        :param chunks: 以(datetime, symbol)为索引的tick
+        :return: 每块对应的因子值
+        """
+        freq = pd.Timedelta(seconds=self.freq.seconds)
+
+        tails, last_labels = {}, {}
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+
+            symbol = chunk.index.get_level_values(self.col_symbol)[0]
+            tail = tails.get(symbol)
+            data = chunk if tail is None else pd.concat([tail, chunk])
+
+            feat = self.transform(data)
+
+            # 去掉历史tick所在的bar, 这部分已在之前的块中输出
+            last_label = last_labels.get(symbol)
+            if last_label is not None:
+                feat = feat[feat.index.get_level_values(self.col_datetime) > last_label]
+
+            last_tick = chunk.index.get_level_values(self.col_datetime)[-1]
+            last_labels[symbol] = last_tick.ceil(freq) - freq
+            tails[symbol] = self.warmup_tail(data)
+
+            yield feat
@@ -5,6 +5,7 @@ from joblib import Parallel, delayed
 from Pandora.constant import Frequency
 from Pandora.research.factor.template import TickFeatureTemplate
 from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.rolling import rolling_quantile
 
 
 def get_factor(tick, window, volume_window, quantile, freq):
@@ -49,7 +50,7 @@ class BVE(TickFeatureTemplate):
             assert data.index.is_monotonic_increasing
 
             r = np.log(data[self.col_close] / data[self.col_close].shift(window)).shift(-window)
-            loc1 = (data[self.col_volume] > data[self.col_volume].rolling(volume_window, min_periods=1).quantile(qtl))
+            loc1 = (data[self.col_volume] > rolling_quantile(data[self.col_volume], volume_window, qtl, min_periods=1))
             bvr = (loc1 * r).shift(window)
 
             f_agg = bvr.resample(self.freq.to_str(), level=self.col_datetime, closed='right', label='left').agg(
@@ -67,6 +68,9 @@ class BVE(TickFeatureTemplate):
 
         return pd.DataFrame({feat_name: pd.concat(feat)})
 
+    def warmup_ticks(self) -> int:
+        return int(self.volume_window * self.window_multiplier) + self.window
+
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}_{self.volume_window}D'])
@@ -67,6 +67,20 @@ class CPV(TickFeatureTemplate):
 
         return pd.DataFrame({feat_name: pd.concat(feat)})
 
+    def warmup_tail(self, data: pd.DataFrame) -> pd.DataFrame:
+        """滚动窗口按有效bar(多于1笔tick)计, 按时间戳保留最后 window 根有效bar所在的tick, 与成交的疏密无关"""
+        window = max(int(self.window * 23 * 3), 1)
+        freq = pd.Timedelta(seconds=self.freq.seconds)
+
+        # 与 transform 中 resample(closed='right', label='left') 的标签一致
+        labels = data.index.get_level_values(self.col_datetime).ceil(freq) - freq
+        counts = labels.value_counts()
+        valid = counts.index[counts > 1].sort_values()
+        if len(valid) < window:
+            return data
+
+        return data[labels >= valid[-window]]
+
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}D'])
@@ -5,6 +5,7 @@ from joblib import Parallel, delayed
 from Pandora.constant import Frequency
 from Pandora.research.factor.template import TickFeatureTemplate
 from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.rolling import rolling_quantile
 
 
 def get_factor(tick, volume_window, quantile, freq):
@@ -48,8 +49,9 @@ class LSR(TickFeatureTemplate):
         for symbol, data in X.groupby(level=self.col_symbol):
             assert data.index.is_monotonic_increasing
 
-            loc1 = (data[self.col_close] > data[self.col_bid_price].shift()) & (data[self.col_volume] > data[self.col_volume].rolling(volume_window, min_periods=1).quantile(qtl))
-            loc2 = (data[self.col_close] < data[self.col_ask_price].shift()) & (data[self.col_volume] > data[self.col_volume].rolling(volume_window, min_periods=1).quantile(qtl))
+            large = data[self.col_volume] > rolling_quantile(data[self.col_volume], volume_window, qtl, min_periods=1)
+            loc1 = (data[self.col_close] > data[self.col_bid_price].shift()) & large
+            loc2 = (data[self.col_close] < data[self.col_ask_price].shift()) & large
 
             data['long_vol'] = loc1 * data[self.col_volume]
             data['short_vol'] = loc2 * data[self.col_volume]
@@ -77,6 +79,9 @@ class LSR(TickFeatureTemplate):
 
         return pd.DataFrame({feat_name: pd.concat(feat)})
 
+    def warmup_ticks(self) -> int:
+        return int(self.volume_window * self.window_multiplier)
+
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.volume_window}D'])
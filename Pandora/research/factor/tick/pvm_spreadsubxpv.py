@@ -5,6 +5,7 @@ from joblib import Parallel, delayed
 from Pandora.constant import Frequency
 from Pandora.research.factor.template import TickFeatureTemplate
 from Pandora.research.factor.utils import check_multi_index
+from Pandora.research.rolling import rolling_quantile
 
 
 def get_factor(tick, window, quantile, freq):
@@ -50,7 +51,7 @@ class PVMSpreadSubXPV(TickFeatureTemplate):
 
             spread = np.log(data[self.col_ask_price] / data[self.col_bid_price])
 
-            loc1 = (spread > spread.rolling(window, min_periods=1).quantile(qtl))
+            loc1 = (spread > rolling_quantile(spread, window, qtl, min_periods=1))
 
             mid_price = data[self.col_close].mask(~loc1, np.nan).ffill()
             pvm = np.log(data[self.col_close] / mid_price)
@@ -80,6 +81,9 @@ class PVMSpreadSubXPV(TickFeatureTemplate):
 
         return pd.DataFrame({feat_name: pd.concat(feat)})
 
+    def warmup_ticks(self) -> int:
+        return int(self.window * self.window_multiplier)
+
     def get_feature_names_out(self, input_features=None):
         estimator_name = self.__class__.__name__
         return np.asarray([f'{self.prefix}{estimator_name}_{self.window}D'])
@@ -1,6 +1,8 @@
 import numpy as np
 import pandas as pd
 
+from Pandora.research.rolling import rolling_rank as _rolling_rank
+
 
 def check_multi_index(df, col_dt, col_symbol):
     assert (
@@ -20,8 +22,14 @@ def check_dt_index(df, col_dt):
 
 
 def rolling_rank(series: pd.Series, window: int, min_periods: int = None, pct=True, n_group :int = None):
+    """
+        去掉 nan 后, 当前值在最近 window 个值中的排名(小于等于当前值的个数), 前 min_periods(默认 window) 个为 nan
+
+    :param pct: 排名 / window
+    :param n_group: 分为 n_group 组时的组号
+    """
     tmp = series.dropna()
-    count = sum(tmp.shift(n).le(tmp) for n in range(window))
+    count = _rolling_rank(tmp, window, min_periods=1, ties='max', norm=None)
 
     if min_periods:
         count.iloc[:min_periods] = np.nan
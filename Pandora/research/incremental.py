@@ -0,0 +1,330 @@
+# -*- coding:utf-8 -*-
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+
+from Pandora.data_manager.quote_cache import QuoteCache
+from Pandora.helper.config import Envs
+from Pandora.research import kernels
+from Pandora.research.backtest import COMMISSION, override_bar_ret
+
+
+@dataclass
+class ExitRule:
+    """增量回测的平仓规则, 对应 exit_w_loss_barrier / exit_w_atr_barrier / exit_w_trace_exit / exit_w_trace_atr_exit"""
+    mode: int
+    takeprofit: Optional[float] = None
+    stoploss: Optional[float] = None
+    max_hp: int = 0
+
+    @classmethod
+    def loss_barrier(cls, takeprofit=None, stoploss=None, max_hp=None) -> "ExitRule":
+        return cls(kernels.EXIT_LOSS_BARRIER, takeprofit, stoploss, max_hp or 0)
+
+    @classmethod
+    def atr_barrier(cls, takeprofit_multiplier=None, stoploss_multiplier=None, max_hp=None) -> "ExitRule":
+        return cls(kernels.EXIT_ATR_BARRIER, takeprofit_multiplier, stoploss_multiplier, max_hp or 0)
+
+    @classmethod
+    def trace(cls, stoploss, max_hp) -> "ExitRule":
+        return cls(kernels.EXIT_TRACE, None, stoploss, max_hp)
+
+    @classmethod
+    def trace_atr(cls, atr_multiplier, max_hp) -> "ExitRule":
+        return cls(kernels.EXIT_TRACE_ATR, None, atr_multiplier, max_hp)
+
+    @property
+    def use_atr(self) -> bool:
+        return self.mode in (kernels.EXIT_ATR_BARRIER, kernels.EXIT_TRACE_ATR)
+
+    def apply(self, open_signal: np.ndarray, close: np.ndarray, atr: Optional[np.ndarray], state: np.ndarray):
+        """在新 bar 上应用平仓规则, state 为 (品种, kernels.N_EXIT_STATE) 的状态数组, 原地更新"""
+        if self.max_hp < 0:
+            raise ValueError("max_hp must be non-negative in incremental mode")
+
+        if self.mode in (kernels.EXIT_TRACE, kernels.EXIT_TRACE_ATR) and not self.max_hp:
+            raise ValueError("trace exits require max_hp")
+
+        scale = atr if self.use_atr else close
+        return kernels.exit_step_kernel(
+            np.asarray(open_signal, dtype=np.float64),
+            np.asarray(close, dtype=np.float64),
+            np.asarray(scale, dtype=np.float64),
+            self.mode,
+            np.nan if self.takeprofit is None else self.takeprofit,
+            np.nan if self.stoploss is None else self.stoploss,
+            self.takeprofit is not None,
+            self.stoploss is not None,
+            int(self.max_hp),
+            state,
+        )
+
+
+@dataclass
+class BacktestState:
+    """增量回测的日终状态, 数组按 symbols 的顺序排列"""
+    last_datetime: Optional[pd.Timestamp] = None
+    symbols: List[str] = field(default_factory=list)
+    position: np.ndarray = field(default_factory=lambda: np.array([]))
+    exit_state: np.ndarray = field(default_factory=lambda: np.zeros((0, kernels.N_EXIT_STATE)))
+    # 每个品种最后一根 bar, 收益要等到下一根 bar 的收盘价才能结算: symbol, datetime, close, position, commission
+    pending: pd.DataFrame = None
+    # 还有待结算 bar 的日期上已经结算的收益
+    day_sums: Dict[pd.Timestamp, float] = field(default_factory=dict)
+    # 最近 lookback 根 bar 的行情
+    history: pd.DataFrame = None
+
+    def add_symbols(self, symbols: List[str]):
+        new = [s for s in symbols if s not in set(self.symbols)]
+        if new:
+            self.symbols = self.symbols + new
+            self.position = np.r_[self.position, np.full(len(new), np.nan)]
+            self.exit_state = np.vstack([self.exit_state, np.zeros((len(new), kernels.N_EXIT_STATE))])
+
+
+class IncrementalBacktest:
+    """
+        按回测ID保存日终状态的增量回测, 每次只计算上次之后的新 bar, 输出需要 upsert 的日收益与成交:
+            {root}/{backtest_id}/state.json       持仓, 平仓规则状态(开仓价, 移动最高/最低价, 持仓 bar 数), 待结算的 bar
+            {root}/{backtest_id}/history.parquet  最近 lookback 根 bar 的行情
+
+        收益口径与 backtest_factor(open_signal, weight, get_bar_ret(quote)) 一致, 日期为 bar 的自然日.
+        每根 bar 的收益要等到下一根 bar 的收盘价才能结算, 所以每次运行会重写上次最后一天的收益.
+
+        信号/权重/atr 函数在 历史尾部 + 新 bar 上重新计算, 只取新 bar 的结果, 因此必须是因果的(不使用未来数据),
+        且只依赖最近 lookback 根 bar(不小于最长的滚动窗口).
+        平仓规则逐 bar 推进, 持仓期间忽略信号; 历史末尾尚未平仓的持仓与 exit_w_* 的处理不同, 见 kernels.exit_step_kernel.
+    """
+    file_state = "state.json"
+    file_history = "history.parquet"
+
+    def __init__(
+            self,
+            backtest_id: str,
+            signal_func: Callable[[pd.DataFrame], Union[pd.DataFrame, np.ndarray]],
+            lookback: int,
+            weight_func: Callable[[pd.DataFrame], Union[pd.DataFrame, np.ndarray]] = None,
+            atr_func: Callable[[pd.DataFrame], Union[pd.DataFrame, np.ndarray]] = None,
+            exit_rule: ExitRule = None,
+            comm=COMMISSION,
+            root: Union[str, os.PathLike] = None,
+    ):
+        """
+        :param backtest_id: 回测ID
+        :param signal_func: quote -> 开仓信号矩阵(datetime * symbol), quote 格式同 get_quote 的 quote_bt
+        :param lookback: 保留的历史 bar 数
+        :param weight_func: quote -> 权重矩阵, 为空时权重为 1
+        :param atr_func: quote -> atr 矩阵, atr 类平仓规则需要
+        :param exit_rule: 平仓规则, 为空时只按信号换仓
+        :param comm: 单边手续费率
+        :param root: 状态目录, 默认 ~/.Pandora/Backtest
+        """
+        if exit_rule is not None and exit_rule.use_atr and atr_func is None:
+            raise ValueError("atr_func is required by the exit rule")
+
+        self.backtest_id = backtest_id
+        self.signal_func = signal_func
+        self.lookback = lookback
+        self.weight_func = weight_func
+        self.atr_func = atr_func
+        self.exit_rule = exit_rule
+        self.comm = comm
+        self.path = (Path(root) if root else Envs.DIR_CONF_ROOT / "Backtest") / str(backtest_id)
+
+        self.state = self.load_state()
+
+    def run(self, quote: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+            计算 quote 中上次运行之后的 bar, 并保存状态
+
+        :param quote: 行情, index 为 datetime, 至少包含 symbol, close_price 以及信号函数需要的列
+        :return: (ret, trade)
+                 ret: BackTestID, DateTime, Ret, 本次新增或更新的日收益
+                 trade: BackTestID, DateTime, Ticker, Qty, Price, 本次新增的调仓
+        """
+        state = self.state
+        quote = quote.sort_index(kind='stable')
+        if state.last_datetime is not None:
+            quote = quote[quote.index > state.last_datetime]
+
+        if quote.empty:
+            return self.empty_ret(), self.empty_trade()
+
+        history = quote if state.history is None else pd.concat([state.history, quote])
+        close = history.pivot(columns='symbol', values='close_price')
+        state.add_symbols(sorted(close.columns))
+        close = close.reindex(columns=state.symbols)
+
+        rows = slice(None) if state.last_datetime is None else close.index > state.last_datetime
+        index = close.index[rows]
+        close_new = close.loc[rows].to_numpy()
+
+        open_signal = self.to_matrix(self.signal_func(history), close)[rows]
+        if self.exit_rule is not None:
+            atr = self.to_matrix(self.atr_func(history), close)[rows] if self.exit_rule.use_atr else None
+            open_signal = self.exit_rule.apply(open_signal, close_new, atr, state.exit_state)
+
+        if self.weight_func is not None:
+            open_signal = open_signal * self.to_matrix(self.weight_func(history), close)[rows]
+
+        # 持仓前值填充, 接上次的持仓
+        position = bn.push(np.vstack([state.position[None], open_signal]), axis=0)
+        traded = np.abs(np.diff(np.nan_to_num(position), axis=0))
+        position = position[1:]
+        commission = traded * self.comm
+
+        ret = self.settle(quote, index, position, commission)
+        trade = self.get_trade(index, position, traded, close_new)
+
+        state.last_datetime = index[-1]
+        state.position = position[-1].copy()
+        state.history = history[history.index >= close.index[max(len(close) - self.lookback, 0)]]
+        self.save_state()
+
+        return ret, trade
+
+    def settle(self, quote: pd.DataFrame, index: pd.DatetimeIndex, position, commission) -> pd.DataFrame:
+        """结算新 bar 与上次待结算 bar 的收益, 更新 pending 与 day_sums"""
+        state = self.state
+        col = pd.Index(state.symbols).get_indexer(quote['symbol'])
+        row = index.get_indexer(quote.index)
+
+        cells = pd.DataFrame({
+            'symbol': quote['symbol'].to_numpy(),
+            'datetime': quote.index.to_numpy(),
+            'close': quote['close_price'].to_numpy(dtype=np.float64),
+            'position': position[row, col],
+            'commission': commission[row, col],
+        })
+        if state.pending is not None:
+            cells = pd.concat([state.pending, cells], ignore_index=True)
+
+        cells = cells.sort_values(['symbol', 'datetime'], kind='stable')
+        next_close = cells.groupby('symbol')['close'].shift(-1)
+
+        settled = next_close.notna()
+        state.pending = cells.loc[~settled].reset_index(drop=True)
+
+        cells = cells.loc[settled]
+        ret = override_bar_ret(next_close[settled] / cells['close'] - 1, cells['symbol'], cells['datetime'])
+        pnl = cells['position'] * ret - cells['commission']
+        days = pd.DatetimeIndex(cells['datetime']).normalize()
+        daily = pnl.groupby(days).sum()
+
+        for day, value in state.day_sums.items():
+            if day in daily.index:
+                daily[day] += value
+
+        # 仍有待结算 bar 的日期之后还会更新
+        first_pending = pd.DatetimeIndex(state.pending['datetime']).normalize().min()
+        day_sums = {**state.day_sums, **daily.to_dict()}
+        state.day_sums = {d: v for d, v in day_sums.items() if d >= first_pending}
+
+        return pd.DataFrame({'BackTestID': self.backtest_id, 'DateTime': daily.index, 'Ret': daily.values})
+
+    def get_trade(self, index, position, traded, close) -> pd.DataFrame:
+        row, col = np.nonzero(traded > 0)
+        qty = np.nan_to_num(position[row, col]) - np.nan_to_num(np.vstack([self.state.position[None], position])[row, col])
+
+        return pd.DataFrame({
+            'BackTestID': self.backtest_id,
+            'DateTime': index[row],
+            'Ticker': np.asarray(self.state.symbols, dtype=object)[col],
+            'Qty': qty,
+            'Price': close[row, col],
+        }).sort_values(['DateTime', 'Ticker'], kind='stable', ignore_index=True)
+
+    def save(self, ret: pd.DataFrame, trade: pd.DataFrame, api=None):
+        """upsert 本次的日收益与调仓到 StrategyBacktestRet / StrategyBacktestTrade"""
+        from Pandora.data_manager import FutureDataAPI
+        from Pandora.helper import TDays
+
+        api = api or FutureDataAPI()
+        if not ret.empty:
+            api.save_backtest_ret(ret)
+
+        if not trade.empty:
+            trade = trade.assign(
+                TradeDate=TDays.assign_tdays(trade['DateTime'].to_numpy(dtype='datetime64[ns]')),
+                Contract=trade['Ticker'],
+                Amount=trade['Qty'] * trade['Price'],
+                Portfolio=self.backtest_id,
+            )
+            api.save_backtest_trade(trade)
+
+    def empty_ret(self) -> pd.DataFrame:
+        return pd.DataFrame({'BackTestID': [], 'DateTime': pd.Series(dtype='datetime64[ns]'), 'Ret': []})
+
+    def empty_trade(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            'BackTestID': [], 'DateTime': pd.Series(dtype='datetime64[ns]'), 'Ticker': [], 'Qty': [], 'Price': []
+        })
+
+    @staticmethod
+    def to_matrix(data, close: pd.DataFrame) -> np.ndarray:
+        """信号函数的输出对齐到 close 的 (datetime, symbol)"""
+        if isinstance(data, pd.DataFrame):
+            return data.reindex(index=close.index, columns=close.columns).to_numpy(dtype=np.float64)
+
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape != close.shape:
+            raise ValueError(f"matrix shape {data.shape} does not match quote {close.shape}")
+
+        return data
+
+    def reset(self):
+        """删除保存的状态, 下次从头计算"""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+
+        self.state = BacktestState()
+
+    def load_state(self) -> BacktestState:
+        file = self.path / self.file_state
+        if not file.exists():
+            return BacktestState()
+
+        with open(file, encoding="utf-8") as f:
+            content = json.load(f)
+
+        pending = pd.DataFrame(content['pending'], columns=['symbol', 'datetime', 'close', 'position', 'commission'])
+        pending['datetime'] = pd.to_datetime(pending['datetime'])
+
+        history = self.path / self.file_history
+        return BacktestState(
+            last_datetime=pd.Timestamp(content['last_datetime']),
+            symbols=content['symbols'],
+            position=np.array(content['position'], dtype=np.float64),
+            exit_state=np.array(content['exit_state'], dtype=np.float64).reshape(-1, kernels.N_EXIT_STATE),
+            pending=pending,
+            day_sums={pd.Timestamp(d): v for d, v in content['day_sums'].items()},
+            history=pd.read_parquet(history) if history.exists() else None,
+        )
+
+    def save_state(self):
+        state = self.state
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        pending = state.pending.assign(datetime=state.pending['datetime'].astype(str))
+        content = json.dumps({
+            'last_datetime': str(state.last_datetime),
+            'symbols': state.symbols,
+            'position': state.position.tolist(),
+            'exit_state': state.exit_state.tolist(),
+            'pending': pending.values.tolist(),
+            'day_sums': {str(d.date()): v for d, v in state.day_sums.items()},
+        })
+
+        def _dump(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+
+        QuoteCache.atomic_write(self.path / self.file_history, lambda tmp: state.history.to_parquet(tmp))
+        QuoteCache.atomic_write(self.path / self.file_state, _dump)
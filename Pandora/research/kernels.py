@@ -0,0 +1,408 @@
+# -*- coding:utf-8 -*-
+"""
+    回测中逐列计算(状态机, nan 间断压缩)的 numba 实现, 各列之间并行.
+
+    输入均为 (bar, 品种) 的二维 float64 数组, 输出与 backtest.py 中对应的 numpy 实现逐位一致.
+"""
+import numba as nb
+import numpy as np
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def exit_trace_kernel(signal, close, scale, multiplier, sequence, scale_at_entry):
+    """
+        移动止损: 多头 move_max - close > sequence[k] * multiplier * scale 时平仓, 空头对称
+
+    :param signal: 开仓信号, nan 为无信号
+    :param close: 收盘价
+    :param scale: 止损幅度的基数, 与 close 同形状
+    :param multiplier: 止损倍数
+    :param sequence: 持仓第 k 根 bar 的止损衰减系数
+    :param scale_at_entry: True 时使用开仓 bar 的 scale, 否则使用当前 bar 的 scale
+    """
+    n, n_col = signal.shape
+    out = np.full((n, n_col), np.nan)
+
+    for j in nb.prange(n_col):
+        next_idx = 0
+        for i in range(n):
+            sig = signal[i, j]
+            if np.isnan(sig) or i < next_idx or sig == 0:
+                continue
+
+            out[i, j] = sig
+
+            close_idx = 0
+            move = close[i, j]
+            for k in range(n - i):
+                v = close[i + k, j]
+                if k and not np.isnan(move) and not np.isnan(v):
+                    if sig > 0:
+                        move = move if move >= v else v
+                    else:
+                        move = move if move <= v else v
+
+                if np.isnan(v):
+                    continue
+
+                limit = sequence[k] * multiplier * (scale[i, j] if scale_at_entry else scale[i + k, j])
+                if (move - v if sig > 0 else v - move) > limit:
+                    close_idx = k
+                    break
+
+            if close_idx:
+                out[i + close_idx, j] = 0
+                next_idx = i + close_idx + 1
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def exit_atr_barrier_kernel(signal, close, atr, takeprofit, stoploss, use_takeprofit, use_stoploss, max_hp):
+    """
+        atr 止盈止损, max_hp 按非 nan 的 bar 计数, 剩余 bar 不足 max_hp 时该列之后的信号全部忽略
+
+    :param max_hp: 0 表示不限制持仓周期
+    """
+    n, n_col = signal.shape
+    out = np.full((n, n_col), np.nan)
+
+    for j in nb.prange(n_col):
+        n_valid = np.zeros(n + 1, dtype=np.int64)
+        for i in range(n - 1, -1, -1):
+            n_valid[i] = n_valid[i + 1] + (0 if np.isnan(close[i, j]) else 1)
+
+        next_idx = 0
+        for i in range(n):
+            sig = signal[i, j]
+            if np.isnan(sig) or i < next_idx or sig == 0:
+                continue
+
+            out[i, j] = sig
+
+            target = -1
+            if max_hp:
+                target = max_hp if max_hp > 0 else n_valid[i] + max_hp
+                if target < 0 or target >= n_valid[i]:
+                    break
+
+            close_idx = 0
+            entry = close[i, j]
+            move = entry
+            count = 0
+            for k in range(n - i):
+                v = close[i + k, j]
+                if k and not np.isnan(move) and not np.isnan(v):
+                    if sig > 0:
+                        move = move if move >= v else v
+                    else:
+                        move = move if move <= v else v
+
+                if np.isnan(v):
+                    continue
+
+                hit = count == target
+                count += 1
+
+                a = atr[i + k, j]
+                if use_takeprofit and (v - entry if sig > 0 else entry - v) > takeprofit * a:
+                    hit = True
+
+                if use_stoploss and (move - v if sig > 0 else v - move) > stoploss * a:
+                    hit = True
+
+                if hit:
+                    close_idx = k
+                    break
+
+            if close_idx:
+                out[i + close_idx, j] = 0
+                next_idx = i + close_idx + 1
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def exit_loss_barrier_kernel(signal, close, takeprofit, stoploss, use_takeprofit, use_stoploss, max_hp):
+    """
+        收益率止盈止损, max_hp 按 bar 计数, 剩余 bar 不足 max_hp 时该列之后的信号全部忽略
+
+    :param max_hp: 0 表示不限制持仓周期
+    """
+    n, n_col = signal.shape
+    out = np.full((n, n_col), np.nan)
+
+    for j in nb.prange(n_col):
+        next_idx = 0
+        for i in range(n):
+            sig = signal[i, j]
+            if np.isnan(sig) or i < next_idx or sig == 0:
+                continue
+
+            out[i, j] = sig
+
+            target = -1
+            if max_hp:
+                target = max_hp if max_hp > 0 else n - i + max_hp
+                if target < 0 or target >= n - i:
+                    break
+
+            close_idx = 0
+            entry = close[i, j]
+            move = entry
+            for k in range(n - i):
+                v = close[i + k, j]
+                if k and not np.isnan(move) and not np.isnan(v):
+                    if sig > 0:
+                        move = move if move >= v else v
+                    else:
+                        move = move if move <= v else v
+
+                hit = k == target
+                if not np.isnan(v):
+                    if use_takeprofit:
+                        r = v / entry - 1
+                        if (r > takeprofit) if sig > 0 else (r < -takeprofit):
+                            hit = True
+
+                    if use_stoploss:
+                        r = v / move - 1
+                        if (r < -stoploss) if sig > 0 else (r > stoploss):
+                            hit = True
+
+                if hit:
+                    close_idx = k
+                    break
+
+            if close_idx:
+                out[i + close_idx, j] = 0
+                next_idx = i + close_idx + 1
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True)
+def pack_valid_kernel(values):
+    """
+        每列的非 nan 值依次移到该列顶部, 尾部以 nan 填充, 等价于逐列 dropna.
+        逐列扫描, values 与输出均为列优先(Fortran)存储.
+    """
+    n, n_col = values.shape
+    out = np.full((n_col, n), np.nan).T
+
+    for j in nb.prange(n_col):
+        r = 0
+        for i in range(n):
+            v = values[i, j]
+            if not np.isnan(v):
+                out[r, j] = v
+                r += 1
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True)
+def unpack_valid_kernel(packed, values):
+    """pack_valid_kernel 的逆操作, values 为压缩前的数组, 其 nan 位置输出 nan"""
+    n, n_col = values.shape
+    out = np.full((n_col, n), np.nan).T
+
+    for j in nb.prange(n_col):
+        r = 0
+        for i in range(n):
+            if not np.isnan(values[i, j]):
+                out[i, j] = packed[r, j]
+                r += 1
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True)
+def one_shot_kernel(sig):
+    """只在前值填充后的持仓方向变化处保留信号, 平仓信号(0)保留, 与 np.sign(sig.ffill().diff().fillna(0)) 一致"""
+    n, n_col = sig.shape
+    out = np.full((n_col, n), np.nan).T
+
+    for j in nb.prange(n_col):
+        last = np.nan
+        for i in range(n):
+            s = sig[i, j]
+            if np.isnan(s):
+                continue
+
+            if s == 0:
+                out[i, j] = 0
+            elif not np.isnan(last) and s != last:
+                out[i, j] = 1. if s > last else -1.
+
+            last = s
+
+    return out
+
+
+# exit_step_kernel 的平仓规则与状态列
+EXIT_LOSS_BARRIER, EXIT_ATR_BARRIER, EXIT_TRACE, EXIT_TRACE_ATR = 0, 1, 2, 3
+STATE_ACTIVE, STATE_SIDE, STATE_ENTRY, STATE_MOVE, STATE_BARS, STATE_VALID = range(6)
+N_EXIT_STATE = 6
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def exit_step_kernel(signal, close, scale, mode, takeprofit, stoploss, use_takeprofit, use_stoploss, max_hp, state):
+    """
+        exit_w_* 的逐 bar 前向状态机, 可以在新的行情上接着上一次的状态继续计算(增量回测).
+        持仓期间忽略所有信号, 直至平仓, 与 exit_w_* 的区别仅在历史末尾尚未平仓的持仓:
+        exit_w_* 在其后的信号上重新开仓(或在剩余 bar 不足 max_hp 时忽略该列之后的信号), 这里持续持有.
+
+    :param mode: EXIT_LOSS_BARRIER / EXIT_ATR_BARRIER / EXIT_TRACE / EXIT_TRACE_ATR
+    :param scale: atr 类规则的 atr, EXIT_TRACE 时为 close
+    :param takeprofit: 止盈(收益率或 atr 倍数), 不使用时 use_takeprofit=False
+    :param stoploss: 止损(收益率或 atr 倍数)
+    :param max_hp: 最大持仓 bar 数, 0 表示不限制; EXIT_TRACE* 时为止损衰减到 0 的 bar 数
+    :param state: (列, N_EXIT_STATE) 状态数组, 原地更新, 初始为全 0
+    """
+    n, n_col = signal.shape
+    out = np.full((n, n_col), np.nan)
+
+    for j in nb.prange(n_col):
+        for i in range(n):
+            v = close[i, j]
+
+            if state[j, STATE_ACTIVE]:
+                side = state[j, STATE_SIDE]
+                move = state[j, STATE_MOVE]
+                k = state[j, STATE_BARS] + 1
+                state[j, STATE_BARS] = k
+
+                if not np.isnan(move) and not np.isnan(v):
+                    if side > 0:
+                        move = move if move >= v else v
+                    else:
+                        move = move if move <= v else v
+                    state[j, STATE_MOVE] = move
+
+                entry = state[j, STATE_ENTRY]
+                hit = False
+                if mode == EXIT_LOSS_BARRIER:
+                    hit = max_hp > 0 and k == max_hp
+                    if not np.isnan(v):
+                        r = v / entry - 1
+                        if use_takeprofit and ((r > takeprofit) if side > 0 else (r < -takeprofit)):
+                            hit = True
+
+                        r = v / move - 1
+                        if use_stoploss and ((r < -stoploss) if side > 0 else (r > stoploss)):
+                            hit = True
+
+                elif not np.isnan(v):
+                    if mode == EXIT_ATR_BARRIER:
+                        a = scale[i, j]
+                        hit = max_hp > 0 and state[j, STATE_VALID] == max_hp
+                        state[j, STATE_VALID] += 1
+
+                        if use_takeprofit and (v - entry if side > 0 else entry - v) > takeprofit * a:
+                            hit = True
+
+                        if use_stoploss and (move - v if side > 0 else v - move) > stoploss * a:
+                            hit = True
+
+                    else:
+                        sequence = 1 - k * (1 / max_hp)
+                        sequence = sequence if sequence > 0 else 0.
+                        base = entry if mode == EXIT_TRACE else scale[i, j]
+                        if (move - v if side > 0 else v - move) > sequence * stoploss * base:
+                            hit = True
+
+                if hit:
+                    out[i, j] = 0
+                    state[j, STATE_ACTIVE] = 0
+
+                continue
+
+            sig = signal[i, j]
+            if np.isnan(sig) or sig == 0:
+                continue
+
+            out[i, j] = sig
+            state[j, STATE_ACTIVE] = 1
+            state[j, STATE_SIDE] = sig
+            state[j, STATE_ENTRY] = v
+            state[j, STATE_MOVE] = v
+            state[j, STATE_BARS] = 0
+            state[j, STATE_VALID] = 0 if np.isnan(v) else 1
+
+    return out
+
+
+@nb.njit(cache=True)
+def _add_pair_moments(row, sign, cnt, sx, sxx, sxy):
+    # 一行加入(sign=1)或移出(sign=-1)窗口, sx[i, j] / sxx[i, j] 为 i, j 同时有值的行上 x_i 的和 / 平方和
+    n_col = len(row)
+    for i in range(n_col):
+        xi = row[i]
+        if np.isnan(xi):
+            continue
+
+        for j in range(n_col):
+            xj = row[j]
+            if np.isnan(xj):
+                continue
+
+            cnt[i, j] += sign
+            sx[i, j] += sign * xi
+            sxx[i, j] += sign * xi * xi
+            sxy[i, j] += sign * xi * xj
+
+
+@nb.njit(cache=True, error_model='numpy')
+def rolling_mean_abs_corr_kernel(x, window, min_periods):
+    """
+        滚动两两相关系数绝对值的行均值(含自身), 与 df.rolling(window, min_periods).corr().abs().mean(axis=1) 一致,
+        不生成每个时点的相关系数矩阵. 各品种对只用两者同时有值的行, 样本数不足 min_periods 或方差为 0 时不计入均值.
+
+        窗口内的和逐行增减, 每 window 行从头重算一次, 避免误差累积.
+
+    :param x: (bar, 品种) 收益率, 行优先存储
+    :return: (bar, 品种)
+    """
+    n, n_col = x.shape
+    out = np.full((n, n_col), np.nan)
+
+    cnt = np.zeros((n_col, n_col))
+    sx = np.zeros((n_col, n_col))
+    sxx = np.zeros((n_col, n_col))
+    sxy = np.zeros((n_col, n_col))
+
+    for t in range(n):
+        if (t + 1) % window == 0:
+            cnt[:] = 0
+            sx[:] = 0
+            sxx[:] = 0
+            sxy[:] = 0
+            for k in range(t - window + 1, t + 1):
+                _add_pair_moments(x[k], 1., cnt, sx, sxx, sxy)
+
+        else:
+            _add_pair_moments(x[t], 1., cnt, sx, sxx, sxy)
+            if t >= window:
+                _add_pair_moments(x[t - window], -1., cnt, sx, sxx, sxy)
+
+        for i in range(n_col):
+            total = 0.
+            m = 0
+            for j in range(n_col):
+                c = cnt[i, j]
+                if c < min_periods or c < 2:
+                    continue
+
+                var_i = sxx[i, j] - sx[i, j] * sx[i, j] / c
+                var_j = sxx[j, i] - sx[j, i] * sx[j, i] / c
+                if var_i <= 0 or var_j <= 0:
+                    continue
+
+                total += abs((sxy[i, j] - sx[i, j] * sx[j, i] / c) / np.sqrt(var_i * var_j))
+                m += 1
+
+            if m:
+                out[t, i] = total / m
+
+    return out
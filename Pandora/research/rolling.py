@@ -0,0 +1,323 @@
+# -*- coding:utf-8 -*-
+"""
+    滚动排序统计: 每列的值先离散化为排序后的序号, 窗口内的值用树状数组(Fenwick tree)按序号计数,
+    每根 bar 的插入, 删除与查询(排名, 第 k 小的值)都是 O(log n), 与窗口长度无关, 适合 tick 级别的长窗口.
+
+    窗口按行计, nan 不计入窗口内的样本数, 样本数不足 min_periods 时结果为 nan; 排名在当前值为 nan 时也为 nan.
+    rolling_mks 用同样的树状数组计数两两比较的符号之和.
+"""
+from typing import Sequence, Union
+
+import numba as nb
+import numpy as np
+import pandas as pd
+
+TIES = {'min': 0, 'max': 1, 'average': 2}
+NORMS = {None: 0, 'pct': 1, 'signed': 2}
+
+
+@nb.njit(cache=True)
+def _dense_ids(x):
+    """值的排序序号(从 1 开始, 相等的值序号相同), nan 为 0; 以及按序号排列的去重值"""
+    order = np.argsort(x, kind='mergesort')
+    ids = np.zeros(len(x), np.int64)
+    uniques = np.empty(len(x))
+
+    m = 0
+    prev = np.nan
+    for k in range(len(x)):
+        v = x[order[k]]
+        if np.isnan(v):
+            continue
+
+        if m == 0 or v != prev:
+            uniques[m] = v
+            m += 1
+            prev = v
+        ids[order[k]] = m
+
+    return ids, uniques[:m], m
+
+
+@nb.njit(cache=True)
+def _tree_add(tree, i, v):
+    while i < len(tree):
+        tree[i] += v
+        i += i & -i
+
+
+@nb.njit(cache=True)
+def _tree_sum(tree, i):
+    s = 0
+    while i > 0:
+        s += tree[i]
+        i -= i & -i
+    return s
+
+
+@nb.njit(cache=True)
+def _tree_kth(tree, k, step):
+    """第 k 个(从 1 开始)值的序号, step 为不超过树大小的最大 2 的幂"""
+    pos = 0
+    while step:
+        if pos + step < len(tree) and tree[pos + step] < k:
+            pos += step
+            k -= tree[pos]
+        step >>= 1
+    return pos + 1
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def rolling_rank_kernel(values, window, min_periods, ties, norm):
+    """
+        当前值在窗口内的排名
+
+    :param values: (bar, 列), 列优先存储时更快
+    :param ties: TIES, 相等值取最小/最大/平均排名
+    :param norm: NORMS, None 为从 1 开始的排名; 'pct' 为 排名 / 样本数;
+                 'signed' 为 (排名 - 1) / (样本数 - 1) 映射到 [-1, 1], 与 bn.move_rank 一致
+    """
+    n, n_col = values.shape
+    out = np.full((n_col, n), np.nan).T
+
+    for j in nb.prange(n_col):
+        ids, _, m = _dense_ids(values[:, j])
+        tree = np.zeros(m + 1, np.int64)
+        count = 0
+
+        for i in range(n):
+            if i >= window and ids[i - window]:
+                _tree_add(tree, ids[i - window], -1)
+                count -= 1
+
+            k = ids[i]
+            if not k:
+                continue
+
+            _tree_add(tree, k, 1)
+            count += 1
+            if count < min_periods:
+                continue
+
+            less = _tree_sum(tree, k - 1)
+            if ties == 0:
+                rank = less + 1.
+            else:
+                equal = _tree_sum(tree, k) - less
+                rank = less + equal if ties == 1 else less + 0.5 * (equal + 1)
+
+            if norm == 1:
+                rank = rank / count
+            elif norm == 2:
+                rank = 0. if count == 1 else 2 * ((rank - 1) / (count - 1) - 0.5)
+
+            out[i, j] = rank
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def rolling_quantile_kernel(values, window, min_periods, quantiles):
+    """
+        窗口内的多个分位数, 共用一个窗口, 线性插值, 与 pandas rolling().quantile() 一致
+
+    :return: (分位数, 列, bar), out[k].T 为第 k 个分位数的 (bar, 列) 结果
+    """
+    n, n_col = values.shape
+    out = np.full((len(quantiles), n_col, n), np.nan)
+
+    for j in nb.prange(n_col):
+        ids, uniques, m = _dense_ids(values[:, j])
+        tree = np.zeros(m + 1, np.int64)
+        step = 1
+        while step * 2 <= m:
+            step *= 2
+        count = 0
+
+        for i in range(n):
+            if i >= window and ids[i - window]:
+                _tree_add(tree, ids[i - window], -1)
+                count -= 1
+
+            if ids[i]:
+                _tree_add(tree, ids[i], 1)
+                count += 1
+
+            if count < min_periods or count == 0:
+                continue
+
+            for q in range(len(quantiles)):
+                pos = quantiles[q] * (count - 1)
+                k = int(pos)
+                low = uniques[_tree_kth(tree, k + 1, step) - 1]
+
+                if pos == k:
+                    out[q, j, i] = low
+                else:
+                    high = uniques[_tree_kth(tree, k + 2, step) - 1]
+                    out[q, j, i] = low + (high - low) * (pos - k)
+
+    return out
+
+
+@nb.njit(parallel=True, cache=True, error_model='numpy')
+def rolling_mks_kernel(values, window, lag):
+    """
+        滚动 Mann-Kendall 得分: 最近 window 根 bar 中间隔不超过 lag 的两两价格比较的符号之和 / 比较的个数.
+        新 bar 与之前 lag 根 bar 的比较, 以及离开窗口的 bar 与之后 lag 根 bar 的比较, 各用一个树状数组计数,
+        每根 bar O(log n). nan 按前值填充, 之前没有值时不参与比较(同 pct_change().fillna(0))
+
+    :param values: (bar, 列), 价格须为正, 此时 sign(a / b - 1) 与 sign(a - b) 一致
+    :return: (bar, 列), 前 window - 2 根 bar 为 nan
+    """
+    n, n_col = values.shape
+    out = np.full((n_col, n), np.nan).T
+
+    denom = 0.
+    for i in range(1, lag + 1):
+        denom += window - i
+
+    for j in nb.prange(n_col):
+        x = values[:, j].copy()
+        for i in range(1, n):
+            if np.isnan(x[i]):
+                x[i] = x[i - 1]
+
+        ids, _, m = _dense_ids(x)
+        # back: 第 t - lag ~ t - 1 根, front: 第 t - window + 1 ~ t - window + lag 根
+        back = np.zeros(m + 1, np.int64)
+        front = np.zeros(m + 1, np.int64)
+        n_back = 0
+        n_front = 0
+        s = 0
+
+        for t in range(n):
+            o = t - window
+            if o >= 0 and ids[o]:
+                less = _tree_sum(front, ids[o] - 1)
+                s -= n_front - _tree_sum(front, ids[o]) - less
+
+            if ids[t]:
+                less = _tree_sum(back, ids[t] - 1)
+                s += less - (n_back - _tree_sum(back, ids[t]))
+
+                _tree_add(back, ids[t], 1)
+                n_back += 1
+
+            if t - lag >= 0 and ids[t - lag]:
+                _tree_add(back, ids[t - lag], -1)
+                n_back -= 1
+
+            if o + 1 >= 0 and ids[o + 1]:
+                _tree_add(front, ids[o + 1], -1)
+                n_front -= 1
+
+            if o + 1 + lag >= 0 and ids[o + 1 + lag]:
+                _tree_add(front, ids[o + 1 + lag], 1)
+                n_front += 1
+
+            if t >= window - 2:
+                out[t, j] = s / denom
+
+    return out
+
+
+def _to_2d(values):
+    arr = np.asarray(values, dtype=np.float64)
+    return arr, np.asfortranarray(arr.reshape(len(arr), -1))
+
+
+def _wrap(out, values):
+    if isinstance(values, pd.DataFrame):
+        return pd.DataFrame(out, index=values.index, columns=values.columns)
+
+    if isinstance(values, pd.Series):
+        return pd.Series(out, index=values.index, name=values.name)
+
+    return out
+
+
+def rolling_rank(
+        values: Union[np.ndarray, pd.Series, pd.DataFrame],
+        window: int,
+        min_periods: int = None,
+        ties='average',
+        norm='pct',
+):
+    """
+        滚动排名, 各列独立计算
+
+    :param values: 一维或二维数组, Series, DataFrame
+    :param window: 窗口行数
+    :param min_periods: 最少样本数, 默认为 window
+    :param ties: 相等值的排名, 'min' / 'max' / 'average'
+    :param norm: None 为从 1 开始的排名; 'pct' 为 排名 / 样本数(同 pandas rank(pct=True));
+                 'signed' 为 [-1, 1] 区间, 与 bn.move_rank 一致
+    :return: 与输入同类型同形状
+    """
+    if window < 1:
+        raise ValueError(f"window must be positive, got {window}")
+
+    min_periods = window if min_periods is None else max(min_periods, 1)
+    arr, arr2d = _to_2d(values)
+
+    out = rolling_rank_kernel(arr2d, window, min_periods, TIES[ties], NORMS[norm]).reshape(arr.shape)
+
+    return _wrap(out, values)
+
+
+def rolling_quantile(
+        values: Union[np.ndarray, pd.Series, pd.DataFrame],
+        window: int,
+        quantile: Union[float, Sequence[float]],
+        min_periods: int = None,
+):
+    """
+        滚动分位数, 线性插值, 与 rolling(window, min_periods).quantile(quantile) 一致(inf 视为缺失值).
+        多个分位数在同一次遍历中计算
+
+    :param values: 一维或二维数组, Series, DataFrame
+    :param window: 窗口行数
+    :param quantile: 分位数, 或分位数的列表
+    :param min_periods: 最少样本数, 默认为 window
+    :return: 与输入同类型同形状; quantile 为列表时返回同样长度的列表
+    """
+    if window < 1:
+        raise ValueError(f"window must be positive, got {window}")
+
+    quantiles = np.atleast_1d(np.asarray(quantile, dtype=np.float64))
+    if ((quantiles < 0) | (quantiles > 1)).any():
+        raise ValueError(f"quantile must be between 0 and 1, got {quantile}")
+
+    min_periods = window if min_periods is None else min_periods
+    arr, arr2d = _to_2d(values)
+    if np.isinf(arr2d).any():
+        # 同 pandas rolling, inf 视为缺失值
+        arr2d = np.where(np.isinf(arr2d), np.nan, arr2d)
+
+    out = rolling_quantile_kernel(arr2d, window, min_periods, quantiles)
+    out = [_wrap(i.T.reshape(arr.shape), values) for i in out]
+
+    return out if np.ndim(quantile) else out[0]
+
+
+def rolling_mks(values: Union[np.ndarray, pd.Series, pd.DataFrame], window: int, imax: int = 0):
+    """
+        滚动 Mann-Kendall 得分, 各列独立计算, 与 price_volume.mks.mks 的原实现
+        sum(sign(pct_change(i)).fillna(0).rolling(window - i).sum() for i in 1..min(imax, window - 1)) / 比较的个数
+        一致, 每根 bar O(log window)
+
+    :param values: 价格, 一维或二维数组, Series, DataFrame
+    :param window: 窗口行数
+    :param imax: 只比较间隔不超过 imax 的两根 bar, 0 为不限
+    :return: 与输入同类型同形状
+    """
+    if window < 1:
+        raise ValueError(f"window must be positive, got {window}")
+
+    lag = min(imax, window - 1) if imax else window - 1
+    arr, arr2d = _to_2d(values)
+
+    out = rolling_mks_kernel(arr2d, window, lag).reshape(arr.shape)
+
+    return _wrap(out, values)
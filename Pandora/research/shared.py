@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+from Pandora.data_manager.quote_cache import QuoteCache
+
+
+class SharedFrameStore:
+    """
+        DataFrame 的共享存储: 主进程 publish 一次, worker 进程 attach 时以 np.load(mmap_mode='r') 映射,
+        所有进程共用操作系统中的同一份页面, 不随 worker 数量复制.
+            {root}/{name}/_meta.json    类型, 列名, 索引
+            {root}/{name}/values.npy    同质的 float 矩阵(ret, close, atr), 列优先存储
+            {root}/{name}/{i}.npy       其余表(quote_bt)逐列存储, 字符串列存为类别编码
+
+        默认目录位于 /dev/shm(内存文件系统, 不存在时使用系统临时目录), 用完调用 close() 删除.
+        对象本身只保存路径, 可以直接作为参数传给 joblib 的 worker.
+        attach 得到的数值列只读, 需要修改时先 copy().
+    """
+    file_meta = "_meta.json"
+
+    def __init__(self, root: Union[str, os.PathLike] = None):
+        """
+        :param root: 存储目录, 为空时新建临时目录
+        """
+        if root is None:
+            shm = Path("/dev/shm")
+            root = tempfile.mkdtemp(prefix="pandora_shared_", dir=shm if shm.is_dir() else None)
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(p.parent.name for p in self.root.glob(f"*/{self.file_meta}"))
+
+    def publish(self, name: str, df: pd.DataFrame):
+        """写入 df, 同名的已有数据会被覆盖"""
+        if isinstance(df.columns, pd.MultiIndex) or isinstance(df.index, pd.MultiIndex):
+            raise TypeError("MultiIndex is not supported")
+
+        path = self.root / name
+        if path.exists():
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+
+        meta = {"index": self._write_array(path, "index", df.index)}
+
+        dtypes = set(df.dtypes)
+        if len(dtypes) == 1 and np.issubdtype(dtypes.pop(), np.floating):
+            meta["kind"] = "matrix"
+            meta["columns"] = df.columns.tolist()
+            self._save(path / "values.npy", np.asfortranarray(df.to_numpy()))
+
+        else:
+            meta["kind"] = "frame"
+            meta["columns"] = [self._write_array(path, str(i), df.iloc[:, i]) for i in range(df.shape[1])]
+
+        content = json.dumps(meta, ensure_ascii=False)
+
+        def _dump(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+
+        QuoteCache.atomic_write(path / self.file_meta, _dump)
+
+    def attach(self, name: str) -> pd.DataFrame:
+        """只读映射 publish 写入的 df, 数值数据不复制"""
+        path = self.root / name
+        with open(path / self.file_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        index = pd.Index(self._read_array(path, meta["index"]), name=meta["index"]["name"])
+        if meta["kind"] == "matrix":
+            values = np.load(path / "values.npy", mmap_mode="r")
+            return pd.DataFrame(values, index=index, columns=meta["columns"], copy=False)
+
+        data = {col["name"]: self._read_array(path, col) for col in meta["columns"]}
+        return pd.DataFrame(data, index=index, copy=False)
+
+    def remove(self, name: str):
+        path = self.root / name
+        if path.exists():
+            shutil.rmtree(path)
+
+    def close(self):
+        """删除整个存储目录, 已经 attach 的 worker 在 posix 系统上仍可继续读取"""
+        if self.root.exists():
+            shutil.rmtree(self.root)
+
+    def _write_array(self, path: Path, key: str, values: Union[pd.Index, pd.Series]) -> dict:
+        info = {"name": values.name, "file": f"{key}.npy"}
+        dtype = values.dtype
+
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            raise TypeError(f"timezone-aware column {values.name} is not supported")
+
+        if dtype.kind == "M":
+            info["kind"] = "datetime"
+            arr = values.to_numpy(dtype="datetime64[ns]").view("int64")
+
+        elif dtype.kind in "biuf":
+            info["kind"] = "numeric"
+            arr = values.to_numpy()
+
+        else:
+            info["kind"] = "category"
+            info["categorical"] = isinstance(dtype, pd.CategoricalDtype)
+            if info["categorical"]:
+                cat = pd.Categorical(values)
+                codes, categories = cat.codes, cat.categories
+                info["ordered"] = bool(cat.ordered)
+
+            else:
+                codes, categories = pd.factorize(values)
+
+            info["categories"] = categories.tolist()
+            arr = codes.astype(np.int32)
+
+        self._save(path / info["file"], arr)
+
+        return info
+
+    @staticmethod
+    def _read_array(path: Path, info: dict):
+        arr = np.load(path / info["file"], mmap_mode="r")
+
+        if info["kind"] == "datetime":
+            return arr.view("datetime64[ns]")
+
+        if info["kind"] == "category":
+            categories = pd.Index(info["categories"])
+            if info["categorical"]:
+                return pd.Categorical.from_codes(arr, categories, ordered=info["ordered"])
+
+            # 还原为 object 列, 各行引用同一组字符串对象, 编码 -1(缺失值)取到末尾的 nan
+            return np.asarray(categories.tolist() + [np.nan], dtype=object)[arr]
+
+        return arr
+
+    @staticmethod
+    def _save(file: Path, arr: np.ndarray):
+        def _write(tmp):
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+
+        QuoteCache.atomic_write(file, _write)
@@ -0,0 +1,116 @@
+# -*- coding:utf-8 -*-
+from typing import Iterable, Sequence, Tuple, Union
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from Pandora.research import analytics
+from Pandora.research.backtest import COMMISSION
+
+
+class BacktestSweep:
+    """
+        同一 ret 矩阵上批量回测多组开仓信号(参数搜索), 与 backtest_and_summary 的日收益口径一致.
+
+        按日汇总的索引在初始化时计算一次, 每批参数在 (参数, 时间, 品种) 三维数组上一次完成计算.
+        n_jobs > 1 时按批分发到 joblib 进程池, ret 等大数组由 joblib 自动 memmap 到共享内存, 不在进程间复制.
+    """
+
+    def __init__(self, ret: pd.DataFrame, comm=COMMISSION, n_jobs=1, batch_size=8):
+        """
+        :param ret: bar 收益率, index 为按时间排序的 datetime, columns 为品种
+        :param comm: 单边手续费率
+        :param n_jobs: 进程数, -1 表示使用所有CPU核心
+        :param batch_size: 每批计算的参数组数, 控制三维中间数组的内存
+        """
+        self.index = ret.index
+        self.columns = ret.columns
+        self.ret = np.ascontiguousarray(ret.to_numpy(dtype=np.float64))
+        self.comm = comm
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+
+        if not self.index.is_monotonic_increasing:
+            raise ValueError("ret index must be sorted by datetime")
+
+        # 按日汇总: 每日第一根 bar 的位置
+        codes, self.days = pd.factorize(pd.Index(self.index.date), sort=True)
+        self.day_starts = np.flatnonzero(np.diff(codes, prepend=-1))
+
+    def run(
+            self,
+            open_signals: Union[np.ndarray, Iterable[Union[np.ndarray, pd.DataFrame]]],
+            params: Sequence = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+            批量回测
+
+        :param open_signals: (参数, 时间, 品种) 三维数组, 或逐组的二维开仓信号
+        :param params: 每组信号对应的参数, 作为结果的索引, 默认 0..P-1
+        :return: (summary, daily)
+                 summary: 每组参数的 sharpe, sharpe_0_comm, calmar, max_dd, annual_return, turnover
+                 daily: 扣除手续费后的日收益, index 为日期, columns 为参数
+        """
+        if not isinstance(open_signals, np.ndarray):
+            open_signals = np.stack([np.asarray(s, dtype=np.float64) for s in open_signals])
+
+        if open_signals.ndim == 2:
+            open_signals = open_signals[None]
+
+        n_params = open_signals.shape[0]
+        params = list(range(n_params)) if params is None else list(params)
+        if len(params) != n_params:
+            raise ValueError(f"params length {len(params)} != number of signals {n_params}")
+
+        batches = [slice(i, min(i + self.batch_size, n_params)) for i in range(0, n_params, self.batch_size)]
+        if self.n_jobs == 1 or len(batches) == 1:
+            results = [self.evaluate(open_signals[b]) for b in batches]
+
+        else:
+            results = Parallel(n_jobs=self.n_jobs)(  # n_jobs=-1 表示使用所有CPU核心
+                delayed(_evaluate)(
+                    open_signals[b], self.ret, self.day_starts, self.comm
+                ) for b in batches
+            )
+
+        daily = np.concatenate([r[0] for r in results])
+        daily_0_comm = np.concatenate([r[1] for r in results])
+        turnover = np.concatenate([r[2] for r in results])
+
+        summary = pd.DataFrame({
+            'sharpe': analytics.sharpe(daily.T),
+            'sharpe_0_comm': analytics.sharpe(daily_0_comm.T),
+            'calmar': analytics.calmar(daily.T),
+            'max_dd': analytics.max_drawdown(daily.T),
+            'annual_return': analytics.annual_return(daily.T),
+            'turnover': turnover,
+        }, index=params)
+
+        daily = pd.DataFrame(daily.T, index=pd.Index(self.days, name='date'), columns=params)
+
+        return summary, daily
+
+    def evaluate(self, open_signals: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """一批 (参数, 时间, 品种) 信号的 (日收益, 不计手续费的日收益, 日均换手)"""
+        return _evaluate(open_signals, self.ret, self.day_starts, self.comm)
+
+
+def _evaluate(open_signals, ret, day_starts, comm):
+    # 模块级函数, 便于 joblib 分发到子进程
+    signal = bn.push(open_signals, axis=1)
+    position = bn.replace(signal, np.nan, 0)
+    traded = np.abs(np.diff(position, prepend=0, axis=1))
+
+    returns = ret * signal
+    returns[np.isnan(returns)] = 0
+
+    bar_0_comm = returns.sum(axis=2)
+    bar = (returns - traded * comm).sum(axis=2)
+
+    daily = np.add.reduceat(bar, day_starts, axis=1)
+    daily_0_comm = np.add.reduceat(bar_0_comm, day_starts, axis=1)
+    turnover = traded.sum(axis=(1, 2)) / len(day_starts)
+
+    return daily, daily_0_comm, turnover
@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+import os
+from dataclasses import dataclass, fields
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class TradeLog:
+    """
+        按列存储的逐笔交易记录, 每个字段为等长的一维数组, 拼接与落盘(parquet)都不需要逐行构造对象.
+        to_frame() 得到与 get_trade_info 的 trade_detail 相同的表.
+    """
+    symbol: np.ndarray
+    trade_id: np.ndarray
+    enter_time: np.ndarray
+    exit_time: np.ndarray
+    weight: np.ndarray
+    pnl: np.ndarray
+    hp: np.ndarray
+    direction: np.ndarray
+
+    # trade_detail 的列名与顺序
+    columns = {
+        'trade_id': 'TradeID', 'symbol': 'symbol', 'hp': 'HP', 'pnl': 'PnL',
+        'enter_time': 'EnterTime', 'exit_time': 'ExitTime', 'weight': 'Weight', 'direction': 'Direction',
+    }
+
+    def __len__(self):
+        return len(self.trade_id)
+
+    @classmethod
+    def empty(cls) -> "TradeLog":
+        return cls(
+            np.array([], dtype=object), np.array([]), np.array([], dtype='datetime64[ns]'),
+            np.array([], dtype='datetime64[ns]'), np.array([]), np.array([]), np.array([]), np.array([]),
+        )
+
+    @classmethod
+    def concat(cls, logs: Sequence["TradeLog"]) -> "TradeLog":
+        logs = [i for i in logs if len(i)]
+        if not logs:
+            return cls.empty()
+
+        return cls(*[np.concatenate([getattr(i, f.name) for i in logs]) for f in fields(cls)])
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: getattr(self, attr) for attr, name in self.columns.items()})
+
+    @classmethod
+    def from_frame(cls, trade_detail: pd.DataFrame) -> "TradeLog":
+        return cls(**{attr: trade_detail[name].to_numpy() for attr, name in cls.columns.items()})
+
+    def save(self, file: Union[str, os.PathLike]):
+        pd.DataFrame({f.name: getattr(self, f.name) for f in fields(self)}).to_parquet(file, index=False)
+
+    @classmethod
+    def load(cls, file: Union[str, os.PathLike]) -> "TradeLog":
+        df = pd.read_parquet(file)
+        return cls(**{f.name: df[f.name].to_numpy() for f in fields(cls)})
+
+
+def extract_trades(returns: pd.DataFrame, signal, day_count=23, comm=3e-4) -> TradeLog:
+    """
+        由持仓矩阵一次性提取所有品种的逐笔交易, 口径与 get_trade_info 一致:
+            仓位每变化一次(含加减仓)开始一笔新交易, TradeID = 累计仓位变化量 * 持仓方向, 为 0 的不计
+
+        各列按列优先展开成一维后做游程编码(run-length encoding), nan 行不打断游程;
+        同一列中 TradeID 相同的游程(仅在中间有 nan 时出现)合并为一笔.
+
+    :param returns: bar 收益, index 为 datetime
+    :param signal: 持仓, 与 returns 同形状
+    :param day_count: 每日 bar 数, HP 以日为单位
+    :param comm: 单边手续费, 每笔扣除两次
+    """
+    sig = np.asarray(signal, dtype=np.float64)
+    n_bar, n_col = sig.shape
+
+    change = np.abs(np.diff(sig, axis=0, prepend=np.nan))
+    change[np.isnan(change)] = 0
+    trade = np.cumsum(change, axis=0) * np.sign(sig)
+    trade[sig == 0] = 0
+
+    # 列优先展开, 只保留非 nan 的行
+    trade = trade.T.ravel()
+    keep = np.flatnonzero(~np.isnan(trade))
+    if not len(keep):
+        return TradeLog.empty()
+
+    trade = trade[keep]
+    col = keep // n_bar
+    row = keep % n_bar
+    sig = sig.T.ravel()[keep]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnl = np.asarray(returns, dtype=np.float64).T.ravel()[keep] / np.abs(sig)
+    pnl[np.isnan(pnl)] = 0
+
+    # 游程: 列或 TradeID 变化处开始新的游程, 丢弃 TradeID 为 0 的游程
+    starts = np.flatnonzero(np.r_[True, (trade[1:] != trade[:-1]) | (col[1:] != col[:-1])])
+    ends = np.r_[starts[1:], len(trade)] - 1
+    run_pnl = np.add.reduceat(pnl, starts)
+    run_weight = np.add.reduceat(sig, starts)
+
+    loc = trade[starts] != 0
+    if not loc.any():
+        return TradeLog.empty()
+
+    starts, ends, run_pnl, run_weight = starts[loc], ends[loc], run_pnl[loc], run_weight[loc]
+    run_count = ends - starts + 1
+
+    # 同列同 TradeID 的游程合并, 并按 (列, TradeID) 排序, 与逐列 groupby 的顺序一致
+    order = np.lexsort((trade[starts], col[starts]))
+    starts, ends = starts[order], ends[order]
+    run_pnl, run_weight, run_count = run_pnl[order], run_weight[order], run_count[order]
+
+    key_col, key_trade = col[starts], trade[starts]
+    first = np.flatnonzero(np.r_[True, (key_col[1:] != key_col[:-1]) | (key_trade[1:] != key_trade[:-1])])
+    last = np.r_[first[1:], len(starts)] - 1
+
+    count = np.add.reduceat(run_count, first)
+    index = pd.DatetimeIndex(returns.index).to_numpy(dtype='datetime64[ns]')
+    columns = np.asarray(returns.columns, dtype=object)
+    trade_id = key_trade[first]
+
+    return TradeLog(
+        symbol=columns[key_col[first]],
+        trade_id=trade_id,
+        enter_time=index[row[starts[first]]],
+        exit_time=index[row[ends[last]]],
+        weight=np.add.reduceat(run_weight, first) / count,
+        pnl=np.add.reduceat(run_pnl, first) - comm * 2,
+        hp=count / day_count,
+        direction=np.sign(trade_id),
+    )
+
@@ -522,6 +522,17 @@ class ArrayManager(object):
         self.turnover_array: np.ndarray = np.zeros(size)
         self.open_interest_array: np.ndarray = np.zeros(size)
 
+        self.factor_states: dict = {}
+        self.factor_arrays: Dict[str, np.ndarray] = {}
+
+    def add_factor(self, name: str, factor) -> None:
+        """
+        Register a streaming factor (FeatureTemplate with online_state), updated on every bar in O(window).
+        Add factors before the first bar so that values match the batch transform.
+        """
+        self.factor_states[name] = factor.online_state()
+        self.factor_arrays[name] = np.full(self.size, np.nan)
+
     def update_bar(self, bar: BarData) -> None:
         """
         Update new bar data into array manager.
@@ -548,6 +559,11 @@ class ArrayManager(object):
         self.turnover_array[-1] = bar.turnover
         self.open_interest_array[-1] = bar.open_interest
 
+        for name, state in self.factor_states.items():
+            factor_array = self.factor_arrays[name]
+            factor_array[:-1] = factor_array[1:]
+            factor_array[-1] = state.update(*(getattr(bar, col) for col in state.columns))
+
     def to_df(self):
         return pd.DataFrame({
             "datetime": self.datetime_array,
@@ -609,6 +625,15 @@ class ArrayManager(object):
         """
         return self.open_interest_array
 
+    def factor(self, name: str, array: bool = False) -> Union[float, np.ndarray]:
+        """
+        Streaming factor registered by add_factor.
+        """
+        result: np.ndarray = self.factor_arrays[name]
+        if array:
+            return result
+        return result[-1]
+
     def sma(self, n: int, array: bool = False) -> Union[float, np.ndarray]:
         """
         Simple moving average.
@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from Pandora.research import analytics, backtest
+
+
+def test_summarize_matches_backtest(make_daily):
+    daily = make_daily(300, 20)
+    turnover = daily.abs()
+    summary = analytics.summarize(daily, turnover=turnover, long=daily.clip(lower=0), short=daily.clip(upper=0))
+
+    expected = pd.DataFrame({
+        col: {
+            'sharpe': backtest.calc_sharpe(ret=daily[col]),
+            'calmar': backtest.calc_calmar(daily[col]),
+            'max_dd': backtest.calc_maxdd(daily[col]),
+        } for col in daily.columns
+    }).T
+    pd.testing.assert_frame_equal(summary[expected.columns], expected, check_exact=False, rtol=1e-10)
+    np.testing.assert_allclose(summary['turnover'], turnover.mean(), rtol=1e-12)
+    np.testing.assert_array_equal(summary['long_hit_rate'], 1)
+
+    col = daily.iloc[:, 0]
+    nav = col.cumsum() + 1
+    underwater = (nav < nav.cummax()).astype(int)
+    longest = underwater.groupby((underwater == 0).cumsum()).sum().max()
+    assert summary['max_dd_duration'].iloc[0] == longest
+    assert summary['hit_rate'].iloc[0] == pytest.approx((col > 0).sum() / (col != 0).sum())
+
+    table = analytics.to_performance_table(summary, 'daily')
+    assert list(table.columns) == ['BackTestID', 'Evaluator', 'Type', 'Value']
+    assert len(table) == summary.size
+
+
+def test_rolling_summarize(make_daily):
+    daily = make_daily(200, 3)
+    result = analytics.rolling_summarize(daily, 60, min_periods=20)
+
+    for metric, func in (('max_dd', backtest.calc_maxdd), ('calmar', backtest.calc_calmar)):
+        expected = daily.rolling(60, min_periods=20).apply(func, raw=True)
+        pd.testing.assert_frame_equal(result[metric], expected, check_exact=False, rtol=1e-10)
+
+    expected = daily.rolling(60, min_periods=20).apply(lambda x: backtest.calc_sharpe(ret=pd.Series(x)), raw=True)
+    pd.testing.assert_frame_equal(result['sharpe'], expected, check_exact=False, rtol=1e-8)
+
+
+def test_describe_trade():
+    detail = pd.DataFrame({'PnL': [0.01, -0.02, 0.03, 0.], 'HP': [1., 2., 3., 4.], 'Direction': [1, -1, 1, -1]})
+
+    expected = pd.Series({
+        'trade_count': 4, 'trade_win_rate': 0.5, 'avg_pnl': 0.005, 'mid_pnl': 0.005, 'avg_hp': 2.5, 'mid_hp': 2.5,
+        'long_trade_count': 2, 'long_trade_win_rate': 1, 'long_avg_pnl': 0.02, 'long_mid_pnl': 0.02, 'long_avg_hp': 2, 'long_mid_hp': 2,
+        'short_trade_count': 2, 'short_trade_win_rate': 0, 'short_avg_pnl': -0.01, 'short_mid_pnl': -0.01, 'short_avg_hp': 3, 'short_mid_hp': 3,
+    }, dtype=float)
+    pd.testing.assert_series_equal(backtest.describe_trade(detail), expected)
+
+    # 没有交易时只有 trade_count 为 0
+    desc = backtest.describe_trade(detail[detail['Direction'] == 1])
+    assert desc['short_trade_count'] == 0 and desc[['short_trade_win_rate', 'short_avg_pnl', 'short_mid_hp']].isna().all()
+    assert backtest.describe_trade(detail.iloc[:0]).drop(['trade_count', 'long_trade_count', 'short_trade_count']).isna().all()
@@ -0,0 +1,310 @@
+# -*- coding:utf-8 -*-
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+import pytest
+
+from Pandora.research import backtest
+
+n = np.nan
+
+
+def _make_exit_quote():
+    index = pd.date_range("2020-01-01", periods=12, freq="15min")
+    close = pd.DataFrame({
+        'A': [100, 101, 103, 102, 99, np.nan, 98, 97, 100, 101, 102, 104],
+        'B': [100, 99, 98, 101, 100, 97, 96, 99, 98, 99, 97, 95],
+    }, index=index, dtype=float)
+    sig = pd.DataFrame({
+        'A': [1, n, n, -1, n, n, 1, n, n, n, n, n],
+        'B': [-1, n, 1, n, n, 1, n, n, 0, -1, n, n],
+    }, index=index, dtype=float)
+
+    return sig, close, close * 0 + 2
+
+
+@pytest.mark.parametrize("exit_func, expected", [
+    # A: 103 多头止盈, 102 开空后 99 止盈; B: 持仓中的信号与平仓当根的反手信号被忽略, 信号 0 不开仓
+    (lambda sig, close, atr: backtest.exit_w_loss_barrier(sig, close, 0.025),
+     [[1, n, 0, -1, 0, n, 1, n, n, 0, n, n], [-1, n, n, n, n, 0, n, n, n, -1, n, 0]]),
+    (lambda sig, close, atr: backtest.exit_w_atr_barrier(sig, close, atr, 1.2),
+     [[1, n, 0, -1, 0, n, 1, n, n, 0, n, n], [-1, n, n, n, n, 0, n, n, n, -1, n, 0]]),
+    # 回撤按开仓后的最高/最低价计算, A 最后一笔持续上涨不平仓
+    (lambda sig, close, atr: backtest.exit_w_loss_barrier(sig, close, None, 0.02),
+     [[1, n, n, n, 0, n, 1, n, n, n, n, n], [-1, n, n, 0, n, 1, n, n, n, n, 0, n]]),
+    (lambda sig, close, atr: backtest.exit_w_atr_barrier(sig, close, atr, None, 1),
+     [[1, n, n, n, 0, n, 1, n, n, n, n, n], [-1, n, n, 0, n, 1, n, n, n, n, n, 0]]),
+    # 剩余 bar 不足 max_hp 时该列之后不再平仓
+    (lambda sig, close, atr: backtest.exit_w_loss_barrier(sig, close, None, None, 3),
+     [[1, n, n, 0, n, n, 1, n, n, 0, n, n], [-1, n, n, 0, n, 1, n, n, 0, -1, n, n]]),
+    (lambda sig, close, atr: backtest.exit_w_atr_barrier(sig, close, atr, None, None, 3),
+     [[1, n, n, 0, n, n, 1, n, n, 0, n, n], [-1, n, n, 0, n, 1, n, n, 0, -1, n, n]]),
+    (lambda sig, close, atr: backtest.exit_w_loss_barrier(sig, close, 0.05, 0.015, 4),
+     [[1, n, n, n, 0, n, 1, n, n, n, 0, n], [-1, n, n, 0, n, 1, n, n, n, 0, n, n]]),
+    # 止损幅度随持仓 bar 数线性收窄, 持有 max_hp 根后任何回撤都平仓
+    (lambda sig, close, atr: backtest.exit_w_trace_exit(sig, close, 0.04, 4),
+     [[1, n, n, n, 0, n, 1, n, n, n, n, n], [-1, n, n, 0, n, 1, n, n, 0, -1, n, n]]),
+    (lambda sig, close, atr: backtest.exit_w_trace_atr_exit(sig, close, atr, 2, 4),
+     [[1, n, n, n, 0, n, 1, n, n, n, n, n], [-1, n, n, 0, n, 1, n, n, n, n, 0, n]]),
+])
+def test_exit_kernels(exit_func, expected):
+    sig, close, atr = _make_exit_quote()
+    result = exit_func(sig, close, atr)
+
+    np.testing.assert_array_equal(result.values, np.array(expected).T)
+    assert result.index.equals(sig.index) and result.columns.equals(sig.columns)
+
+
+def _signal_reference(feature, rules, one_shot=True):
+    """
+        逐列去掉 nan 后按 rules 依次赋值 [(条件, 信号), ...], one_shot 时只保留信号变化的 bar
+    """
+    open_signal = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
+    for col in feature.columns:
+        ft = feature[col].dropna()
+
+        sig = pd.Series(np.nan, index=ft.index)
+        for loc, value in rules(ft):
+            sig[np.asarray(loc, dtype=bool)] = value
+
+        if one_shot:
+            sig_ = np.sign(sig.ffill().diff().fillna(0))
+            sig_[sig_ == 0] = np.nan
+            sig_[sig == 0] = 0
+            sig = sig_
+
+        open_signal[col] = sig
+
+    return open_signal.values
+
+
+def _quantile_imba_rules(ft):
+    rolling = ft.rolling(200, min_periods=100)
+    upper_long, lower_long = rolling.quantile(0.9), rolling.quantile(0.6)
+    upper_short, lower_short = rolling.quantile(1 - 0.6), rolling.quantile(1 - 0.9)
+
+    return [
+        (ft >= upper_long, 1),
+        ((ft <= lower_long) & (ft.shift() > lower_long.shift()), 0),
+        ((ft >= upper_short) & (ft.shift() < upper_short.shift()), 0),
+        (ft <= lower_short, -1),
+    ]
+
+
+def _quantile_rules(ft):
+    rank = (bn.move_rank(ft.values, 200, min_count=100) + 1) / 2
+    prev = np.r_[np.nan, rank[:-1]]
+
+    return [
+        (rank >= 0.9, 1), ((rank <= 0.5) & (prev > 0.5), 0), ((rank >= 0.5) & (prev < 0.5), 0), (rank <= 1 - 0.9, -1),
+    ]
+
+
+def _std_rules(ft, with_zero):
+    mean, std = ft.rolling(100).mean(), ft.rolling(100).std()
+    rules = [(ft > mean + 2 * std, 1), (ft < mean - 2 * std, -1)]
+    if with_zero:
+        rules[1:1] = [((ft < mean) & (ft.shift() > mean.shift()), 0)]
+        rules.append(((ft > mean) & (ft.shift() < mean.shift()), 0))
+
+    return rules
+
+
+def _cross_ma_rules(ft):
+    cross = ft - bn.move_mean(ft.values, 50, 1)
+    return [((cross > 0) & (cross.shift() <= 0), 1), ((cross < 0) & (cross.shift() >= 0), -1)]
+
+
+SIGNAL_CASES = {
+    "quantile_imba": (lambda ft: backtest.trade_by_quantile_imba(ft, 200, 0.9, 0.6), _quantile_imba_rules, True),
+    "quantile": (lambda ft: backtest.trade_by_quantile(ft, 200, 0.9), _quantile_rules, True),
+    "quantile_all": (lambda ft: backtest.trade_by_quantile(ft, 200, 0.9, one_shot=False), _quantile_rules, False),
+    "thres_imba": (
+        lambda ft: backtest.trade_by_thres_imba(ft, 1, -1, 0.2, -0.2),
+        lambda ft: [(ft >= 1, 1), ((ft <= 0.2) & (ft.shift() > 0.2), 0), ((ft >= -0.2) & (ft.shift() < -0.2), 0), (ft <= -1, -1)],
+        True,
+    ),
+    "cross_ma": (lambda ft: backtest.trade_by_cross_ma(ft, 50), _cross_ma_rules, False),
+    "norm": (
+        lambda ft: backtest.trade_by_norm(ft, 1.5),
+        lambda ft: [(ft > 1.5, 1), ((ft < 0) & (ft.shift() > 0), 0), (ft < -1.5, -1), ((ft > 0) & (ft.shift() < 0), 0)],
+        True,
+    ),
+    "std_w_0": (lambda ft: backtest.trade_by_std_w_0(ft, 100, 2), lambda ft: _std_rules(ft, True), True),
+    "std": (lambda ft: backtest.trade_by_std(ft, 100, 2), lambda ft: _std_rules(ft, False), True),
+}
+
+
+@pytest.mark.parametrize("name", list(SIGNAL_CASES))
+def test_trade_signals_match_reference(name, make_feature):
+    func, rules, one_shot = SIGNAL_CASES[name]
+    for ft in (make_feature(1500, 8, nan_rate=0.05), make_feature(600, 3, nan_rate=0).iloc[300:]):
+        np.testing.assert_array_equal(func(ft), _signal_reference(ft, rules, one_shot))
+
+
+def test_sweep_matches_backtest_and_summary(make_feature):
+    from Pandora.research.sweep import BacktestSweep
+
+    ret = make_feature(23 * 60, 6, nan_rate=0) * 0.003
+    windows = np.array([20, 200, 400])
+    signals = np.stack([backtest.trade_by_std(ret.rolling(10).sum().shift(), w, 1.5) for w in windows])
+
+    summary, daily = BacktestSweep(ret, n_jobs=1, batch_size=2).run(signals, params=windows)
+
+    for window, signal in zip(windows, signals):
+        daily_base, expected, _ = backtest.backtest_and_summary(pd.DataFrame(signal, ret.index, ret.columns), ret)
+
+        np.testing.assert_allclose(daily[window].values, daily_base.values, rtol=1e-10, atol=1e-14)
+        for key in ('sharpe', 'sharpe_0_comm', 'calmar'):
+            assert summary.at[window, key] == pytest.approx(expected[key], rel=1e-9)
+
+
+def test_trade_info(tmp_path):
+    from Pandora.research.trade_log import TradeLog, extract_trades
+
+    index = pd.date_range("2020-01-01 09:00", periods=9, freq="15min", name="datetime")
+    # A: 0.5 减仓拆为新交易, 持仓中间的 nan 不打断交易; B: 头部 nan, 多空反手
+    signal = np.array([[0, 1, 1, 0.5, 0, -1, n, -1, 0], [n, 0, -1, -1, -1, 1, 1, 0, 0]]).T
+    returns = pd.DataFrame(
+        np.array([[0, .01, -.002, .004, 0, .003, n, -.001, 0], [n, 0, .002, .001, -.004, .005, .001, 0, 0]]).T,
+        index=index, columns=['A', 'B'],
+    )
+
+    info, info_col, detail = backtest.get_trade_info(returns, signal)
+
+    # PnL = sum(收益 / |仓位|) - 2 * 3e-4, HP = bar 数 / 23
+    expected = pd.DataFrame({
+        'TradeID': [-3., 1., 1.5, -1., 3.],
+        'symbol': ['A', 'A', 'A', 'B', 'B'],
+        'HP': np.array([2, 2, 1, 3, 2]) / 23,
+        'PnL': [0.0014, 0.0074, 0.0074, -0.0016, 0.0054],
+        'EnterTime': index[[5, 1, 3, 2, 5]],
+        'ExitTime': index[[7, 2, 3, 4, 6]],
+        'Weight': [-1, 1, 0.5, -1, 1.],
+        'Direction': [-1., 1., 1., -1., 1.],
+    })
+    pd.testing.assert_frame_equal(detail, expected, check_exact=False, rtol=1e-12)
+
+    for symbol in ('A', 'B'):
+        desc = backtest.describe_trade(expected[expected['symbol'] == symbol])
+        pd.testing.assert_series_equal(info_col.loc[symbol], desc, check_names=False)
+
+    desc = backtest.describe_trade(expected)
+    np.testing.assert_allclose(info.values.ravel(), desc.values)
+    assert list(info.index) == ['overall', 'long', 'short']
+
+    log = extract_trades(returns, signal)
+    log.save(tmp_path / "trades.parquet")
+    loaded = TradeLog.concat([TradeLog.load(tmp_path / "trades.parquet"), TradeLog.empty()])
+    pd.testing.assert_frame_equal(loaded.to_frame(), log.to_frame())
+
+
+def _make_long_quote(n_days=12, day_count=23, seed=0, start='2024-01-02', symbols=('a00', 'b00', 'c00')):
+    rng = np.random.default_rng(seed)
+    index = pd.DatetimeIndex([
+        pd.Timestamp(start) + pd.Timedelta(days=d, hours=9, minutes=10 * i)
+        for d in range(n_days) for i in range(day_count)
+    ], name='datetime')
+
+    quotes = []
+    for k, symbol in enumerate(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(index))))
+        quote = pd.DataFrame({'symbol': symbol, 'close_price': close}, index=index)
+        quotes.append(quote.iloc[k * 40:])  # 各品种上市时间不同
+
+    return pd.concat(quotes).sort_index(kind='stable')
+
+
+def _cross_ma_signal(quote):
+    close = quote.pivot(columns='symbol', values='close_price')
+    return backtest.trade_by_cross_ma(close, 10)
+
+
+@pytest.mark.parametrize("use_exit", [False, True])
+def test_incremental_backtest_matches_batch(tmp_path, use_exit):
+    from Pandora.research.incremental import ExitRule, IncrementalBacktest
+
+    quote = _make_long_quote()
+    exit_rule = ExitRule.loss_barrier(0.02, 0.01, 15) if use_exit else None
+
+    def make(name):
+        return IncrementalBacktest('bt', _cross_ma_signal, lookback=30, exit_rule=exit_rule, root=tmp_path / name)
+
+    ret_full, trade_full = make('full').run(quote)
+
+    # 分三次运行, 每次重新从磁盘加载状态
+    rets, trades = [], []
+    for end in ['2024-01-05 10:00', '2024-01-09', None]:
+        ret, trade = make('chunk').run(quote.loc[:end] if end else quote)
+        rets.append(ret)
+        trades.append(trade)
+
+    ret_chunk = pd.concat(rets).drop_duplicates('DateTime', keep='last').reset_index(drop=True)
+    pd.testing.assert_frame_equal(ret_chunk, ret_full, check_exact=False, rtol=1e-12)
+    pd.testing.assert_frame_equal(pd.concat(trades, ignore_index=True), trade_full)
+    assert make('chunk').run(quote)[0].empty
+
+    if not use_exit:
+        expected = backtest.backtest_factor(_cross_ma_signal(quote), 1, backtest.get_bar_ret(quote))
+        np.testing.assert_allclose(ret_full['Ret'].values, expected.values, rtol=1e-12, atol=1e-15)
+        assert list(ret_full['DateTime'].dt.date) == list(expected.index)
+
+
+def test_incremental_backtest_ret_overrides(tmp_path):
+    from Pandora.research.incremental import IncrementalBacktest
+
+    # ni00 在 2022-03-07 ~ 2022-03-31 的收益不计入回测
+    quote = _make_long_quote(n_days=40, start='2022-02-20', symbols=('a00', 'ni00'))
+    make = lambda: IncrementalBacktest('bt', _cross_ma_signal, lookback=30, root=tmp_path)
+
+    rets = [make().run(quote.loc[:end] if end else quote)[0] for end in ['2022-03-10', '2022-03-20', None]]
+    ret = pd.concat(rets).drop_duplicates('DateTime', keep='last').reset_index(drop=True)
+
+    expected = backtest.backtest_factor(_cross_ma_signal(quote), 1, backtest.get_bar_ret(quote))
+    np.testing.assert_allclose(ret['Ret'].values, expected.values, rtol=1e-12, atol=1e-15)
+
+    # 不替换时结果不同, 说明数据中 ni00 在区间内确有持仓
+    raw = quote.pivot(columns='symbol', values='close_price').pct_change(fill_method=None).shift(-1)
+    assert not np.allclose(backtest.backtest_factor(_cross_ma_signal(quote), 1, raw).values, expected.values)
+
+
+def test_exit_step_kernel_matches_batch():
+    from Pandora.research import kernels
+
+    rng = np.random.default_rng(0)
+    close = 4000 * np.exp(rng.normal(0, 0.005, (400, 6)).cumsum(axis=0))
+    sig = np.where(rng.random(close.shape) < 0.1, rng.choice([-1., 0., 1.], close.shape), np.nan)
+    max_hp = 10
+    expected = backtest.exit_w_loss_barrier(pd.DataFrame(sig), pd.DataFrame(close), 0.03, 0.02, max_hp).values
+
+    state = np.zeros((sig.shape[1], kernels.N_EXIT_STATE))
+    args = (kernels.EXIT_LOSS_BARRIER, 0.03, 0.02, True, True, max_hp, state)
+    result = np.vstack([
+        kernels.exit_step_kernel(*[np.ascontiguousarray(v[part]) for v in (sig, close, close)], *args)
+        for part in (slice(None, 150), slice(150, None))
+    ])
+
+    # 末尾 max_hp 根 bar 内开仓的持仓, exit_w_* 放弃该列, 逐 bar 版本持续持有
+    end = len(sig) - max_hp - 1
+    np.testing.assert_array_equal(result[:end], expected[:end])
+
+
+def _std_corr_reference(quote, param, day_count):
+    """逐品种 rolling().std() 与合并时间轴上的 rolling().corr() 矩阵"""
+    r_mat = pd.DataFrame({code: np.log(1 + group['close_price'].pct_change()) for code, group in quote.groupby('symbol')})
+    std = pd.DataFrame({code: r.dropna().rolling(param, min_periods=min(100, param)).std() for code, r in r_mat.items()})
+    corr = r_mat.rolling(param, min_periods=100).corr().abs().mean(axis=1).unstack()
+
+    return quote.pivot(columns='symbol', values='close_price'), std * np.sqrt(252 * day_count), corr
+
+
+def test_weights_match_rolling_corr(monkeypatch, make_bars):
+    quote = make_bars(1500, 6).reset_index('symbol')
+    for func in (backtest.get_weight_by_std_corr, backtest.get_weight_by_3d):
+        for param in (100, 300):
+            result = func(quote, param)
+            with monkeypatch.context() as m:
+                m.setattr(backtest, '_get_std_corr', _std_corr_reference)
+                expected = func(quote, param)
+
+            pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-10, check_names=False, check_freq=False)
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+"""
+    analytics.summarize 与逐列调用 calc_sharpe / calc_calmar / calc_maxdd 的对比, 以及 describe_trade 原实现
+
+    python -m tests.benchmark.analytics
+    python -m tests.benchmark.analytics 2000 5000
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.research import analytics, backtest
+
+
+def describe_trade_legacy(trade_detail):
+    desc = pd.Series(dtype=float)
+    desc.loc['trade_count'] = len(trade_detail)
+    desc.loc['trade_win_rate'] = (trade_detail['PnL'] > 0).mean()
+    desc.loc['avg_pnl'] = trade_detail['PnL'].mean()
+    desc.loc['mid_pnl'] = trade_detail['PnL'].median()
+    desc.loc['avg_hp'] = trade_detail['HP'].mean()
+    desc.loc['mid_hp'] = trade_detail['HP'].median()
+
+    loc = trade_detail['Direction'] == 1
+    tmp = trade_detail[loc]
+    desc.loc['long_trade_count'] = len(tmp)
+    desc.loc['long_trade_win_rate'] = (tmp['PnL'] > 0).mean()
+    desc.loc['long_avg_pnl'] = tmp['PnL'].mean()
+    desc.loc['long_mid_pnl'] = tmp['PnL'].median()
+    desc.loc['long_avg_hp'] = tmp['HP'].mean()
+    desc.loc['long_mid_hp'] = tmp['HP'].median()
+
+    loc = trade_detail['Direction'] == -1
+    tmp = trade_detail[loc]
+    desc.loc['short_trade_count'] = len(tmp)
+    desc.loc['short_trade_win_rate'] = (tmp['PnL'] > 0).mean()
+    desc.loc['short_avg_pnl'] = tmp['PnL'].mean()
+    desc.loc['short_mid_pnl'] = tmp['PnL'].median()
+    desc.loc['short_avg_hp'] = tmp['HP'].mean()
+    desc.loc['short_mid_hp'] = tmp['HP'].median()
+
+    return desc
+
+
+def make_daily(n_days=1500, n_strategies=500, seed=0):
+    rng = np.random.default_rng(seed)
+    daily = rng.normal(2e-4, 0.01, (n_days, n_strategies))
+    daily[rng.random(daily.shape) < 0.05] = 0
+
+    index = pd.date_range("2018-01-01", periods=n_days, freq="B", name="date")
+    return pd.DataFrame(daily, index=index, columns=[f"P{i}" for i in range(n_strategies)])
+
+
+def summarize_legacy(daily):
+    return pd.DataFrame({
+        col: {
+            'sharpe': backtest.calc_sharpe(ret=daily[col]),
+            'calmar': backtest.calc_calmar(daily[col]),
+            'max_dd': backtest.calc_maxdd(daily[col]),
+        } for col in daily.columns
+    }).T
+
+
+def run(n_strategies=2000, n_days=1500):
+    daily = make_daily(n_days, n_strategies)
+
+    start = time.perf_counter()
+    summary = analytics.summarize(daily)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = summarize_legacy(daily)
+    cost_legacy = time.perf_counter() - start
+
+    diff = np.max(np.abs(summary[expected.columns].values - expected.values))
+    print(f"strategies={n_strategies}  days={n_days}  per_column={cost_legacy:.3f}s  "
+          f"summarize={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  max_diff={diff:.2e}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
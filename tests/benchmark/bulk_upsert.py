@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+"""
+    DbManager.upsert 逐行语句与临时表批量写入的对比. 需要配置文件中的数据库连接, 会创建并删除一张临时的表
+
+    python -m tests.benchmark.bulk_upsert db_tsdb public.bench_bulk_upsert 20000
+    python -m tests.benchmark.bulk_upsert db_165 dbo.BenchBulkUpsert 20000
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.helper.database import DbManager
+
+
+def make_trades(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        "trade_id": np.arange(n_rows),
+        "symbol": rng.choice(["RB", "HC", "I", "J", "JM"], n_rows),
+        "volume": rng.integers(1, 100, n_rows),
+        "pnl": rng.normal(0, 1000, n_rows),
+    })
+
+
+def run(conn, table, n_rows=20_000):
+    dbm = DbManager(conn)
+    float_type = "FLOAT" if dbm.db_engine.name == "mssql" else "DOUBLE PRECISION"
+    dbm.execute(f"CREATE TABLE {table} (trade_id INT PRIMARY KEY, symbol VARCHAR(8), volume INT, pnl {float_type})")
+
+    data = make_trades(n_rows)
+    threshold = DbManager.bulk_threshold
+
+    try:
+        for name, bulk_threshold in (("row-by-row", n_rows + 1), ("bulk", threshold)):
+            dbm.execute(f"DELETE FROM {table}")
+            DbManager.bulk_threshold = bulk_threshold
+
+            # 先插入一半, 再upsert全量, 同时覆盖update与insert
+            dbm.upsert(table, data.iloc[: n_rows // 2], on="trade_id")
+
+            start = time.perf_counter()
+            dbm.upsert(table, data, on="trade_id")
+            cost = time.perf_counter() - start
+
+            count = dbm.query(f"SELECT COUNT(*) FROM {table}").iat[0, 0]
+            print(f"{name:<12}rows={n_rows:>8}  cost={cost:.3f}s  rows_in_table={count}")
+
+    finally:
+        DbManager.bulk_threshold = threshold
+        dbm.execute(f"DROP TABLE {table}")
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 20_000)
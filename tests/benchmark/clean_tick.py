@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+"""
+    FutureDataAPI.clean_tick 向量化实现与原逐时段循环实现的对比
+
+    python -m tests.benchmark.clean_tick
+"""
+import datetime as dt
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.data_manager.data_api import FutureDataAPI
+from Pandora.helper.date import Dates
+
+SESSIONS = [
+    (dt.time(21), dt.time(2, 30)),
+    (dt.time(9), dt.time(10, 15)),
+    (dt.time(10, 30), dt.time(11, 30)),
+    (dt.time(13, 30), dt.time(15)),
+]
+
+
+def clean_tick_legacy(
+        data,
+        trade_sessions,
+        filter_out_auction=False,
+):
+    ret = data.copy()
+    ret['date'] = ret['datetime'].dt.normalize()
+
+    # 1. modify auction timestamp
+    if not filter_out_auction:
+        for start, _ in trade_sessions:
+            start_delta = Dates.time_to_timedelta(start)
+
+            auction_start = ret['date'] + pd.Timedelta(start_delta - dt.timedelta(minutes=5))
+            auction_end = ret['date'] + pd.Timedelta(start_delta)
+            time_modified = ret['date'] + pd.Timedelta(start_delta + dt.timedelta(microseconds=1))
+
+            loc = (ret['datetime'] > auction_start) & (ret['datetime'] <= auction_end)
+            ret.loc[loc, 'datetime'] = time_modified[loc]
+
+    # 2. filter_out unnecessary data
+    loc_in = pd.Series(False, index=ret.index)
+    for start, end in trade_sessions:
+        filter_start = ret['date'] + pd.Timedelta(Dates.time_to_timedelta(start))
+        filter_end = ret['date'] + pd.Timedelta(Dates.time_to_timedelta(end) + dt.timedelta(minutes=1))
+
+        if start < end:
+            loc_in |= ((ret['datetime'] >= filter_start) & (ret['datetime'] <= filter_end))
+
+        else:
+            loc_in |= ((ret['datetime'] >= filter_start) | (ret['datetime'] <= filter_end))
+
+    ret = ret[loc_in]
+
+    return ret
+
+
+def make_ticks(n_days, seed=0):
+    """每个自然日 20:50 至次日 15:10 每500ms一笔, 含集合竞价与休市时段的噪声数据"""
+    rng = np.random.default_rng(seed)
+
+    times = []
+    for day in pd.date_range("2023-01-02", periods=n_days):
+        times.append(pd.date_range(day + pd.Timedelta(hours=20, minutes=50), day + pd.Timedelta(hours=39, minutes=10), freq="500ms"))
+
+    times = pd.DatetimeIndex(np.concatenate(times))
+
+    return pd.DataFrame({
+        "datetime": times,
+        "symbol": "AG2306",
+        "last_price": 5000 + rng.normal(0, 1, len(times)).cumsum(),
+    })
+
+
+def run(n_days=20, repeat=3):
+    data = make_ticks(n_days)
+
+    for name, func in (("legacy", clean_tick_legacy), ("vectorized", FutureDataAPI.clean_tick)):
+        cost = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(data, SESSIONS)
+            cost.append(time.perf_counter() - start)
+
+        print(f"{name:<12}rows={len(data):>10}  best={min(cost):.3f}s")
+
+
+if __name__ == '__main__':
+    run()
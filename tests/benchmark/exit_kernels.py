@@ -0,0 +1,402 @@
+# -*- coding:utf-8 -*-
+"""
+    exit_w_* 平仓函数 numba 核函数实现与原逐信号 numpy 实现的对比, 使用合成行情, 不依赖数据库
+
+    python -m tests.benchmark.exit_kernels
+    python -m tests.benchmark.exit_kernels 20000 50
+"""
+import sys
+import time
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+
+from Pandora.research import backtest
+
+
+def exit_w_trace_exit_legacy(open_signal, close, stoploss, max_hp):
+    # Exit with fix holding period ONLY
+    # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+
+    os_np = open_signal.values
+    os_exit_np = np.empty_like(os_np)
+    os_exit_np[:] = np.nan
+
+    close_np = close.values
+
+    sequence = 1 - np.arange(len(os_np)) * (1 / max_hp)
+    sequence[sequence < 0] = 0
+
+    for j in range(os_exit_np.shape[1]):
+        signal_ = os_np[:, j]
+        close_ = close_np[:, j]
+
+        indices = np.where(~np.isnan(signal_))
+        next_idx = 0
+        for i in indices[0]:
+            current_signal = signal_[i]
+
+
+
+            # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
+            if i < next_idx:
+                continue
+
+            if current_signal > 0:
+                c = bn.push(close_[i:])
+                move_max_ = np.maximum.accumulate(c)
+
+                loc = np.isnan(close_[i:])
+                move_max_[loc] = np.nan
+
+
+                close_idx = np.argmax((move_max_ - close_[i:]) > sequence[:len(move_max_)] * stoploss * close_[i])
+
+                os_exit_np[i, j] = current_signal
+
+            elif current_signal < 0:
+                c = bn.push(close_[i:])
+                move_min_ = np.minimum.accumulate(c)
+
+                loc = np.isnan(close_[i:])
+                move_min_[loc] = np.nan
+
+                close_idx = np.argmax((close_[i:] - move_min_) > sequence[:len(move_min_)] * stoploss * close_[i])
+
+                os_exit_np[i, j] = current_signal
+
+            else:
+                close_idx = 0
+
+            if close_idx:
+                os_exit_np[i + close_idx, j] = 0
+                next_idx = i + close_idx + 1
+
+    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
+
+    return open_signal_exit
+
+
+def exit_w_trace_atr_exit_legacy(open_signal, close, atr, atr_multiplier, max_hp):
+    # Exit with fix holding period ONLY
+    # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+
+    os_np = open_signal.values
+    os_exit_np = np.empty_like(os_np)
+    os_exit_np[:] = np.nan
+
+    close_np = close.values
+    atr_np = atr.values
+
+    sequence = 1 - np.arange(len(os_np)) * (1 / max_hp)
+    sequence[sequence < 0] = 0
+
+    for j in range(os_exit_np.shape[1]):
+        signal_ = os_np[:, j]
+        close_ = close_np[:, j]
+        atr_ = atr_np[:, j]
+
+        indices = np.where(~np.isnan(signal_))
+        next_idx = 0
+        for i in indices[0]:
+            current_signal = signal_[i]
+
+
+
+            # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
+            if i < next_idx:
+                continue
+
+            if current_signal > 0:
+                c = bn.push(close_[i:])
+                move_max_ = np.maximum.accumulate(c)
+
+                loc = np.isnan(close_[i:])
+                move_max_[loc] = np.nan
+
+
+                close_idx = np.argmax((move_max_ - close_[i:]) > sequence[:len(move_max_)] * atr_multiplier * atr_[i:])
+
+                os_exit_np[i, j] = current_signal
+
+            elif current_signal < 0:
+                c = bn.push(close_[i:])
+                move_min_ = np.minimum.accumulate(c)
+
+                loc = np.isnan(close_[i:])
+                move_min_[loc] = np.nan
+
+                close_idx = np.argmax((close_[i:] - move_min_) > sequence[:len(move_min_)] * atr_multiplier * atr_[i:])
+
+                os_exit_np[i, j] = current_signal
+
+            else:
+                close_idx = 0
+
+            if close_idx:
+                os_exit_np[i + close_idx, j] = 0
+                next_idx = i + close_idx + 1
+
+    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
+
+    return open_signal_exit
+
+
+def exit_w_atr_barrier_legacy(
+        open_signal: pd.DataFrame,
+        close: pd.DataFrame,
+        atr: pd.DataFrame,
+        takeprofit_multiplier=None,
+        stoploss_multiplier=None,
+        max_hp=None
+):
+    # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+
+    os_np = open_signal.values
+    os_exit_np = np.empty_like(os_np)
+    os_exit_np[:] = np.nan
+
+    close_np = close.values
+    atr_np = atr.values
+
+    for j in range(os_exit_np.shape[1]):
+        signal_ = os_np[:, j]
+        close_ = close_np[:, j]
+        atr_ = atr_np[:, j]
+
+        indices = np.where(~np.isnan(signal_))
+        next_idx = 0
+        try:
+            for i in indices[0]:
+                current_signal = signal_[i]
+
+
+
+                # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
+                if i < next_idx:
+                    continue
+
+                if current_signal > 0:
+                    os_exit_np[i, j] = current_signal
+
+                    c = bn.push(close_[i:])
+                    move_max_ = np.maximum.accumulate(c)
+
+                    loc = np.isnan(close_[i:])
+                    move_max_[loc] = np.nan
+
+                    loc = np.full_like(move_max_, False, dtype=bool)
+                    if takeprofit_multiplier is not None:
+                        loc |= (close_[i:] - c[0]) > takeprofit_multiplier * atr_[i:]
+
+                    if stoploss_multiplier is not None:
+                        loc |= (move_max_ - close_[i:]) > stoploss_multiplier * atr_[i:]
+
+                    if max_hp:
+                        non_nan_indices = np.where(~np.isnan(close_[i:]))[0]
+                        idx_max_hp = non_nan_indices[max_hp]
+
+                        loc[idx_max_hp] = True  # max hp in bar
+
+
+                    close_idx = np.argmax(loc)
+
+                elif current_signal < 0:
+                    os_exit_np[i, j] = current_signal
+
+                    c = bn.push(close_[i:])
+                    move_min_ = np.minimum.accumulate(c)
+
+                    loc = np.isnan(close_[i:])
+                    move_min_[loc] = np.nan
+
+                    loc = np.full_like(move_min_, False, dtype=bool)
+                    if takeprofit_multiplier is not None:
+                        loc |= (c[0] - close_[i:]) > takeprofit_multiplier * atr_[i:]
+
+                    if stoploss_multiplier is not None:
+                        loc |= (close_[i:] - move_min_) > stoploss_multiplier * atr_[i:]
+
+                    if max_hp:
+                        non_nan_indices = np.where(~np.isnan(close_[i:]))[0]
+                        idx_max_hp = non_nan_indices[max_hp]
+
+                        loc[idx_max_hp] = True  # max hp in bar
+
+
+                    close_idx = np.argmax(loc)
+
+                else:
+                    close_idx = 0
+
+                if close_idx:
+                    os_exit_np[i + close_idx, j] = 0
+                    next_idx = i + close_idx + 1
+
+        except IndexError:
+            continue
+
+    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
+
+    return open_signal_exit
+
+
+def exit_w_loss_barrier_legacy(
+        open_signal: pd.DataFrame,
+        close: pd.DataFrame,
+        takeprofit=None,
+        stoploss=None,
+        max_hp=None
+):
+    # 有头寸时，会忽略任何信号，直至当前头寸成功平仓
+
+    os_np = open_signal.values
+    os_exit_np = np.empty_like(os_np)
+    os_exit_np[:] = np.nan
+
+    close_np = close.values
+
+    for j in range(os_exit_np.shape[1]):
+        signal_ = os_np[:, j]
+        close_ = close_np[:, j]
+
+        indices = np.where(~np.isnan(signal_))
+        next_idx = 0
+        try:
+            for i in indices[0]:
+                current_signal = signal_[i]
+
+
+
+                # 当存在反手信号时，会忽略反手，直至当前头寸成功平仓
+                if i < next_idx:
+                    continue
+
+                if current_signal > 0:
+                    os_exit_np[i, j] = current_signal
+
+                    c = bn.push(close_[i:])
+                    move_max_ = np.maximum.accumulate(c)
+
+                    loc = np.isnan(close_[i:])
+                    move_max_[loc] = np.nan
+
+                    loc = np.full_like(move_max_, False, dtype=bool)
+                    if takeprofit is not None:
+                        loc |= (close_[i:] / c[0] - 1) > takeprofit
+
+                    if stoploss is not None:
+                        loc |= (close_[i:] / move_max_ - 1) < -stoploss
+
+                    if max_hp:
+                        loc[max_hp] = True
+
+                    close_idx = np.argmax(loc)
+
+                elif current_signal < 0:
+                    os_exit_np[i, j] = current_signal
+
+                    c = bn.push(close_[i:])
+                    move_min_ = np.minimum.accumulate(c)
+
+                    loc = np.isnan(close_[i:])
+                    move_min_[loc] = np.nan
+
+                    loc = np.full_like(move_min_, False, dtype=bool)
+                    if takeprofit is not None:
+                        loc |= (close_[i:] / c[0] - 1) < -takeprofit
+
+                    if stoploss is not None:
+                        loc |= (close_[i:] / move_min_ - 1) > stoploss
+
+                    if max_hp:
+                        loc[max_hp] = True
+
+                    close_idx = np.argmax(loc)
+
+                else:
+                    close_idx = 0
+
+                if close_idx:
+                    os_exit_np[i + close_idx, j] = 0
+                    next_idx = i + close_idx + 1
+
+        except IndexError:
+            continue
+
+    open_signal_exit = pd.DataFrame(os_exit_np, index=open_signal.index, columns=open_signal.columns)
+
+    return open_signal_exit
+
+
+CASES = {
+    "trace_exit": (
+        lambda sig, close, atr: backtest.exit_w_trace_exit(sig, close, 0.02, 20),
+        lambda sig, close, atr: exit_w_trace_exit_legacy(sig, close, 0.02, 20),
+    ),
+    "trace_atr_exit": (
+        lambda sig, close, atr: backtest.exit_w_trace_atr_exit(sig, close, atr, 2, 20),
+        lambda sig, close, atr: exit_w_trace_atr_exit_legacy(sig, close, atr, 2, 20),
+    ),
+    "atr_barrier": (
+        lambda sig, close, atr: backtest.exit_w_atr_barrier(sig, close, atr, 3, 2, 40),
+        lambda sig, close, atr: exit_w_atr_barrier_legacy(sig, close, atr, 3, 2, 40),
+    ),
+    "atr_exit": (
+        lambda sig, close, atr: backtest.exit_w_atr_exit(sig, close, atr, 2),
+        lambda sig, close, atr: exit_w_atr_barrier_legacy(sig, close, atr, None, 2, None),
+    ),
+    "loss_barrier": (
+        lambda sig, close, atr: backtest.exit_w_loss_barrier(sig, close, 0.03, 0.02, 40),
+        lambda sig, close, atr: exit_w_loss_barrier_legacy(sig, close, 0.03, 0.02, 40),
+    ),
+    "loss_exit": (
+        lambda sig, close, atr: backtest.exit_w_loss_exit(sig, close, 0.02),
+        lambda sig, close, atr: exit_w_loss_barrier_legacy(sig, close, None, 0.02, None),
+    ),
+}
+
+
+def make_quote(n_bars=2000, n_symbols=10, signal_rate=0.05, nan_rate=0.02, seed=0):
+    """合成收盘价/atr/开仓信号, 收盘价与信号中均含 nan"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01", periods=n_bars, freq="15min")
+    columns = [f"S{i}" for i in range(n_symbols)]
+
+    close = 4000 * np.exp(rng.normal(0, 0.005, (n_bars, n_symbols)).cumsum(axis=0))
+    close[rng.random((n_bars, n_symbols)) < nan_rate] = np.nan
+
+    atr = np.abs(rng.normal(0, 0.005, (n_bars, n_symbols))) * 4000
+
+    signal = np.full((n_bars, n_symbols), np.nan)
+    loc = rng.random((n_bars, n_symbols)) < signal_rate
+    signal[loc] = rng.choice([-1., 0., 1.], loc.sum())
+
+    def _frame(arr):
+        return pd.DataFrame(arr, index=index, columns=columns)
+
+    return _frame(signal), _frame(close), _frame(atr)
+
+
+def run(n_bars=5000, n_symbols=50):
+    sig, close, atr = make_quote(n_bars, n_symbols)
+
+    for name, (func, legacy) in CASES.items():
+        func(sig.iloc[:10], close.iloc[:10], atr.iloc[:10])  # 编译
+
+        start = time.perf_counter()
+        result = func(sig, close, atr)
+        cost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = legacy(sig, close, atr)
+        cost_legacy = time.perf_counter() - start
+
+        same = np.array_equal(result.values, expected.values, equal_nan=True)
+        print(f"{name:<16}bars={n_bars:>7}  symbols={n_symbols:>4}  legacy={cost_legacy:.3f}s  "
+              f"kernel={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  identical={same}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+"""
+    树状数组滚动 Mann-Kendall 得分与原逐间隔 pct_change + rolling 实现的对比, 15 分钟 bar, 使用合成行情
+
+    python -m tests.benchmark.mks
+    python -m tests.benchmark.mks 20000 50 700
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.research.factor.price_volume.mks import MKS
+from Pandora.research.factor.utils import check_multi_index
+
+
+def mks_legacy(A: np.ndarray, n: int, imax: int = 0):
+    df = pd.Series(A)
+
+    f = pd.Series(0, index=df.index)
+    denom = 0
+    for i in range(1, n):
+
+        if imax and i > imax:
+            break
+
+        chg = np.sign(df.pct_change(i))
+        f += chg.fillna(0).rolling(n - i).sum()
+
+        denom += n - i
+
+    f = f / denom
+
+    return f
+
+
+class MKSLegacy(MKS):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            A = group[self.col_close]
+            f = pd.Series(mks_legacy(A, self.window), index=group.index)
+
+            feat.loc[group.index] = f
+
+        return feat.values
+
+
+def run(n_bars=5000, n_symbols=50, window=700):
+    from tests.benchmark.panel_factors import make_bars
+
+    X = make_bars(n_bars, n_symbols)
+    MKS(10).transform(X.iloc[:1000])  # 编译 numba
+
+    start = time.perf_counter()
+    result = MKS(window).transform(X)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = MKSLegacy(window).transform(X)
+    cost_legacy = time.perf_counter() - start
+
+    assert np.array_equal(result, np.asarray(expected, dtype=np.float64), equal_nan=True)
+    print(f"rows={len(X)}  symbols={n_symbols}  window={window}  legacy={cost_legacy:.3f}s  "
+          f"tree={cost:.3f}s  speedup={cost_legacy / cost:.1f}x")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:4]))
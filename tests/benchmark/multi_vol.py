@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+"""
+    MultiVol 的编译内核与原逐间隔 rolling().apply() 实现的对比, 使用合成 bar 行情
+
+    python -m tests.benchmark.multi_vol
+    python -m tests.benchmark.multi_vol 20000 10 60
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from Pandora.research.factor.price_volume.multi_vol import MultiVol
+from Pandora.research.factor.utils import check_multi_index
+
+
+def _get_factor_legacy(group, param, col_close):
+    assert group.index.is_monotonic_increasing
+
+    v_1 = None
+
+    f = pd.Series(0, index=group.index)
+
+    for q in range(1, param):
+        r2 = np.square(np.log(group[col_close] / group[col_close].shift(q)))
+
+        idx = range(param - 1, -1, -q)
+        n = param / q - 1
+
+        v_q = r2.rolling(window=param).apply(lambda x: np.mean(x[idx]) * n, raw=True)
+
+        if q == 1:
+            v_1 = v_q
+
+        f += v_q
+
+    f = f / v_1 / param
+
+    f = f - 1
+
+    return f
+
+
+class MultiVolLegacy(MultiVol):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        param = self.window
+        feat = pd.Series(index=X.index)
+
+        results = Parallel(n_jobs=self.n_jobs)(  # n_jobs=-1 表示使用所有CPU核心
+            delayed(_get_factor_legacy)(group, param, self.col_close)
+            for code, group in X.groupby(self.col_symbol)
+        )
+
+        for f in results:
+            feat.loc[f.index] = f
+
+        feat = feat.replace([np.inf, -np.inf], 0)
+
+        return feat.values
+
+
+def run(n_bars=5000, n_symbols=10, window=60):
+    from tests.benchmark.panel_factors import make_bars
+
+    X = make_bars(n_bars, n_symbols)
+    MultiVol(5).transform(X.iloc[:1000])  # 编译 numba
+
+    start = time.perf_counter()
+    result = MultiVol(window).transform(X)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = MultiVolLegacy(window, n_jobs=1).transform(X)
+    cost_legacy = time.perf_counter() - start
+
+    np.testing.assert_allclose(result, np.asarray(expected, dtype=np.float64), rtol=1e-9, atol=1e-12)
+    print(f"rows={len(X)}  symbols={n_symbols}  window={window}  legacy={cost_legacy:.3f}s  "
+          f"kernel={cost:.3f}s  speedup={cost_legacy / cost:.1f}x")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:4]))
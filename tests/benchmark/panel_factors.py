@@ -0,0 +1,371 @@
+# -*- coding:utf-8 -*-
+"""
+    Panel 因子与原逐品种 groupby 实现的对比, 使用合成 bar 行情, 不依赖数据库
+
+    python -m tests.benchmark.panel_factors
+    python -m tests.benchmark.panel_factors 20000 30
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import talib
+
+from Pandora.research.factor.price_volume.acf import ACF
+from Pandora.research.factor.price_volume.coef_var import CoefVar
+from Pandora.research.factor.price_volume.cpt import CPT
+from Pandora.research.factor.price_volume.er import ER
+from Pandora.research.factor.price_volume.mks import MKS
+from Pandora.research.factor.price_volume.ptc import PTC
+from Pandora.research.factor.price_volume.ret import Ret
+from Pandora.research.factor.price_volume.skew import Skew
+from Pandora.research.factor.price_volume.stm import STM
+from Pandora.research.factor.price_volume.stm_cs_stm import STMCsSTM
+from Pandora.research.factor.price_volume.stm_ts_stm import STMTsSTM
+from Pandora.research.factor.price_volume.tscorr import TSCorr
+from Pandora.research.factor.price_volume.williamlowershadow_std import WilliamLowerShadowStd
+from Pandora.research.factor.utils import check_multi_index, rolling_rank
+from tests.benchmark.mks import MKSLegacy
+
+
+class ACFLegacy(ACF):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            r = np.log(1 + group[self.col_close].pct_change())
+
+            f = r.rolling(self.window).corr(r.shift(self.lag))
+
+            feat.loc[group.index] = f
+
+        feat = feat.replace([np.inf, -np.inf], 0)
+
+        return feat.values
+
+
+class CoefVarLegacy(CoefVar):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            r = np.log(1 + group[self.col_close].pct_change())
+
+            f = r.rolling(self.window).mean() / r.rolling(self.window).std()
+
+            feat.loc[group.index] = f
+
+        feat = feat.replace([np.inf, -np.inf], 0)
+
+        return feat.values
+
+
+class CPTLegacy(CPT):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            p = group.loc[:, self.col_close]
+            v = group.loc[:, self.col_open_interest]
+
+            cpv = p.rolling(self.window).corr(v)
+            f = cpv.rolling(self.window, min_periods=1).mean()
+            feat.loc[group.index] = f
+
+        feat = feat.replace([np.inf, -np.inf], 0)
+
+        return feat.values
+
+
+class ERLegacy(ER):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            r = np.log(1 + group[self.col_close].pct_change())
+            rn = np.log(1 + group[self.col_close].pct_change(self.window))
+
+            f = rn / r.abs().rolling(self.window).sum()
+            feat.loc[group.index] = f
+
+        feat = feat.replace([np.inf, -np.inf], 0)
+
+        return feat.values
+
+
+class PTCLegacy(PTC):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        fast = self.window
+        slow = int(fast * 26 / 12)
+        signal = int(fast * 9 / 12)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            hh = group.loc[:, self.col_high].rolling(self.window).max()
+            ll = group.loc[:, self.col_low].rolling(self.window).min()
+            a = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+
+            (dif,
+             dea,
+             bar) = talib.MACD(group.loc[:, self.col_close],
+                               fastperiod=fast,
+                               slowperiod=slow,
+                               signalperiod=signal
+                               )
+
+            std = group.loc[:, self.col_close].rolling(window=fast).std()
+
+            bar = bar / std
+
+            loc = std == 0
+            bar[loc] = 0
+
+            feat.loc[group.index] = a - bar
+
+        return feat.values
+
+
+class RetLegacy(Ret):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            f = np.log(1 + group[self.col_close].pct_change()).rolling(self.window).sum()
+
+            feat.loc[group.index] = f
+
+        return feat.values
+
+
+class SkewLegacy(Skew):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            r = np.log(1 + group[self.col_close].pct_change())
+
+            f = r.rolling(self.window).skew()
+            feat.loc[group.index] = f
+
+        return feat.values
+
+
+class STMLegacy(STM):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            hh = group.loc[:, self.col_high].rolling(self.window).max()
+            ll = group.loc[:, self.col_low].rolling(self.window).min()
+            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+
+            feat.loc[group.index] = f
+
+        return feat.values
+
+
+class STMCsSTMLegacy(STMCsSTM):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        ret = pd.Series(index=X.index)
+        feat = {}
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            hh = group.loc[:, self.col_high].rolling(self.window).max()
+            ll = group.loc[:, self.col_low].rolling(self.window).min()
+            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+
+            feat[code] = f.reset_index(self.col_symbol, drop=True)
+
+        feat = pd.DataFrame(feat)
+
+        hh = feat.ffill().max(axis=1)
+        ll = feat.ffill().min(axis=1)
+
+        feat = ((feat * 2).sub(hh + ll, axis=0).div(hh - ll, axis=0) + 1) / 2
+
+        feat_name = self.get_feature_names_out()[0]
+        f = feat.melt(ignore_index=False, var_name=self.col_symbol, value_name=feat_name).set_index(self.col_symbol, append=True)[feat_name]
+        ret.loc[X.index] = f.loc[X.index]
+
+        return ret.values
+
+
+class STMTsSTMLegacy(STMTsSTM):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            hh = group.loc[:, self.col_high].rolling(self.window).max()
+            ll = group.loc[:, self.col_low].rolling(self.window).min()
+            f = ((group.loc[:, self.col_close] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+
+            hh = f.rolling(self.window).max()
+            ll = f.rolling(self.window).min()
+
+            f = (f * 2 - (hh + ll)) / (hh - ll)
+
+            feat.loc[group.index] = f
+
+        return feat.values
+
+
+class TSCorrLegacy(TSCorr):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        feat = pd.Series(index=X.index)
+        for code, data in X.groupby(self.col_symbol):
+
+            assert data.index.is_monotonic_increasing
+
+            rolling_ret = self.window
+            rolling_vol = rolling_ret * 4
+            rank_window = rolling_ret
+            relative_close = data.loc[:, self.col_close] / data.loc[:, self.col_close].rolling(rolling_ret, min_periods=1).mean()
+            relative_vol = (data.loc[:, self.col_volume] / data.loc[:, self.col_volume].rolling(rolling_vol, min_periods=1).mean()).fillna(0)
+        
+            corr = talib.CORREL(relative_close, relative_vol, timeperiod=rank_window)
+        
+            rank = rolling_rank(data.loc[:, self.col_volume], rank_window, pct=True)
+            # rank = data.loc[:, self.col_volume].rolling(rank_window, min_periods=1).apply(lambda x: x.rank(pct=True).iat[-1])
+            f = corr * rank
+
+            feat.loc[data.index] = f
+
+        return feat.values
+
+
+class WilliamLowerShadowStdLegacy(WilliamLowerShadowStd):
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        check_multi_index(X, self.col_datetime, self.col_symbol)
+
+        param = self.window
+        feat = pd.Series(index=X.index)
+        for code, group in X.groupby(self.col_symbol):
+
+            assert group.index.is_monotonic_increasing
+
+            ll = group[self.col_low].rolling(param).min()
+            f = (ll - group[self.col_close])
+
+            fma = f.rolling(param).std()
+
+            f = f / fma
+
+            loc = fma == 0
+            f[loc] = 0
+
+            feat.loc[group.index] = f * -1
+
+        return feat.values
+
+
+def make_bars(n_bars=3000, n_symbols=6, seed=0):
+    """
+        合成 (datetime, symbol) 索引的 bar: 各品种上市时间不同, 一半品种没有夜盘
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01 09:00", periods=n_bars, freq="15min", name="datetime")
+
+    bars = []
+    for i in range(n_symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n_bars)))
+        spread = close * rng.uniform(0, 0.004, n_bars)
+        bar = pd.DataFrame({
+            'symbol': f"S{i}",
+            'open_price': close + rng.normal(0, 0.1, n_bars),
+            'high_price': close + spread,
+            'low_price': close - spread,
+            'close_price': close,
+            'volume': rng.integers(0, 1000, n_bars).astype(float),
+            'open_interest': 1e5 + np.cumsum(rng.normal(0, 100, n_bars)),
+        }, index=index)
+
+        bar = bar.iloc[int(rng.integers(0, n_bars // 4)):]
+        if i % 2:
+            bar = bar[(bar.index.hour >= 9) & (bar.index.hour < 15)]
+
+        bars.append(bar)
+
+    return pd.concat(bars).sort_index(kind='stable').set_index('symbol', append=True)
+
+
+CASES = {
+    'ACF': (ACF(50, lag=2), ACFLegacy(50, lag=2)),
+    'CoefVar': (CoefVar(50), CoefVarLegacy(50)),
+    'CPT': (CPT(40), CPTLegacy(40)),
+    'ER': (ER(30), ERLegacy(30)),
+    'MKS': (MKS(60), MKSLegacy(60)),
+    'PTC': (PTC(24), PTCLegacy(24)),
+    'Ret': (Ret(30), RetLegacy(30)),
+    'Skew': (Skew(50), SkewLegacy(50)),
+    'STM': (STM(40), STMLegacy(40)),
+    'STMCsSTM': (STMCsSTM(40), STMCsSTMLegacy(40)),
+    'STMTsSTM': (STMTsSTM(40), STMTsSTMLegacy(40)),
+    'TSCorr': (TSCorr(30), TSCorrLegacy(30)),
+    'WilliamLowerShadowStd': (WilliamLowerShadowStd(30), WilliamLowerShadowStdLegacy(30)),
+}
+
+
+def run(n_bars=20000, n_symbols=30):
+    X = make_bars(n_bars, n_symbols)
+
+    for name, (factor, legacy) in CASES.items():
+        factor.transform(X.iloc[:1000])  # 编译 numba
+        start = time.perf_counter()
+        result = factor.transform(X)
+        cost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = legacy.transform(X)
+        cost_legacy = time.perf_counter() - start
+
+        assert np.array_equal(result, np.asarray(expected, dtype=np.float64), equal_nan=True), name
+        print(f"{name:<22s} rows={len(X)}  groupby={cost_legacy:.3f}s  panel={cost:.3f}s  "
+              f"speedup={cost_legacy / cost:.1f}x")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
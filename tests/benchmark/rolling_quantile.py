@@ -0,0 +1,40 @@
+# -*- coding:utf-8 -*-
+"""
+    树状数组多分位数与 pandas rolling().quantile() 的对比, 窗口为 tick 级别(LSR 的 0.5 天 = 20700 tick)
+
+    python -m tests.benchmark.rolling_quantile
+    python -m tests.benchmark.rolling_quantile 2000000 20700
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.research.rolling import rolling_quantile
+from tests.benchmark.rolling_rank import make_series
+
+
+def run(n_ticks=1000000, window=20700):
+    series = make_series(n_ticks, nan_rate=0)
+    quantiles = [0.9, 0.6, 0.4, 0.1]
+    rolling_quantile(series.values[:1000], 10, quantiles)  # 编译
+
+    start = time.perf_counter()
+    result = rolling_quantile(series, window, quantiles, min_periods=1)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rolling = series.rolling(window, min_periods=1)
+    expected = [rolling.quantile(q) for q in quantiles]
+    cost_pandas = time.perf_counter() - start
+
+    for r, e in zip(result, expected):
+        pd.testing.assert_series_equal(r, e)
+
+    print(f"ticks={n_ticks}  window={window}  quantiles={len(quantiles)}  pandas={cost_pandas:.3f}s  "
+          f"tree={cost:.3f}s  speedup={cost_pandas / cost:.1f}x")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
@@ -0,0 +1,73 @@
+# -*- coding:utf-8 -*-
+"""
+    树状数组滚动排名与 utils.rolling_rank 原实现(window 个 shift 序列求和), bn.move_rank(O(n * window)) 的对比
+
+    python -m tests.benchmark.rolling_rank
+    python -m tests.benchmark.rolling_rank 200000
+"""
+import sys
+import time
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+
+from Pandora.research.factor.utils import rolling_rank
+from Pandora.research.rolling import rolling_rank as rolling_rank_engine
+
+
+def rolling_rank_legacy(series: pd.Series, window: int, min_periods: int = None, pct=True, n_group: int = None):
+    tmp = series.dropna()
+    count = sum(tmp.shift(n).le(tmp) for n in range(window))
+
+    if min_periods:
+        count.iloc[:min_periods] = np.nan
+
+    else:
+        count.iloc[:window] = np.nan
+
+    if pct:
+        return count / window
+
+    if n_group:
+        return np.ceil(count / window * n_group)
+
+    return count
+
+
+def make_series(n_bars=100000, nan_rate=0.01, seed=0):
+    """合成成交量: 取整后有大量相等值, 含 nan"""
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.lognormal(3, 1, n_bars))
+    values[rng.random(n_bars) < nan_rate] = np.nan
+
+    return pd.Series(values, index=pd.date_range("2020-01-01", periods=n_bars, freq="1min", name="datetime"))
+
+
+def _timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(n_bars=100000):
+    series = make_series(n_bars)
+    rolling_rank_engine(series.values[:1000], 10)  # 编译
+
+    for window in (100, 1000, 10000, 50000):
+        result, cost = _timeit(rolling_rank, series, window)
+        line = f"window={window:<6d} tree={cost:.3f}s"
+
+        if window <= 1000:
+            expected, cost_legacy = _timeit(rolling_rank_legacy, series, window)
+            assert np.array_equal(result.values, expected.values, equal_nan=True)
+            line += f"  shift_sum={cost_legacy:.3f}s"
+
+        signed, cost = _timeit(rolling_rank_engine, series.values, window, 100, norm='signed')
+        expected, cost_bn = _timeit(bn.move_rank, series.values, window, min_count=100)
+        assert np.array_equal(signed, expected, equal_nan=True)
+        print(f"{line}  tree_signed={cost:.3f}s  bn.move_rank={cost_bn:.3f}s")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:2]))
@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+"""
+    BacktestSweep 批量回测与逐组调用 backtest_and_summary 的对比, 使用合成行情, 不依赖数据库
+
+    python -m tests.benchmark.sweep
+    python -m tests.benchmark.sweep 20000 50 64 4
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.research import backtest
+from Pandora.research.sweep import BacktestSweep
+
+
+def make_ret(n_bars=5000, n_symbols=20, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01 09:00", periods=n_bars, freq="15min", name="datetime")
+    ret = pd.DataFrame(rng.normal(0, 0.003, (n_bars, n_symbols)), index=index, columns=[f"S{i}" for i in range(n_symbols)])
+    ret.iloc[: n_bars // 10, 0] = np.nan
+
+    return ret
+
+
+def make_signals(ret, n_params=16, seed=1):
+    """(参数, 时间, 品种) 开仓信号, 参数为 trade_by_std 的窗口"""
+    rng = np.random.default_rng(seed)
+    feature = ret.rolling(10).sum().shift() + rng.normal(0, 0.01, ret.shape)
+    windows = np.linspace(20, 400, n_params).astype(int)
+
+    return windows, np.stack([backtest.trade_by_std(feature, w, 1.5) for w in windows])
+
+
+def run(n_bars=5000, n_symbols=20, n_params=16, n_jobs=1):
+    ret = make_ret(n_bars, n_symbols)
+    windows, signals = make_signals(ret, n_params)
+
+    start = time.perf_counter()
+    summary, _ = BacktestSweep(ret, n_jobs=n_jobs).run(signals, params=windows)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = []
+    for signal in signals:
+        _, s, _ = backtest.backtest_and_summary(pd.DataFrame(signal, index=ret.index, columns=ret.columns), ret)
+        expected.append(s['sharpe'])
+    cost_legacy = time.perf_counter() - start
+
+    diff = np.max(np.abs(summary['sharpe'].values - np.array(expected)))
+    print(f"bars={n_bars}  symbols={n_symbols}  params={n_params}  n_jobs={n_jobs}  "
+          f"loop={cost_legacy:.3f}s  sweep={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  max_sharpe_diff={diff:.2e}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:5]))
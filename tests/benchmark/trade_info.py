@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+"""
+    get_trade_info 游程编码实现与原逐列 groupby 实现的对比, 使用合成持仓, 不依赖数据库
+
+    python -m tests.benchmark.trade_info
+    python -m tests.benchmark.trade_info 50000 100
+"""
+import sys
+import time
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+
+from Pandora.research import backtest
+from Pandora.research.backtest import describe_trade
+
+
+def get_trade_info_legacy(returns, signal, day_count=23, comm=3e-4):
+    sig = pd.DataFrame(signal, index=returns.index, columns=returns.columns)
+    trade = sig.diff().fillna(0).abs().cumsum() * np.sign(sig)
+    trade[sig == 0] = 0
+
+    trade_detail = []
+    trade_info_col = {}
+    for col in trade.columns:
+        trade_col = trade[col]
+        returns_col = returns[col] / sig[col].abs()
+
+        trade_ret = returns_col.groupby(trade_col).sum() - comm * 2
+        trade_weight = sig[col].groupby(trade_col).mean()
+
+        trade_hp = trade_col.value_counts()
+        trade_hp = trade_hp[trade_hp.index != 0] / day_count
+
+        trade_ = trade_col.reset_index()
+        trade_detail_col = pd.DataFrame(columns=['symbol', 'HP', 'PnL'])
+        trade_detail_col['EnterTime'] = trade_.groupby(col)['datetime'].first()
+        trade_detail_col['ExitTime'] = trade_.groupby(col)['datetime'].last()
+
+        trade_detail_col['Weight'] = trade_weight
+        trade_detail_col['PnL'] = trade_ret
+        trade_detail_col['HP'] = trade_hp
+        trade_detail_col = trade_detail_col.reset_index().rename(columns={col: 'TradeID'})
+        trade_detail_col['Direction'] = np.sign(trade_detail_col['TradeID'])
+        trade_detail_col['symbol'] = col
+
+        loc = trade_detail_col['TradeID'] != 0
+        trade_detail_col = trade_detail_col[loc]
+
+        trade_detail.append(trade_detail_col)
+
+        trade_describe = describe_trade(trade_detail_col)
+        trade_info_col[col] = trade_describe
+
+    trade_info_col = pd.DataFrame(trade_info_col)
+    trade_detail = pd.concat(trade_detail).reset_index(drop=True)
+
+    trade_describe = describe_trade(trade_detail)
+    cols_n = len([i for i in trade_describe.index if (not i.startswith('long') and not i.startswith('short'))])
+    trade_info = pd.DataFrame(
+        {
+            'overall': trade_describe.iloc[: cols_n],
+            'long': trade_describe.iloc[cols_n: cols_n * 2].values,
+            'short': trade_describe.iloc[cols_n * 2:].values,
+        }
+    )
+
+    return trade_info.T, trade_info_col.T, trade_detail
+
+
+def make_position(n_bars=5000, n_symbols=20, seed=0):
+    """
+        合成持仓与收益: 头部 nan, 含加减仓(0.5/1)与平仓(0)
+    :return: (returns, signal)
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01 09:00", periods=n_bars, freq="15min", name="datetime")
+    columns = [f"S{i}" for i in range(n_symbols)]
+
+    open_signal = np.full((n_bars, n_symbols), np.nan)
+    loc = rng.random((n_bars, n_symbols)) < 0.05
+    open_signal[loc] = rng.choice([-1., -0.5, 0., 0.5, 1.], loc.sum())
+    signal = bn.push(open_signal, axis=0)
+
+    ret = rng.normal(0, 0.003, (n_bars, n_symbols))
+    ret[rng.random((n_bars, n_symbols)) < 0.01] = np.nan
+    returns = pd.DataFrame(ret * signal, index=index, columns=columns)
+
+    return returns, signal
+
+
+def run(n_bars=20000, n_symbols=50):
+    returns, signal = make_position(n_bars, n_symbols)
+
+    start = time.perf_counter()
+    info, info_col, detail = backtest.get_trade_info(returns, signal)
+    cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    info_legacy, info_col_legacy, detail_legacy = get_trade_info_legacy(returns, signal)
+    cost_legacy = time.perf_counter() - start
+
+    diff = np.nanmax(np.abs(detail['PnL'].values - detail_legacy['PnL'].values))
+    print(f"bars={n_bars}  symbols={n_symbols}  trades={len(detail)}  legacy={cost_legacy:.3f}s  "
+          f"rle={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  max_pnl_diff={diff:.2e}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
@@ -0,0 +1,301 @@
+# -*- coding:utf-8 -*-
+"""
+    trade_by_* 信号函数二维数组实现与原逐列 pandas 实现的对比, 使用含 nan 间断的合成因子, 不依赖数据库
+
+    python -m tests.benchmark.trade_signals
+    python -m tests.benchmark.trade_signals 200000 500
+"""
+import sys
+import time
+
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+
+from Pandora.research import backtest
+
+
+def trade_by_quantile_imba_legacy(feature, window, quantile_upper_long, quantile_lower_long,
+                                  window_short=None,
+                                  quantile_upper_short=None, quantile_lower_short=None):
+    quantile_lower_short = quantile_lower_short or 1 - quantile_upper_long
+    quantile_upper_short = quantile_upper_short or 1 - quantile_lower_long
+    window_short = window_short or window
+
+    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
+    for col in range(feature.shape[1]):
+        ft = feature.iloc[:, col].dropna()
+        upper_long = ft.rolling(window=window, min_periods=min(window, 100)).quantile(quantile_upper_long)
+        lower_long = ft.rolling(window=window, min_periods=min(window, 100)).quantile(quantile_lower_long)
+
+        # buggy when upper_short > lower_long
+        upper_short = ft.rolling(window=window_short, min_periods=min(window_short, 100)).quantile(quantile_upper_short)
+        lower_short = ft.rolling(window=window_short, min_periods=min(window_short, 100)).quantile(quantile_lower_short)
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = (ft >= upper_long)
+        sig.loc[loc] = 1
+
+        loc = (ft <= lower_long) & (ft.shift() > lower_long.shift())
+        sig.loc[loc] = 0
+
+        loc = (ft >= upper_short) & (ft.shift() < upper_short.shift())
+        sig.loc[loc] = 0
+
+        loc = (ft <= lower_short)
+        sig.loc[loc] = -1
+
+
+        sig_ = np.sign(sig.ffill().diff().fillna(0))
+        sig_.loc[sig_ == 0] = np.nan
+        sig_.loc[sig == 0] = 0
+        open_signal_df[open_signal_df.columns[col]] = sig_
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_quantile_legacy(feature, window, quantile_upper_long, one_shot=True):
+    quantile_lower_short = 1 - quantile_upper_long
+
+    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
+    for col in range(feature.shape[1]):
+        ft = feature.iloc[:, col].dropna()
+
+        rank = (bn.move_rank(ft, window, min_count=min(100, window), axis=0) + 1) / 2
+
+        rank_shift = np.roll(rank, 1)
+        rank_shift[0] = np.nan
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = (rank >= quantile_upper_long)
+        sig.loc[loc] = 1
+
+        loc = (rank <= 0.5) & (rank_shift > 0.5)
+        sig.loc[loc] = 0
+
+        loc = (rank >= 0.5) & (rank_shift < 0.5)
+        sig.loc[loc] = 0
+
+        loc = (rank <= quantile_lower_short)
+        sig.loc[loc] = -1
+
+        if one_shot:
+            sig_ = np.sign(sig.ffill().diff().fillna(0))
+            sig_.loc[sig_ == 0] = np.nan
+            sig_.loc[sig == 0] = 0
+            open_signal_df[open_signal_df.columns[col]] = sig_
+
+        else:
+            open_signal_df[open_signal_df.columns[col]] = sig
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_thres_imba_legacy(feature, thres_open_long, thres_open_short, thres_close_long, thres_close_short):
+    open_signal_df = pd.DataFrame(np.nan, index=feature.index, columns=feature.columns)
+    for col in range(feature.shape[1]):
+        ft = feature.iloc[:, col].dropna()
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = (ft >= thres_open_long)
+        sig.loc[loc] = 1
+
+        loc = (ft <= thres_close_long) & (ft.shift() > thres_close_long)
+        sig.loc[loc] = 0
+
+        loc = (ft >= thres_close_short) & (ft.shift() < thres_close_short)
+        sig.loc[loc] = 0
+
+        loc = (ft <= thres_open_short)
+        sig.loc[loc] = -1
+
+
+        sig_ = np.sign(sig.ffill().diff().fillna(0))
+        sig_.loc[sig_ == 0] = np.nan
+        sig_.loc[sig == 0] = 0
+        open_signal_df[open_signal_df.columns[col]] = sig_
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_cross_ma_legacy(feat, window):
+    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
+    for col in range(feat.shape[1]):
+        ft = feat.iloc[:, col].dropna()
+        MA = bn.move_mean(ft.values, window, 1, axis=0)
+
+        cross = ft - MA
+
+        sig = pd.Series(np.nan, index=cross.index)
+        loc = (cross > 0) & (cross.shift() <= 0)
+        sig.loc[loc] = 1
+
+        loc = (cross < 0) & (cross.shift() >= 0)
+        sig.loc[loc] = -1
+
+        open_signal_df[open_signal_df.columns[col]] = sig
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_norm_legacy(feat, std_multiplier=1):
+    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
+    for col in range(feat.shape[1]):
+        ft = feat.iloc[:, col].dropna()
+
+        mean = 0
+        std = 1
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = ft > (mean + std_multiplier * std)
+        sig.loc[loc] = 1
+
+        loc = (ft < mean) & (ft.shift() > mean)
+        sig.loc[loc] = 0
+
+        loc = ft < (mean - std_multiplier * std)
+        sig.loc[loc] = -1
+
+        loc = (ft > mean) & (ft.shift() < mean)
+        sig.loc[loc] = 0
+
+        sig_ = np.sign(sig.ffill().diff().fillna(0))
+        sig_.loc[sig_ == 0] = np.nan
+        sig_.loc[sig == 0] = 0
+
+        open_signal_df[open_signal_df.columns[col]] = sig_
+
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_std_w_0_legacy(feat, window, std_multiplier=1):
+    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
+    for col in range(feat.shape[1]):
+        ft = feat.iloc[:, col].dropna()
+
+        mean = ft.rolling(window=window).mean()
+        std = ft.rolling(window=window).std()
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = ft > (mean + std_multiplier * std)
+        sig.loc[loc] = 1
+
+        loc = (ft < mean) & (ft.shift() > mean.shift())
+        sig.loc[loc] = 0
+
+        loc = ft < (mean - std_multiplier * std)
+        sig.loc[loc] = -1
+
+        loc = (ft > mean) & (ft.shift() < mean.shift())
+        sig.loc[loc] = 0
+
+        sig_ = np.sign(sig.ffill().diff().fillna(0))
+        sig_.loc[sig_ == 0] = np.nan
+        sig_.loc[sig == 0] = 0
+
+        open_signal_df[open_signal_df.columns[col]] = sig_
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+def trade_by_std_legacy(feat, window, std_multiplier=1):
+    open_signal_df = pd.DataFrame(np.nan, index=feat.index, columns=feat.columns)
+    for col in range(feat.shape[1]):
+        ft = feat.iloc[:, col].dropna()
+
+        mean = ft.rolling(window=window).mean()
+        std = ft.rolling(window=window).std()
+
+        sig = pd.Series(np.nan, index=ft.index)
+        loc = ft > (mean + std_multiplier * std)
+        sig.loc[loc] = 1
+
+        loc = ft < (mean - std_multiplier * std)
+        sig.loc[loc] = -1
+
+        sig_ = np.sign(sig.ffill().diff().fillna(0))
+        sig_.loc[sig_ == 0] = np.nan
+        sig_.loc[sig == 0] = 0
+
+        open_signal_df[open_signal_df.columns[col]] = sig_
+
+    open_signal = open_signal_df.values
+    return open_signal
+
+
+CASES = {
+    "quantile_imba": (
+        lambda ft: backtest.trade_by_quantile_imba(ft, 200, 0.9, 0.6),
+        lambda ft: trade_by_quantile_imba_legacy(ft, 200, 0.9, 0.6),
+    ),
+    "quantile": (
+        lambda ft: backtest.trade_by_quantile(ft, 200, 0.9),
+        lambda ft: trade_by_quantile_legacy(ft, 200, 0.9),
+    ),
+    "quantile_all": (
+        lambda ft: backtest.trade_by_quantile(ft, 200, 0.9, one_shot=False),
+        lambda ft: trade_by_quantile_legacy(ft, 200, 0.9, one_shot=False),
+    ),
+    "thres_imba": (
+        lambda ft: backtest.trade_by_thres_imba(ft, 1, -1, 0.2, -0.2),
+        lambda ft: trade_by_thres_imba_legacy(ft, 1, -1, 0.2, -0.2),
+    ),
+    "cross_ma": (
+        lambda ft: backtest.trade_by_cross_ma(ft, 50),
+        lambda ft: trade_by_cross_ma_legacy(ft, 50),
+    ),
+    "norm": (
+        lambda ft: backtest.trade_by_norm(ft, 1.5),
+        lambda ft: trade_by_norm_legacy(ft, 1.5),
+    ),
+    "std_w_0": (
+        lambda ft: backtest.trade_by_std_w_0(ft, 100, 2),
+        lambda ft: trade_by_std_w_0_legacy(ft, 100, 2),
+    ),
+    "std": (
+        lambda ft: backtest.trade_by_std(ft, 100, 2),
+        lambda ft: trade_by_std_legacy(ft, 100, 2),
+    ),
+}
+
+
+def make_feature(n_bars=5000, n_symbols=20, nan_rate=0.02, seed=0):
+    """合成因子, 每列上市时间不同(头部 nan), 中间随机 nan 间断"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01", periods=n_bars, freq="15min")
+
+    values = rng.normal(0, 1, (n_bars, n_symbols))
+    values = 0.9 * values + 0.1 * np.cumsum(values, axis=0) / np.sqrt(np.arange(1, n_bars + 1))[:, None]
+    values[rng.random((n_bars, n_symbols)) < nan_rate] = np.nan
+    for j, first in enumerate(rng.integers(0, n_bars // 2, n_symbols)):
+        values[:first, j] = np.nan
+
+    return pd.DataFrame(values, index=index, columns=[f"S{i}" for i in range(n_symbols)])
+
+
+def run(n_bars=20000, n_symbols=100):
+    ft = make_feature(n_bars, n_symbols)
+
+    for name, (func, legacy) in CASES.items():
+        start = time.perf_counter()
+        result = func(ft)
+        cost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = legacy(ft)
+        cost_legacy = time.perf_counter() - start
+
+        same = np.array_equal(result, expected, equal_nan=True)
+        print(f"{name:<16}bars={n_bars:>8}  symbols={n_symbols:>4}  legacy={cost_legacy:.3f}s  "
+              f"array={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  identical={same}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+"""
+    get_weight_by_3d / get_weight_by_std_corr 流式相关系数实现与原 rolling().corr() 实现的对比, 使用合成行情, 不依赖数据库
+
+    python -m tests.benchmark.weights
+    python -m tests.benchmark.weights 20000 30
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.research import backtest
+
+
+def get_weight_by_3d_legacy(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_max=0.65):
+    std = {}
+    r_mat = {}
+    stm_mat = {}
+    for code, group in quote.groupby('symbol'):
+        f = np.log(1 + group['close_price'].pct_change()).rolling(param, min_periods=min(100, param)).std()
+        std[code] = f * np.sqrt(252 * day_count)
+        r_mat[code] = np.log(1 + group['close_price'].pct_change())
+
+        hh = group.loc[:, 'high_price'].rolling(param, min_periods=1).max()
+        ll = group.loc[:, 'low_price'].rolling(param, min_periods=1).min()
+        stm_mat[code] = ((group.loc[:, 'close_price'] * 2 - (hh + ll)).ewm(span=5).mean()) / ((hh - ll).ewm(span=5).mean())
+
+    std = pd.DataFrame(std)
+    r_mat = pd.DataFrame(r_mat)
+    stm_mat = pd.DataFrame(stm_mat)
+
+    corr = r_mat.rolling(param, min_periods=100).corr().abs().mean(axis=1).reset_index()
+    corr.columns = ['datetime', 'symbol', 'corr']
+    corr = corr.pivot(index='datetime', columns='symbol', values='corr')
+
+    weight = std + corr
+    weight = (thres_max - weight) / (thres_max - thres_min)
+    weight = weight * 2 / 3 + stm_mat.abs() / 3
+
+    if n:
+        weight = (weight * (n - 1) + 1) / n
+
+        loc = weight > 1
+        weight[loc] = 1
+
+        loc = weight < 1 / n
+        weight[loc] = 1 / n
+
+    close = quote.pivot(columns='symbol', values='close_price')
+    trading_contract = (~pd.isna(close.ffill())).sum(axis=1)
+
+    weight = weight.div(trading_contract, axis=0)
+
+    return weight.ffill()
+
+
+def get_weight_by_std_corr_legacy(quote, param=500, day_count=23, n=3, thres_min=0.25, thres_max=0.65):
+    std = {}
+    r_mat = {}
+    for code, group in quote.groupby('symbol'):
+        f = np.log(1 + group['close_price'].pct_change()).rolling(param, min_periods=min(100, param)).std()
+        std[code] = f * np.sqrt(252 * day_count)
+        r_mat[code] = np.log(1 + group['close_price'].pct_change())
+
+    std = pd.DataFrame(std)
+
+    r_mat = pd.DataFrame(r_mat)
+    corr = r_mat.rolling(param, min_periods=100).corr().abs().mean(axis=1).reset_index()
+    corr.columns = ['datetime', 'symbol', 'corr']
+    corr = corr.pivot(index='datetime', columns='symbol', values='corr')
+
+    weight = std + corr
+    weight = ((thres_max - weight) / (thres_max - thres_min) * (n - 1) + 1) / n
+
+    loc = weight > 1
+    weight[loc] = 1
+
+    loc = weight < 1 / n
+    weight[loc] = 1 / n
+
+    close = quote.pivot(columns='symbol', values='close_price')
+    trading_contract = (~pd.isna(close.ffill())).sum(axis=1)
+
+    weight = weight.div(trading_contract, axis=0)
+
+    return weight.ffill()
+
+
+def make_quote(n_bars=5000, n_symbols=10, seed=0):
+    """
+        合成长表行情: 各品种上市时间不同, 一半品种没有夜盘(合并时间轴上有 nan)
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-01-01 09:00", periods=n_bars, freq="15min", name="datetime")
+    factor = rng.normal(0, 0.002, n_bars)
+
+    quotes = []
+    for i in range(n_symbols):
+        ret = factor * rng.uniform(0.2, 1.5) + rng.normal(0, 0.003, n_bars)
+        close = 100 * np.exp(np.cumsum(ret))
+        spread = close * rng.uniform(0, 0.004, n_bars)
+        quote = pd.DataFrame({
+            'symbol': f"S{i}", 'close_price': close, 'high_price': close + spread, 'low_price': close - spread,
+        }, index=index)
+
+        quote = quote.iloc[int(rng.integers(0, n_bars // 4)):]
+        if i % 2:
+            quote = quote[(quote.index.hour >= 9) & (quote.index.hour < 15)]
+
+        quotes.append(quote)
+
+    return pd.concat(quotes).sort_index(kind='stable')
+
+
+def run(n_bars=5000, n_symbols=20):
+    quote = make_quote(n_bars, n_symbols)
+
+    for func, legacy in [
+        (backtest.get_weight_by_std_corr, get_weight_by_std_corr_legacy),
+        (backtest.get_weight_by_3d, get_weight_by_3d_legacy),
+    ]:
+        start = time.perf_counter()
+        weight = func(quote)
+        cost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = legacy(quote)
+        cost_legacy = time.perf_counter() - start
+
+        diff = np.nanmax(np.abs(weight.values - expected.values))
+        print(f"{func.__name__}  bars={n_bars}  symbols={n_symbols}  legacy={cost_legacy:.3f}s  "
+              f"streaming={cost:.3f}s  speedup={cost_legacy / cost:.1f}x  max_diff={diff:.2e}")
+
+
+if __name__ == '__main__':
+    run(*map(int, sys.argv[1:3]))
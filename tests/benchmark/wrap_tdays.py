@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+"""
+    TDays.wrap_tdays 纳秒时间戳实现与原 merge_asof 实现的对比, 使用合成日历, 不依赖数据库
+
+    python -m tests.benchmark.wrap_tdays
+"""
+import datetime as dt
+import time
+
+import numpy as np
+import pandas as pd
+
+from Pandora.helper.date import TDays, TradingCalendar
+
+
+def wrap_tdays_legacy(df: pd.DataFrame, col_dt='DateTime', col_tdate='TradeDate'):
+    col_daten = "__DateN"
+    col_date = "__Date"
+    col_next = "__NextDate"
+
+    calendar = TDays.get_trading_calendar(exchange='SHFE')
+    calendar.loc[:, col_date] = calendar.loc[:, 'Date']
+    calendar.loc[:, col_next] = calendar.loc[:, col_date].shift(-1)
+    calendar = calendar.loc[:, [col_date, col_next]]
+
+    df[col_daten] = pd.to_datetime(df.loc[:, col_dt].dt.date)
+    df = pd.merge_asof(df.sort_values(col_dt), calendar, left_on=col_daten, right_on=col_date, direction='forward')
+
+    loc = (df.loc[:, col_dt].dt.time <= dt.time(16))
+    df.loc[loc, col_tdate] = df.loc[loc, col_date]
+    df.loc[~loc, col_tdate] = df.loc[~loc, col_next]
+
+    return df.drop(columns=[col_daten, col_date, col_next], errors="ignore")
+
+
+
+def use_synthetic_calendar(start="2015-01-01", end="2025-12-31"):
+    calendar = pd.bdate_range(start, end).to_numpy(dtype="datetime64[D]")
+    TradingCalendar.load = staticmethod(lambda exchange='SHFE': calendar)
+    TradingCalendar.refresh()
+
+
+def make_frame(n_rows, start="2020-01-01", end="2024-12-31", seed=0):
+    rng = np.random.default_rng(seed)
+    lo, hi = pd.Timestamp(start).value, pd.Timestamp(end).value
+    ns = np.sort(rng.integers(lo, hi, n_rows))
+
+    return pd.DataFrame({"datetime": ns.view("datetime64[ns]"), "close_price": rng.random(n_rows)})
+
+
+def run(n_rows=50_000_000, repeat=1):
+    use_synthetic_calendar()
+    df = make_frame(n_rows)
+
+    for name, func in (("legacy", wrap_tdays_legacy), ("vectorized", TDays.wrap_tdays)):
+        cost = []
+        for _ in range(repeat):
+            data = df.copy()
+            start = time.perf_counter()
+            func(data, "datetime", "trade_date")
+            cost.append(time.perf_counter() - start)
+
+        print(f"{name:<12}rows={n_rows:>10}  best={min(cost):.3f}s")
+
+
+if __name__ == '__main__':
+    run()
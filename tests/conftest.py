@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+"""
+    测试共用的合成数据, 不依赖数据库. fixture 返回生成函数, 由测试按需传入规模与随机种子
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def make_bars():
+    def make(n_bars=3000, n_symbols=6, seed=0):
+        """
+            合成 (datetime, symbol) 索引的 15 分钟 bar: 各品种上市时间不同, 一半品种没有夜盘
+        """
+        rng = np.random.default_rng(seed)
+        index = pd.date_range("2020-01-01 09:00", periods=n_bars, freq="15min", name="datetime")
+
+        bars = []
+        for i in range(n_symbols):
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n_bars)))
+            spread = close * rng.uniform(0, 0.004, n_bars)
+            bar = pd.DataFrame({
+                'symbol': f"S{i}",
+                'open_price': close + rng.normal(0, 0.1, n_bars),
+                'high_price': close + spread,
+                'low_price': close - spread,
+                'close_price': close,
+                'volume': rng.integers(0, 1000, n_bars).astype(float),
+                'open_interest': 1e5 + np.cumsum(rng.normal(0, 100, n_bars)),
+            }, index=index)
+
+            bar = bar.iloc[int(rng.integers(0, n_bars // 4)):]
+            if i % 2:
+                bar = bar[(bar.index.hour >= 9) & (bar.index.hour < 15)]
+
+            bars.append(bar)
+
+        return pd.concat(bars).sort_index(kind='stable').set_index('symbol', append=True)
+
+    return make
+
+
+@pytest.fixture
+def make_ticks():
+    def make(symbols=("RB2305", "HC2305"), days=("2023-01-03", "2023-01-04", "2023-01-05"), seed=0):
+        """合成 09:00 ~ 11:30 每 500ms 一笔的 tick, 含买一卖一价与成交量"""
+        rng = np.random.default_rng(seed)
+
+        ticks = []
+        for symbol in symbols:
+            for day in days:
+                times = pd.date_range(f"{day} 09:00", f"{day} 11:30", freq="500ms")
+                close = 4000 + rng.normal(0, 1, len(times)).cumsum().round()
+                ticks.append(pd.DataFrame({
+                    "datetime": times,
+                    "symbol": symbol,
+                    "last_price": close,
+                    "bid_price_1": close - 1,
+                    "ask_price_1": close + 1,
+                    "last_volume": rng.integers(0, 100, len(times)),
+                }))
+
+        return pd.concat(ticks, ignore_index=True)
+
+    return make
+
+
+@pytest.fixture
+def make_series():
+    def make(n_bars=2000, nan_rate=0.05, seed=0):
+        """合成成交量: 取整后有大量相等值, 含 nan"""
+        rng = np.random.default_rng(seed)
+        values = np.round(rng.lognormal(3, 1, n_bars))
+        values[rng.random(n_bars) < nan_rate] = np.nan
+
+        return pd.Series(values, index=pd.date_range("2020-01-01", periods=n_bars, freq="1min", name="datetime"))
+
+    return make
+
+
+@pytest.fixture
+def make_feature():
+    def make(n_bars=1500, n_symbols=8, nan_rate=0.05, seed=0):
+        """合成 15 分钟因子(时间, 品种), 每列上市时间不同(头部 nan), 中间随机 nan 间断"""
+        rng = np.random.default_rng(seed)
+        index = pd.date_range("2020-01-01", periods=n_bars, freq="15min", name="datetime")
+
+        values = rng.normal(0, 1, (n_bars, n_symbols))
+        values = 0.9 * values + 0.1 * np.cumsum(values, axis=0) / np.sqrt(np.arange(1, n_bars + 1))[:, None]
+        values[rng.random((n_bars, n_symbols)) < nan_rate] = np.nan
+        for j, first in enumerate(rng.integers(0, n_bars // 2, n_symbols)):
+            values[:first, j] = np.nan
+
+        return pd.DataFrame(values, index=index, columns=[f"S{i}" for i in range(n_symbols)])
+
+    return make
+
+
+@pytest.fixture
+def make_daily():
+    def make(n_days=300, n_strategies=20, seed=0):
+        """合成(日期, 策略)日收益, 约 5% 为 0"""
+        rng = np.random.default_rng(seed)
+        daily = rng.normal(2e-4, 0.01, (n_days, n_strategies))
+        daily[rng.random(daily.shape) < 0.05] = 0
+
+        index = pd.date_range("2018-01-01", periods=n_days, freq="B", name="date")
+        return pd.DataFrame(daily, index=index, columns=[f"P{i}" for i in range(n_strategies)])
+
+    return make
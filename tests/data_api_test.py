@@ -1,4 +1,7 @@
 # -*- coding:utf-8 -*-
+import datetime
+
+import pandas as pd
 import pytest
 
 from Pandora.data_manager.data_api import FutureDataAPI
@@ -94,5 +97,57 @@ def test_future_quote_index(ids, start_dt, end_dt, res):
     assert data.shape[0] == res
 
 
+FUTURE_SESSIONS = [
+    (datetime.time(21), datetime.time(2, 30)),
+    (datetime.time(9), datetime.time(10, 15)),
+    (datetime.time(10, 30), datetime.time(11, 30)),
+    (datetime.time(13, 30), datetime.time(15)),
+]
+STOCK_SESSIONS = [(datetime.time(9, 30), datetime.time(11, 30)), (datetime.time(13), datetime.time(15))]
+
+
+@pytest.mark.parametrize("sessions,filter_out_auction,keep,moved", [
+    # 集合竞价窗口为 (开盘 - 5min, 开盘], 移到开盘后 1 微秒; 时段 [开盘, 收盘 + 1min], 夜盘跨零点
+    (FUTURE_SESSIONS, False, [1, 2, 3, 4, 6, 7, 9, 12],
+     {1: '2023-01-03 21:00:00.000001', 2: '2023-01-03 21:00:00.000001', 6: '2023-01-04 09:00:00.000001',
+      9: '2023-01-04 10:30:00.000001'}),
+    (FUTURE_SESSIONS, True, [2, 3, 4, 7, 12], {}),
+    (STOCK_SESSIONS, False, [7, 8, 9, 11, 12], {11: '2023-01-04 13:00:00.000001'}),
+    (STOCK_SESSIONS, True, [7, 8, 9, 12], {}),
+])
+def test_clean_tick(sessions, filter_out_auction, keep, moved):
+    times = pd.to_datetime([
+        '2023-01-03 20:54', '2023-01-03 20:58', '2023-01-03 21:00', '2023-01-04 01:00', '2023-01-04 02:31',
+        '2023-01-04 02:32', '2023-01-04 08:59', '2023-01-04 10:16', '2023-01-04 10:20', '2023-01-04 10:27',
+        '2023-01-04 12:00', '2023-01-04 12:58', '2023-01-04 15:01', '2023-01-04 15:02',
+    ])
+    data = pd.DataFrame({'datetime': times, 'symbol': 'AG2306', 'last_price': range(len(times))})
+
+    expected = data.assign(date=times.normalize()).loc[keep]
+    for i, dt in moved.items():
+        expected.loc[i, 'datetime'] = pd.Timestamp(dt)
+
+    pd.testing.assert_frame_equal(FutureDataAPI.clean_tick(data, sessions, filter_out_auction), expected)
+
+
+@pytest.mark.parametrize("codes,start_dt,end_dt", [("AG2306,RB2305", "20230103", "20230106")])
+def test_server_bars(codes, start_dt, end_dt):
+    """DolphinDB由 1 分钟bar降采样的 15 分钟bar与库中的一致, 区间含夜盘(AG 夜盘跨零点)"""
+    from Pandora.constant import Interval, Product
+
+    stored = FutureDataAPI().get_quote(codes, Product.FUTURES, start_dt, end_dt, freq=Interval.MINUTE_15)
+    server = FutureDataAPI(server_bars=True).get_quote(codes, Product.FUTURES, start_dt, end_dt,
+                                                       freq=Interval.MINUTE_15)
+
+    assert (stored['datetime'].dt.hour >= 21).any()
+
+    key = ['symbol', 'datetime']
+    pd.testing.assert_frame_equal(
+        server.sort_values(key, ignore_index=True),
+        stored.sort_values(key, ignore_index=True),
+        check_dtype=False
+    )
+
+
 if __name__ == '__main__':
     pytest.main()
@@ -0,0 +1,196 @@
+# -*- coding:utf-8 -*-
+import datetime
+
+import dolphindb as ddb
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from Pandora.helper.database import DolphinDbManager
+
+
+def test_plan_chunks():
+    days = [datetime.date(2020, 1, i) for i in (1, 1, 2, 2, 3, 3)]
+    counts = pd.DataFrame({'symbol': ['a', 'b'] * 3, 'date': days, 'rows': [10, 10, 30, 40, 5, 5]})
+
+    chunks = DolphinDbManager.plan_chunks(counts, 50)
+
+    # 单日超出上限按symbol拆分, 其余按日合并
+    assert [c[0] for c in chunks] == [['a', 'b'], ['a'], ['b'], ['a', 'b']]
+    assert sum(c[3] for c in chunks) == counts['rows'].sum()
+
+    chunks = DolphinDbManager.plan_chunks(counts, 1000)
+    assert chunks == [(['a', 'b'], days[0], days[-1], 100)]
+
+
+@pytest.mark.parametrize("int_day", ["2020.01.01", "2020.01.02"])
+@pytest.mark.parametrize("int_first", [True, False])
+def test_query_parallel_mixed_dtypes(monkeypatch, int_day, int_first):
+    """一个分段为整数, 另一个分段含空值为float, 结果按公共类型合并, 与完成的先后无关"""
+    import threading
+    from concurrent.futures import Future
+
+    class Pool:
+        def runTaskAsync(self, sql):
+            future = Future()
+            if int_day in sql:
+                df, delay = pd.DataFrame({'symbol': ['a', 'a'], 'volume': np.array([1, 2], dtype='int64')}), not int_first
+            else:
+                df, delay = pd.DataFrame({'symbol': ['a', 'a'], 'volume': [np.nan, 3.5]}), int_first
+
+            # 后完成的分段延迟返回, 控制 as_completed 的顺序
+            if delay:
+                threading.Timer(0.05, future.set_result, [df]).start()
+            else:
+                future.set_result(df)
+
+            return future
+
+    days = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)]
+    manager = object.__new__(DolphinDbManager)
+    manager.db_path = "dfs://db"
+    manager.session = ddb.session()
+    monkeypatch.setattr(manager, "get_pool", lambda: Pool(), raising=False)
+    monkeypatch.setattr(manager, "count_daily_rows", lambda *args: pd.DataFrame({'symbol': 'a', 'date': days, 'rows': 2}),
+                        raising=False)
+
+    ret = manager.query_parallel("tick", ["symbol", "volume"], ["a"], chunk_rows=2)
+
+    expected = [1, 2, np.nan, 3.5] if int_day == "2020.01.01" else [np.nan, 3.5, 1, 2]
+    pd.testing.assert_frame_equal(ret, pd.DataFrame({'symbol': ['a'] * 4, 'volume': expected}))
+
+
+def test_engine_registry(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+
+    from Pandora.helper import database
+    from Pandora.helper.database import DbManager
+
+    created = []
+
+    def step_db(conn, database=""):
+        created.append((conn, database))
+        return create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=1)
+
+    monkeypatch.setattr(database, "Settings", {"db_test": {}})
+    monkeypatch.setattr(DbManager, "step_db", staticmethod(step_db))
+
+    try:
+        dbm1, dbm2 = DbManager("db_test"), DbManager("db_test")
+        assert dbm1.db_engine is dbm2.db_engine
+        assert len(created) == 1
+
+        assert dbm1.query("SELECT 1 AS a").iat[0, 0] == 1
+        with dbm1.connect(), dbm2.connect():
+            pass
+
+        stats = DbManager.get_pool_stats().set_index("conn").loc["db_test"]
+        assert stats["checkouts"] == 3
+        assert stats["peak_checkedout"] == 2
+        assert stats["peak_overflow"] == 1
+
+    finally:
+        DbManager.dispose("db_test")
+
+
+def test_bulk_insert(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    from Pandora.helper import database
+    from Pandora.helper.database import DbManager
+
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    monkeypatch.setattr(database, "Settings", {"db_test": {}})
+    monkeypatch.setattr(DbManager, "step_db", staticmethod(lambda conn, database="": engine))
+    monkeypatch.setattr(DbManager, "bulk_threshold", 100)
+
+    try:
+        dbm = DbManager("db_test")
+        dbm.execute("CREATE TABLE trades (id INTEGER, symbol TEXT, pnl REAL)")
+
+        data = pd.DataFrame({"id": range(2500), "symbol": "RB", "pnl": 1.5})
+        data.loc[3, "pnl"] = float("nan")
+        dbm.insert("trades", data)
+
+        result = dbm.query("SELECT COUNT(*) AS n, COUNT(pnl) AS m FROM trades")
+        assert result.iat[0, 0] == 2500
+        assert result.iat[0, 1] == 2499
+
+    finally:
+        DbManager.dispose("db_test")
+
+
+def test_bulk_insert_table_name():
+    from sqlalchemy import insert
+    from sqlalchemy.dialects import mssql
+
+    from Pandora.helper.database import DbManager
+
+    for table in ("[dbo].[AccountPositionInfo]", "dbo.AccountPositionInfo"):
+        sql = str(insert(DbManager.to_table(table, ["id", "pnl"])).compile(dialect=mssql.dialect()))
+        assert sql.startswith("INSERT INTO dbo.[AccountPositionInfo] (id, pnl) VALUES")
+
+    sql = str(insert(DbManager.to_table("#stage_1", ["id"])).compile(dialect=mssql.dialect()))
+    assert sql.startswith("INSERT INTO [#stage_1] (id) VALUES")
+
+
+def test_join_bulk_upsert_sql():
+    from Pandora.helper.database import DbManager
+
+    sql = DbManager.join_upsert_sql_with_tsdb("public.trades", ["id"], ["id", "pnl"], None, source="stage")
+    assert sql.startswith("INSERT INTO public.trades (id, pnl) SELECT id, pnl FROM stage  ON CONFLICT (id)")
+
+    sql = DbManager.join_upsert_sql_with_mssql("dbo.Trades", ["id"], ["id", "pnl"], None, None, source="#stage")
+    assert sql.startswith("MERGE INTO dbo.Trades T USING #stage S ON T.id = S.id")
+
+    # 临时表的列为 CAST 表达式, 不继承 IDENTITY
+    sql = DbManager.join_stage_sql_with_mssql("dbo.Trades", "#stage", {"id": "INTEGER", "pnl": "DECIMAL(18, 4)"})
+    assert sql == "SELECT TOP 0 CAST(id AS INTEGER) AS id, CAST(pnl AS DECIMAL(18, 4)) AS pnl INTO #stage FROM dbo.Trades"
+
+
+def test_get_column_types():
+    from sqlalchemy import create_engine
+
+    from Pandora.helper.database import DbManager
+
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, Symbol VARCHAR(16), pnl NUMERIC(18, 4))"))
+
+        assert DbManager.get_column_types(conn, "[trades]", ["id", "symbol", "pnl"]) == {
+            "id": "INTEGER", "symbol": "VARCHAR(16)", "pnl": "NUMERIC(18, 4)"}
+
+        with pytest.raises(ValueError):
+            DbManager.get_column_types(conn, "trades", ["volume"])
+
+
+def test_dolphin_query():
+    import datetime
+
+    from Pandora.constant import Interval
+    from Pandora.helper.database import DolphinQuery
+
+    sql = (DolphinQuery('loadTable("dfs://db", "bar_futures")')
+           .select("first(open_price) as open_price", "symbol,datetime")
+           .where_eq("interval", Interval.MINUTE_1)
+           .where_in("symbol", ["RB2305", "HC2305"])
+           .where_between("datetime", datetime.datetime(2023, 1, 3), datetime.datetime(2023, 1, 4, 15))
+           .group_by("symbol")
+           .bar("datetime", "15m")
+           .to_sql())
+
+    # 分区列条件在前
+    assert sql == ('select first(open_price) as open_price, symbol, datetime from loadTable("dfs://db", "bar_futures") '
+                   'where symbol in ["RB2305","HC2305"], '
+                   'datetime between 2023.01.03T00:00:00.000000:2023.01.04T15:00:00.000000, interval="1m" '
+                   'group by symbol, bar(datetime, 15m) as datetime')
+
+    assert DolphinQuery("t").where_in("symbol", {"RB"}).to_sql() == 'select * from t where symbol="RB"'
+
+    # 1 分钟bar以结束时间标记, 降采样后同样以结束时间标记
+    sql = DolphinQuery("t").select("sum(volume) as volume").bar("datetime", "15m", label_shift="1m").to_sql()
+    assert sql == 'select sum(volume) as volume from t group by bar(datetime - 1m, 15m) + 15m as datetime'
+    assert DolphinQuery.literal('a"b') == '"a\\"b"'
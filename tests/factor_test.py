@@ -0,0 +1,233 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+import talib
+
+from Pandora.constant import Frequency
+from Pandora.research.factor import utils
+from Pandora.research.factor.price_volume.acf import ACF
+from Pandora.research.factor.price_volume.coef_var import CoefVar
+from Pandora.research.factor.price_volume.cpt import CPT
+from Pandora.research.factor.price_volume.er import ER
+from Pandora.research.factor.price_volume.mks import MKS
+from Pandora.research.factor.price_volume.ptc import PTC
+from Pandora.research.factor.price_volume.ret import Ret
+from Pandora.research.factor.price_volume.skew import Skew
+from Pandora.research.factor.price_volume.stm import STM
+from Pandora.research.factor.price_volume.stm_cs_stm import STMCsSTM
+from Pandora.research.factor.price_volume.stm_ts_stm import STMTsSTM
+from Pandora.research.factor.price_volume.tscorr import TSCorr
+from Pandora.research.factor.price_volume.williamlowershadow_std import WilliamLowerShadowStd
+from Pandora.research.factor.tick.lsr import LSR
+from Pandora.research.factor.tick.bve import BVE
+from Pandora.research.factor.tick.cpv import CPV
+from Pandora.research.rolling import rolling_mks
+
+
+def test_transform_iter_matches_batch(make_ticks):
+    ticks = make_ticks()
+    batch = ticks.set_index(["datetime", "symbol"])
+    chunks = [g.set_index(["datetime", "symbol"]) for _, g in ticks.groupby(["symbol", ticks["datetime"].dt.date])]
+
+    for factor in (LSR(0.001, 0.9, Frequency.Min_5), BVE(5, 0.001, 0.9, Frequency.Min_5)):
+        expected = factor.transform(batch)
+        result = pd.concat(factor.transform_iter(chunks))
+
+        pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("window", [0.2, 2])
+def test_cpv_transform_iter_sparse(make_ticks, window):
+    """成交稀疏时, 增量计算保留的历史tick按时间戳覆盖 window 根bar"""
+    ticks = make_ticks()
+    ticks = ticks.sample(frac=0.02, random_state=0).sort_values(["symbol", "datetime"], ignore_index=True)
+
+    batch = ticks.set_index(["datetime", "symbol"])
+    chunks = [g.set_index(["datetime", "symbol"]) for _, g in ticks.groupby(["symbol", ticks["datetime"].dt.date])]
+
+    factor = CPV(window, Frequency.Min_1)
+    expected = factor.transform(batch)
+    result = pd.concat(factor.transform_iter(chunks))
+
+    assert expected.notna().any().all()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def _log_ret(close):
+    return np.log(1 + close.pct_change())
+
+
+def _stm(group, window):
+    hh = group['high_price'].rolling(window).max()
+    ll = group['low_price'].rolling(window).min()
+    return (group['close_price'] * 2 - (hh + ll)).ewm(span=5).mean() / (hh - ll).ewm(span=5).mean()
+
+
+def _ptc(group, fast):
+    _, _, bar = talib.MACD(group['close_price'], fastperiod=fast, slowperiod=int(fast * 26 / 12), signalperiod=int(fast * 9 / 12))
+    std = group['close_price'].rolling(fast).std()
+
+    return _stm(group, fast) - (bar / std).mask(std == 0, 0)
+
+
+def _stm_ts_stm(group, window):
+    f = _stm(group, window)
+    hh, ll = f.rolling(window).max(), f.rolling(window).min()
+
+    return (f * 2 - (hh + ll)) / (hh - ll)
+
+
+def _tscorr(group, window):
+    close, volume = group['close_price'], group['volume']
+    relative_close = close / close.rolling(window, min_periods=1).mean()
+    relative_vol = (volume / volume.rolling(window * 4, min_periods=1).mean()).fillna(0)
+
+    return talib.CORREL(relative_close, relative_vol, timeperiod=window) * utils.rolling_rank(volume, window, pct=True)
+
+
+def _lower_shadow_std(group, window):
+    f = group['low_price'].rolling(window).min() - group['close_price']
+    std = f.rolling(window).std()
+
+    return (f / std).mask(std == 0, 0) * -1
+
+
+def _per_symbol(X, formula):
+    """逐品种计算后按 X 的行序拼接, inf 置 0"""
+    f = pd.concat([formula(group) for _, group in X.groupby('symbol')]).reindex(X.index)
+    return f.replace([np.inf, -np.inf], 0).values
+
+
+# 各因子的逐品种 pandas 公式
+PANEL_CASES = {
+    'ACF': (ACF(50, lag=2), lambda g: _log_ret(g['close_price']).rolling(50).corr(_log_ret(g['close_price']).shift(2))),
+    'CoefVar': (CoefVar(50), lambda g: _log_ret(g['close_price']).rolling(50).mean() / _log_ret(g['close_price']).rolling(50).std()),
+    'CPT': (CPT(40), lambda g: g['close_price'].rolling(40).corr(g['open_interest']).rolling(40, min_periods=1).mean()),
+    'ER': (ER(30), lambda g: np.log(1 + g['close_price'].pct_change(30)) / _log_ret(g['close_price']).abs().rolling(30).sum()),
+    'MKS': (MKS(60), lambda g: rolling_mks(g['close_price'], 60)),
+    'PTC': (PTC(24), lambda g: _ptc(g, 24)),
+    'Ret': (Ret(30), lambda g: _log_ret(g['close_price']).rolling(30).sum()),
+    'Skew': (Skew(50), lambda g: _log_ret(g['close_price']).rolling(50).skew()),
+    'STM': (STM(40), lambda g: _stm(g, 40)),
+    'STMTsSTM': (STMTsSTM(40), lambda g: _stm_ts_stm(g, 40)),
+    'TSCorr': (TSCorr(30), lambda g: _tscorr(g, 30)),
+    'WilliamLowerShadowStd': (WilliamLowerShadowStd(30), lambda g: _lower_shadow_std(g, 30)),
+}
+
+
+@pytest.mark.parametrize("name", list(PANEL_CASES))
+def test_panel_factors_match_reference(name, make_bars):
+    factor, formula = PANEL_CASES[name]
+    X = make_bars(1500, 5)
+
+    np.testing.assert_array_equal(factor.transform(X), _per_symbol(X, formula))
+
+
+def test_stm_cs_stm_matches_reference(make_bars):
+    X = make_bars(1500, 5)
+
+    # 各品种的 STM 按时间对齐后, 以截面(向前填充)的最高/最低值归一化到 [0, 1]
+    stm = pd.Series(_per_symbol(X, lambda g: _stm(g, 40)), index=X.index).unstack('symbol')
+    hh, ll = stm.ffill().max(axis=1), stm.ffill().min(axis=1)
+    f = ((stm * 2).sub(hh + ll, axis=0).div(hh - ll, axis=0) + 1) / 2
+
+    np.testing.assert_array_equal(STMCsSTM(40).transform(X), f.stack(future_stack=True).reindex(X.index).values)
+
+
+def test_panel_requires_sorted_symbol_rows(make_bars):
+    from Pandora.research.factor.panel import Panel
+
+    X = make_bars(100, 2)
+    panel = Panel(X)
+    assert panel.shape == (panel.lengths.max(), 2)
+    np.testing.assert_array_equal(panel.scatter(panel['close_price']), X['close_price'].values)
+    pd.testing.assert_frame_equal(panel.from_wide(panel.to_wide(panel['volume'])), panel['volume'])
+
+    with pytest.raises(ValueError):
+        Panel(X.iloc[::-1])
+
+
+def test_factor_cache_shares_intermediates(make_bars):
+    from sklearn.pipeline import FeatureUnion
+
+    from Pandora.research.factor.panel import FactorCache
+
+    X = make_bars(1000, 4)
+    union = FeatureUnion([
+        ('stm', STM(20)), ('stm_ts', STMTsSTM(20)), ('stm_cs', STMCsSTM(20)), ('ret', Ret(20)), ('skew', Skew(20)),
+    ], verbose_feature_names_out=False)
+    union.set_output(transform="pandas")
+    expected = union.transform(X)
+
+    with FactorCache() as cache:
+        result = union.transform(X)
+    pd.testing.assert_frame_equal(result, expected)
+    assert cache.store.hits > 0
+    assert not cache.store.data
+
+    with FactorCache(max_bytes=100_000) as cache:
+        result = union.transform(X)
+    pd.testing.assert_frame_equal(result, expected)
+    assert cache.store.evictions > 0
+
+
+@pytest.mark.parametrize("name", ["STM", "PTC", "MKS", "Skew", "ACF"])
+def test_partial_transform_matches_batch(name, make_bars):
+    factor = {"STM": STM(50), "PTC": PTC(40), "MKS": MKS(40), "Skew": Skew(50), "ACF": ACF(50, lag=2)}[name]
+    X = make_bars(1500, 4).sort_index()
+
+    expected = np.asarray(factor.transform(X), dtype=np.float64)
+    result = np.concatenate([factor.partial_transform(X.iloc[i:i + 97]) for i in range(0, len(X), 97)])
+    np.testing.assert_allclose(result, expected, rtol=1e-10, atol=1e-12)
+
+    with pytest.raises(ValueError):
+        factor.partial_transform(X.iloc[-1:])
+
+    factor.reset_online()
+    np.testing.assert_allclose(factor.partial_transform(X), expected, rtol=1e-10, atol=1e-12)
+
+
+def test_array_manager_streaming_factor(make_bars):
+    from Pandora.constant import Exchange
+    from Pandora.trader.object import BarData
+    from Pandora.trader.utility import ArrayManager
+
+    X = make_bars(500, 1)
+    expected = STM(20).transform(X)
+
+    am = ArrayManager(100)
+    am.add_factor("stm", STM(20))
+    for (dt, symbol), row in X.iterrows():
+        am.update_bar(BarData(
+            gateway_name="test", symbol=symbol, exchange=Exchange.SHFE, datetime=dt,
+            high_price=row["high_price"], low_price=row["low_price"], close_price=row["close_price"],
+        ))
+
+    np.testing.assert_array_equal(am.factor("stm", array=True), expected[-100:])
+    assert am.factor("stm") == expected[-1]
+
+
+def _multi_vol_reference(close, param):
+    """各间隔 q 的 r2_q = log(close / close.shift(q)) ** 2 在 param 窗口内按步长 q 抽样求均值"""
+    v_1, f = None, 0
+    for q in range(1, param):
+        r2 = np.square(np.log(close / close.shift(q)))
+        idx = range(param - 1, -1, -q)
+        v_q = r2.rolling(param).apply(lambda x: np.mean(x[idx]) * (param / q - 1), raw=True)
+
+        v_1 = v_q if q == 1 else v_1
+        f = f + v_q
+
+    return f / v_1 / param - 1
+
+
+def test_multi_vol_matches_reference(make_bars):
+    from Pandora.research.factor.price_volume.multi_vol import MultiVol
+
+    X = make_bars(600, 3)
+    X.iloc[[300, 301, 900]] = np.nan
+
+    for window in (2, 12):
+        expected = _per_symbol(X, lambda g: _multi_vol_reference(g['close_price'], window))
+        np.testing.assert_allclose(MultiVol(window).transform(X), expected, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,85 @@
+# -*- coding:utf-8 -*-
+import datetime as dt
+
+import pandas as pd
+
+from Pandora.data_manager.quote_cache import QuoteCache
+
+
+def make_bars(symbols, start, end):
+    index = pd.date_range(start, end, freq="1h")
+    index = index[(index.hour >= 9) & (index.hour <= 14)]
+    frames = [pd.DataFrame({"datetime": index, "symbol": s, "close_price": index.asi8 / 3.6e12})
+              for s in symbols]
+    return pd.concat(frames, ignore_index=True)
+
+
+class FakeRemote:
+    def __init__(self):
+        self.calls = []
+
+    def fetch(self, symbols, start, end):
+        self.calls.append((tuple(symbols), start, end))
+        return make_bars(symbols, start, end)
+
+
+def test_diff_ranges():
+    d = pd.Timestamp
+    covered = [(d("2020-01-03"), d("2020-01-05")), (d("2020-01-08"), d("2020-01-09"))]
+    gaps = QuoteCache.diff_ranges((d("2020-01-01"), d("2020-01-10")), covered)
+    assert gaps == [(d("2020-01-01"), d("2020-01-02")), (d("2020-01-06"), d("2020-01-07")),
+                    (d("2020-01-10"), d("2020-01-10"))]
+
+    merged = QuoteCache.merge_ranges(covered + [(d("2020-01-06"), d("2020-01-07"))])
+    assert merged == [(d("2020-01-03"), d("2020-01-09"))]
+
+
+def test_cache_fetches_only_missing(tmp_path):
+    cache = QuoteCache(tmp_path)
+    remote = FakeRemote()
+    expected = make_bars(["a00", "b00"], "2020-01-01", "2020-03-10 23:00")
+
+    first = cache.load("bar_futures", "1h", "a00,b00", dt.datetime(2020, 1, 1), dt.datetime(2020, 2, 1), remote.fetch)
+    assert len(remote.calls) == 1
+    assert cache.stats.misses == 2 * 32 and cache.stats.hits == 0
+
+    second = cache.load("bar_futures", "1h", ["a00", "b00"], dt.datetime(2020, 1, 1), dt.datetime(2020, 2, 1),
+                        remote.fetch)
+    assert len(remote.calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+    # 只补齐缺失的 2 月 2 日之后的数据, 且跨月分区能正确合并
+    third = cache.load("bar_futures", "1h", ["a00", "b00"], dt.datetime(2020, 1, 15), dt.datetime(2020, 3, 10, 23),
+                       remote.fetch)
+    assert len(remote.calls) == 2
+    assert remote.calls[-1][1] == dt.datetime(2020, 2, 2)
+
+    loc = expected["datetime"] >= dt.datetime(2020, 1, 15)
+    expected = expected[loc].sort_values(["symbol", "datetime"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(third[expected.columns], expected, check_dtype=False)
+    assert 0 < cache.stats.hit_rate < 1
+
+
+def _fill_days(root, days):
+    cache = QuoteCache(root)
+    remote = FakeRemote()
+    for day in days:
+        cache.load("bar_futures", "1h", "a00", day, day + dt.timedelta(hours=23), remote.fetch)
+
+
+def test_concurrent_writes_keep_all_days(tmp_path):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # 其他测试已启动 numba 线程池, fork 出的子进程可能死锁, 使用 spawn
+    days = [dt.datetime(2020, 1, 1) + dt.timedelta(days=i) for i in range(20)]
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(_fill_days, [tmp_path] * 2, [days[::2], days[1::2]]))
+
+    cache = QuoteCache(tmp_path)
+    remote = FakeRemote()
+    result = cache.load("bar_futures", "1h", "a00", days[0], days[-1] + dt.timedelta(hours=23), remote.fetch)
+
+    assert not remote.calls
+    expected = make_bars(["a00"], days[0], days[-1] + dt.timedelta(hours=23))
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
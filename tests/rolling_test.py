@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+import bottleneck as bn
+import numpy as np
+import pandas as pd
+import pytest
+
+from Pandora.research.rolling import rolling_rank
+
+
+def _count_rank(series, window, min_periods=None, pct=True, n_group=None):
+    """去掉 nan 后窗口内 <= 当前值的个数, 前 min_periods(默认 window) 个为 nan"""
+    count = series.dropna().rolling(window, min_periods=1).apply(lambda x: (x <= x[-1]).sum(), raw=True)
+    count.iloc[:min_periods or window] = np.nan
+
+    if pct:
+        return count / window
+
+    if n_group:
+        return np.ceil(count / window * n_group)
+
+    return count
+
+
+@pytest.mark.parametrize("window, min_periods", [(1, 1), (20, 5), (300, 100)])
+def test_rolling_rank(window, min_periods, make_series):
+    from Pandora.research.factor import utils
+
+    series = make_series(2000, nan_rate=0.05)
+    np.testing.assert_array_equal(
+        rolling_rank(series.values, window, min_periods, norm='signed'),
+        bn.move_rank(series.values, window, min_count=min_periods),
+    )
+
+    for kwargs in ({}, dict(min_periods=min_periods), dict(pct=False, n_group=5), dict(pct=False)):
+        pd.testing.assert_series_equal(
+            utils.rolling_rank(series, window, **kwargs), _count_rank(series, window, **kwargs),
+            check_dtype=False,
+        )
+
+    # 与 pandas 的排名一致
+    frame = pd.DataFrame({'a': series.values[:300], 'b': series.values[300:600]})
+    for ties in ('min', 'max', 'average'):
+        expected = frame.rolling(window, min_periods=min_periods).apply(
+            lambda x: pd.Series(x).rank(method=ties, pct=True).iat[-1], raw=True
+        )
+        pd.testing.assert_frame_equal(rolling_rank(frame, window, min_periods, ties=ties), expected)
+
+
+@pytest.mark.parametrize("window, min_periods", [(1, 1), (20, 1), (300, 100)])
+def test_rolling_quantile(window, min_periods, make_series):
+    from Pandora.research.rolling import rolling_quantile
+
+    series = make_series(2000, nan_rate=0.05)
+    series.iloc[[10, 500]] = np.inf
+
+    frame = pd.DataFrame({'a': series.values[:1000], 'b': series.values[1000:]})
+    quantiles = [0, 0.1, 0.5, 0.75, 1]
+    for data in (series, frame):
+        result = rolling_quantile(data, window, quantiles, min_periods)
+        for q, r in zip(quantiles, result):
+            expected = data.rolling(window, min_periods=min_periods).quantile(q)
+            (pd.testing.assert_series_equal if data.ndim == 1 else pd.testing.assert_frame_equal)(r, expected)
+
+    np.testing.assert_array_equal(
+        rolling_quantile(series.values, window, 0.9, min_periods),
+        series.rolling(window, min_periods=min_periods).quantile(0.9).values,
+    )
+
+
+def _mks_reference(close, n, imax=0):
+    """间隔 i = 1 ~ n - 1(至多 imax)的涨跌符号在 n - i 根 bar 上的滚动和, 除以总配对数"""
+    f = pd.Series(0, index=close.index)
+    denom = 0
+    for i in range(1, min(n, imax + 1) if imax else n):
+        f += np.sign(close.pct_change(i)).fillna(0).rolling(n - i).sum()
+        denom += n - i
+
+    return f / denom
+
+
+@pytest.mark.filterwarnings("ignore:The default fill_method:FutureWarning")
+@pytest.mark.parametrize("window, imax", [(1, 0), (2, 0), (50, 0), (50, 5), (50, 80)])
+def test_rolling_mks(window, imax):
+    from Pandora.research.rolling import rolling_mks
+
+    rng = np.random.default_rng(0)
+    close = pd.Series(4000 + rng.normal(0, 1, 1000).cumsum().round())
+    close.iloc[[0, 1, 300, 301]] = np.nan
+
+    pd.testing.assert_series_equal(rolling_mks(close, window, imax), _mks_reference(close, window, imax))
+
+    frame = pd.DataFrame({'a': close.values[:500], 'b': close.values[500:]})
+    np.testing.assert_array_equal(
+        rolling_mks(frame, window, imax), np.column_stack([_mks_reference(frame[c], window, imax) for c in frame])
+    )
@@ -0,0 +1,43 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from Pandora.research.shared import SharedFrameStore
+
+
+def _column_sum(store, name, column):
+    return float(np.nansum(store.attach(name)[column].to_numpy()))
+
+
+def test_shared_frame_store(tmp_path):
+    index = pd.date_range("2023-01-03 09:00", periods=200, freq="15min", name="datetime")
+    rng = np.random.default_rng(0)
+
+    ret = pd.DataFrame(rng.normal(0, 0.01, (200, 3)), index=index, columns=["rb00", "hc00", "i00"])
+    ret.iloc[:5, 0] = np.nan
+    quote = pd.DataFrame({
+        "symbol": ["rb00", None] * 100,
+        "exchange": pd.Categorical(["SHFE", "DCE"] * 100, categories=["SHFE", "DCE", "CZCE"]),
+        "close_price": rng.normal(4000, 10, 200),
+        "volume": rng.integers(0, 100, 200),
+    }, index=index)
+    quote["symbol"] = quote["symbol"].fillna(np.nan)
+
+    store = SharedFrameStore(tmp_path / "shared")
+    store.publish("ret", ret)
+    store.publish("quote", quote)
+    assert store.names == ["quote", "ret"]
+
+    attached = store.attach("ret")
+    pd.testing.assert_frame_equal(attached, ret, check_freq=False)
+    assert not attached.values.flags.writeable  # 映射而不是复制
+
+    pd.testing.assert_frame_equal(store.attach("quote").copy(), quote, check_freq=False)
+
+    # worker 只接收路径, 各自映射同一份数据
+    sums = Parallel(n_jobs=2)(delayed(_column_sum)(store, "ret", col) for col in ret.columns)
+    np.testing.assert_allclose(sums, ret.sum().values)
+
+    store.close()
+    assert not (tmp_path / "shared").exists()
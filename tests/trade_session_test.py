@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+import datetime
+
+import pandas as pd
+import pytest
+
+from Pandora.data_manager.trade_session import TradeSessionCache
+
+
+def fake_tradetime(products, begin_date, end_date):
+    """国债 2020-07-20 起开盘时间由 9:15 调整为 9:30"""
+    rows = []
+    for day in pd.bdate_range(begin_date, end_date):
+        for product in products:
+            open_time = datetime.time(9, 15) if day < pd.Timestamp("2020-07-20") else datetime.time(9, 30)
+            rows.append((day, product, "集合竞价", datetime.time(9, 10), open_time))
+            rows.append((day, product, "连续竞价", open_time, datetime.time(11, 30)))
+            rows.append((day, product, "连续竞价", datetime.time(13), datetime.time(15, 15)))
+
+    return pd.DataFrame(rows, columns=["TradeDate", "Contract", "Type", "StartTime", "EndTime"])
+
+
+def test_trade_session_cache(tmp_path):
+    calls = []
+
+    def fetch(products, begin_date, end_date):
+        calls.append((products, begin_date, end_date))
+        return fake_tradetime(products, begin_date, end_date)
+
+    cache = TradeSessionCache(tmp_path)
+    assert cache.prefetch(["T", "TF"], datetime.date(2020, 7, 1), datetime.date(2020, 7, 31), fetch) == 1
+    assert cache.prefetch(["T"], datetime.date(2020, 7, 10), datetime.date(2020, 7, 20), fetch) == 0
+    assert len(calls) == 1
+
+    versions = cache.get_versions("T")
+    assert [(v.start, v.end) for v in versions] == [
+        (pd.Timestamp("2020-07-01"), pd.Timestamp("2020-07-17")),
+        (pd.Timestamp("2020-07-20"), pd.Timestamp("2020-07-31")),
+    ]
+    assert cache.get_sessions("T", "2020-07-17")[0][0] == (datetime.time(9, 15), datetime.time(11, 30))
+    assert cache.get_sessions("T")[0][0] == (datetime.time(9, 30), datetime.time(11, 30))
+
+    # 版本边界为上一版本最后交易日的16点
+    ticks = pd.Series(pd.to_datetime(["2020-07-17 15:00:00", "2020-07-17 16:00:01", "2020-07-20 09:30:00"]))
+    parts = cache.split("T", ticks)
+    assert [list(pos) for pos, _ in parts] == [[0], [1, 2]]
+
+    # 本地缓存在新进程中可以直接读取
+    TradeSessionCache._memory.clear()
+    reloaded = TradeSessionCache(tmp_path)
+    assert reloaded.get_versions("T") == versions
+    assert reloaded.prefetch(["T"], datetime.date(2020, 7, 1), datetime.date(2020, 7, 31), fetch) == 0
+
+
+def test_prefetch_merges_other_process(tmp_path):
+    """另一进程在本进程读取之后写入的品种不会被覆盖"""
+    cache = TradeSessionCache(tmp_path)
+
+    # 清空进程内缓存, 模拟另一个进程
+    TradeSessionCache._memory.clear()
+    other = TradeSessionCache(tmp_path)
+    assert other.prefetch(["TF"], datetime.date(2020, 7, 1), datetime.date(2020, 7, 31), fake_tradetime) == 1
+
+    assert cache.prefetch(["T"], datetime.date(2020, 7, 1), datetime.date(2020, 7, 31), fake_tradetime) == 1
+    assert set(cache.versions) == {"T", "TF"}
+
+    TradeSessionCache._memory.clear()
+    reloaded = TradeSessionCache(tmp_path)
+    assert set(reloaded.versions) == set(reloaded.coverage) == {"T", "TF"}
+    assert reloaded.get_versions("TF") == other.get_versions("TF")
+
+
+def test_clean_tick_before_first_version(tmp_path):
+    """FutureInfo_TradeTime 最早记录之前的国债、股指tick使用调整前后的固定时段"""
+    from Pandora.data_manager.data_api import FutureDataAPI
+
+    def fetch(products, begin_date, end_date):
+        # 只有国债有记录, 且从 2020-07-20 开始
+        data = fake_tradetime(products, max(pd.Timestamp(begin_date), pd.Timestamp("2020-07-20")), end_date)
+        return data[data['Contract'] == "T"]
+
+    api = object.__new__(FutureDataAPI)
+    api.sessions = TradeSessionCache(tmp_path)
+    api.get_future_tradetime = fetch
+
+    def clean(symbol, times):
+        group = pd.DataFrame({'datetime': pd.to_datetime(times), 'symbol': symbol})
+        parts = api.clean_symbol_tick(symbol, group, group['datetime'].min(), group['datetime'].max(), False)
+        return pd.concat(parts)['datetime'].sort_values().astype(str).tolist()
+
+    # 2020-07-20 之前开盘时间为 9:15, 之后 9:20 落在收盘后与集合竞价之间
+    assert clean("T2009", ['2020-07-17 09:20', '2020-07-17 15:10', '2020-07-20 09:20', '2020-07-20 09:31']) == [
+        '2020-07-17 09:20:00', '2020-07-17 15:10:00', '2020-07-20 09:31:00']
+
+    # 2016 年起股指收盘时间由 15:15 调整为 15:00
+    assert clean("IF1601", ['2015-12-31 15:10', '2016-01-04 14:00', '2016-01-04 15:10']) == [
+        '2015-12-31 15:10:00', '2016-01-04 14:00:00']
+
+    with pytest.raises(ValueError):
+        clean("RB2010", ['2020-07-17 09:20'])
@@ -11,3 +11,55 @@ def test_date_convert():
     tday = datetime.date.today()
     tday = tday.replace(2021, 11, 22)
     assert "2021-11-22" == Dates.convert(tday)
+
+
+def test_tdays_calendar(monkeypatch):
+    import numpy as np
+    import pandas as pd
+
+    from Pandora.helper.date import TDays, TradingCalendar
+
+    calendar = pd.bdate_range("2021-11-01", "2021-12-31").to_numpy(dtype="datetime64[D]")
+    monkeypatch.setattr(TradingCalendar, "load", staticmethod(lambda exchange='SHFE': calendar))
+    TradingCalendar.refresh()
+
+    assert TDays.is_tday("2021-11-22")
+    assert not TDays.is_tday("2021-11-20")
+    assert TDays.add("2021-11-19", 1) == "2021-11-22"
+    assert TDays.add("2021-11-20", 0) == "2021-11-22"
+    assert TDays.add("2021-11-22", -1) == "2021-11-19"
+    assert TDays.add("2021-11-20", -1) == "2021-11-19"
+    assert TDays.period("2021-11-19", "2021-11-23") == ["2021-11-19", "2021-11-22", "2021-11-23"]
+    assert TDays.get_tday("2021-11-19 21:30:00") == "2021-11-22"
+    assert TDays.get_tday("2021-11-19 14:30:00") == "2021-11-19"
+
+    days = pd.to_datetime(["2021-11-19 14:30:00", "2021-11-19 21:30:00", "2021-11-20 10:00:00"])
+    assert list(TDays.get_tday(days)) == ["2021-11-19", "2021-11-22", "2021-11-22"]
+    assert list(TDays.is_tday(days)) == [True, True, False]
+    assert list(TDays.add(days, [0, 1, -1], fmt=None)) == list(np.array(["2021-11-19", "2021-11-22", "2021-11-19"], dtype="datetime64[D]"))
+
+    TradingCalendar.refresh()
+
+
+def test_wrap_tdays(monkeypatch):
+    import pandas as pd
+
+    from Pandora.helper.date import TDays, TradingCalendar
+
+    calendar = pd.bdate_range("2020-01-01", "2020-01-31").to_numpy(dtype="datetime64[D]")
+    monkeypatch.setattr(TradingCalendar, "load", staticmethod(lambda exchange='SHFE': calendar))
+    TradingCalendar.refresh()
+
+    df = pd.DataFrame({
+        "datetime": pd.to_datetime(["2020-01-06 21:00:00", "2020-01-03 16:00:01", "2020-01-05 23:00:00",
+                                    "2020-01-03 15:59:59", "2020-01-04 10:00:00", "2020-01-03 16:00:00"]),
+        "close_price": [0., 1., 2., 3., 4., 5.],
+    })
+    result = TDays.wrap_tdays(df, "datetime", "trade_date")
+
+    # 16点(含)之前归属当日或之后的第一个交易日, 之后归属其下一交易日(周日夜间为周二)
+    expected = df.sort_values("datetime").reset_index(drop=True)
+    expected["trade_date"] = pd.to_datetime(["2020-01-03", "2020-01-03", "2020-01-06", "2020-01-06", "2020-01-07", "2020-01-07"])
+    pd.testing.assert_frame_equal(result, expected)
+
+    TradingCalendar.refresh()